@@ -13,29 +13,77 @@
 #  Description: Collection of utility functions for the analysis
 #  of calibration-result files.   
 #  
-#  - RunSCurveSmartRangeAnalysis(run): Run analysis of SCurveSmartRange
+#  - RunSCurveSmartRangeAnalysis(run, nParallel): Run analysis of SCurveSmartRange
 #
-#  - RunPixelAliveAnalysis(run): Run analysis of PixelAlive 
+#  - RunPixelAliveAnalysis(run, nParallel): Run analysis of PixelAlive 
+#    -- nParallel: if more than 1, the run is analyzed in FED shards with nParallel
+#       PixelAnalysis.exe at the same time (see shardedAnalysis.py), in a single process
+#       if a .dmp file has no FED number. The iteration stops if a shard fails
+#
+#  - CountDeadPixels(maxDeadPixels, outfile, excludedrocs): count for each ROC the pixels
+#    with efficiency below 100% and write down the ROCs with more than maxDeadPixels
+#    dead pixels. Returns a dictionary ROC name -> list of (x, y) of the dead pixels
+#
+#  - CheckEfficiency(files, filename, iteration, maxDeadPixels, skipFPix, skipBPix, excluded,
+#    nWorkers, index, stream, mapsFile): CountDeadPixels for all the ROCs of the PixelAlive run
+#    -- skipFPix, skipBPix: the ROCs of FPix/BPix (from the detconfig index of the run, see
+#       detConfigIndex.py) are not written as failing, as the ROCs of the excluded file
+#    -- mapsFile: optional file where the dead pixel maps of all the ROCs are saved (see
+#       deadPixelMaps.py), they are then returned
 #
 #  - fitVcalVcThr(savePlots, ignore): loop over the objects within the folder
 #    and pick up the canvanses saved for each ROC, perform a fit to the Vcal(VcThr)
 #    distribution and write down to an output file (ofile) the values of the Parameters
 #    a and b and the chi2/NDF - Fit function => Vcal = a + b*VcThr
-#    --savePlots: save fit plots in plot folder, default is False
+#    --savePlots: keep the points of the fits for the plots, queued for renderFitPlots
+#      (see fitPlots.py), default is False
 #    --ignore   : ignore checks on Chi2/NDOF, default is False
 #
+#  - fitVcalVcThrBatched(files, savePlots, ignore): same as fitVcalVcThr for all the ROCs
+#    of the files at once, with the NumPy closed-form fits of vcThrVcalFits.py
+#
+#  - fitVcalVcThrParallel(files, nWorkers, savePlots, ignore): same as fitVcalVcThr,
+#    browsing the files with nWorkers processes (see browseROCChainParallel)
+#
 # 
-#  - checkROCthr(path, iteration): pick up the threshold histogram ("Threshold1D") for each ROC
+#  - checkROCthr(path, iteration, skip): pick up the threshold histogram ("Threshold1D") for each ROC
 #    and check whether the mean is less than 35, in this case flag the ROC as failing
 #    and add it to the list of failing ROCs in the output file
 #    -- path: position of the output file. No need to specify the name of the file,
 #       if it does not exist it will be created in the run folder, if it does already
 #       it will be just updated (new info appended to the file).
 #    -- iteration: iteration number
+#    -- skip: optional set of ROCs not to check (e.g. the ones settled at the previous
+#       iterations, see convergedRocs), their histos are not read at all. The other
+#       checkROCthr functions take it too
+#
+#  - checkROCthrSummary(files, path, iteration, cuts, index, skip): same as checkROCthr for the whole run
+#    through the columnar threshold summary (thresholdSummary.npz in the run folder, see
+#    thresholdSummary.py). If the summary is already there the ROOT files are not read again,
+#    so the cuts can be changed for free
+#
+#  - checkROCthrParallel(files, nWorkers, path, iteration, skip): same as checkROCthr,
+#    browsing the files with nWorkers processes (see browseROCChainParallel)
 #
-#  - readHistoInfo(name): pick up the histogram corresponding to
+#  - checkROCthrIndexed(index, iteration, skip): same as checkROCthr for the whole run,
+#    jumping straight to the threshold histograms listed in the run index (see rocIndex.py)
+#
+#  - convergedRocs(deltafile, iteration, mod, history): set of the ROCs settled at the
+#    iterations before iteration, which the new dac settings do not change anymore
+#
+#  - createModuleList(path): dac files of the modules with enabled ROCs in the detconfig of
+#    the run, from its index (see detConfigIndex.py)
+#
+#  - createNewDACsettings(path, iteration, deltafile, outfile, mod, makeNewDac, nWorkers,
+#    history, incremental): write the new dac version of the iteration. Only the module files
+#    with changed registers are written, the other files are hard links to the parent version.
+#    The changes are listed in ThresholdMinimization/dac/N/dacChanges.txt
+#    -- incremental: the module files with only settled ROCs are linked without being read
+#
+#  - readHistoInfo(name, index): pick up the histogram corresponding to
 #    the specified name and print Mean and RMS of the distribution
 #    -- name: name of the histo
+#    -- index: optional run index, if given the histo is looked up there instead of gDirectory
 # **************************************************************************************
 
 
@@ -49,95 +97,157 @@ import subprocess
 import glob
 import shutil
 import shlex
-import ROOT
+import numpy
 from array import array
 import string
+from calibEnv import *
+from calibTrace import *
 from browseCalibFiles import *
-
-
-#dacdir      = os.environ['PIXELCONFIGURATIONBASE'] +'dac/'
-#detconfigdir      = os.environ['PIXELCONFIGURATIONBASE'] +'/detconfig/'
-#confpath    = os.environ['PIXELCONFIGURATIONBASE'] +"/configurations.txt"
-#runDir    = os.environ['POS_OUTPUT_DIRS']
-#pixelAnalysisExe   = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/bin/linux/x86_64_slc5/PixelAnalysis.exe'
-#config             = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/configuration/SCurveAnalysis_FPix.xml'
-#runpath            = os.environ['BUILD_HOME'] + '/pixel/PixelRun/'
-#configPixelAlive   = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/configuration/PixelAliveAnalysis.xml'
-
-
-dacdir             = os.environ['PIXELCONFIGURATIONBASE'] +'/dac/'
-detconfigdir       = os.environ['PIXELCONFIGURATIONBASE'] +'/detconfig/'
-confpath           = os.environ['PIXELCONFIGURATIONBASE'] +"/configurations.txt"
-#runpath     = os.environ['HOME'] + '/run/'
-runpath            = os.environ['BUILD_HOME'] + '/pixel/PixelRun/'
-runDir             = os.environ['POS_OUTPUT_DIRS']
-pixelAnalysisExe   = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/bin/linux/i386_slc5/PixelAnalysis.exe'
-config             = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/configuration/SCurveAnalysis_BaseExample.xml'
-configPixelAlive   = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/configuration/PixelAliveAnalysis_BaseExample.xml'
-
-
-def RunSCurveSmartRangeAnalysis(run):
-    path = '%s/Run_%s/Run_%d/'%(runDir, runfolder(run), run)
-    filename = 'SCurve'
-    filelist = [ path + file for file in os.listdir(path) if file.startswith(filename) and file.endswith(".dmp")]
-    newfiles = [f.replace('SCurveSmartRange', 'SCurve') for f in filelist]
-    for i in xrange(len(filelist)):
-        cmdcp = "cp %s %s"%(filelist[i], newfiles[i])
-        os.system(cmdcp) 
-    
-    print "\n=======> Running SCurve Analysis <=======\n"
-    cmd = '%s %s %d'%(pixelAnalysisExe, config, run)
-    print cmd
-    writer =open("scurve.log", 'w') 
-    process = subprocess.call(cmd, shell = True, stdout=writer)
-    cmdcpOffset = ('cp '+ runpath + 'mapRocOffset.txt ' + path)
-    print "copy cmd ", cmdcpOffset
-    os.system(cmdcpOffset)
-    cmdrm = ('rm '+ runpath + 'mapRocOffset.txt')
-    print cmdrm
-    os.system(cmdrm)
-
-
-def RunPixelAliveAnalysis(run):
-    path = '%s/Run_%s/Run_%d/'%(runDir, runfolder(run), run)
+from histoArrays import *
+from rocIndex import *
+from vcThrVcalFits import *
+from fitPlots import *
+from dacSettings import *
+from configKeys import *
+from detConfigIndex import *
+from thresholdSummary import *
+from deadPixelMaps import *
+from trendStore import *
+from iterationStore import *
+from stageFiles import *
+from shardedAnalysis import *
+from runCatalog import *
+
+
+def checkShardedAnalysis(sharded):
+    # a run with failed FED shards is only partly analyzed: the ROCs of the missing FEDs
+    # would be taken as passing by the iteration
+    if(sharded is not None and sharded[1]):
+        sys.exit('PixelAnalysis.exe failed for FEDs %s, stopping the iteration'%' '.join(str(s.fed) for s in sharded[1]))
+
+
+def RunSCurveSmartRangeAnalysis(run, nParallel=1):
+    path = '%s/Run_%s/Run_%d/'%(calibConfig.runDir, runfolder(run), run)
+    sharded = None
+    if(nParallel > 1):
+        print "\n=======> Running SCurve Analysis in FED shards <=======\n"
+        # the shards link the SCurveSmartRange files as SCurve themselves
+        with externalTimer('PixelAnalysis.exe', analysis='SCurve', shards=nParallel):
+            sharded = runShardedAnalysis(run, path, calibConfig.pixelAnalysisExe, calibConfig.config, 'SCurveSmartRange', nParallel, 'scurve', ('SCurveSmartRange', 'SCurve'))
+        checkShardedAnalysis(sharded)
+    if(sharded is None):
+        filename = 'SCurveSmartRange'
+        filelist = getRunCatalog().runFiles(run, filename, ".dmp")
+        # PixelAnalysis.exe looks for SCurve*.dmp: link the files instead of copying them
+        staged = stageFiles([(f, path + os.path.basename(f).replace('SCurveSmartRange', 'SCurve')) for f in filelist])
+        
+        print "\n=======> Running SCurve Analysis <=======\n"
+        cmd = '%s %s %d'%(calibConfig.pixelAnalysisExe, calibConfig.config, run)
+        print cmd
+        writer =open("scurve.log", 'w') 
+        with externalTimer('PixelAnalysis.exe', analysis='SCurve'):
+            process = subprocess.call(cmd, shell = True, stdout=writer)
+        writer.close()
+        unstageFiles(staged)
+    # the shards write their mapRocOffset.txt in their own folder, merged in the run folder
+    if(sharded is None and os.path.isfile(calibConfig.runpath + 'mapRocOffset.txt')):
+        cmdcpOffset = ('cp '+ calibConfig.runpath + 'mapRocOffset.txt ' + path)
+        print "copy cmd ", cmdcpOffset
+        os.system(cmdcpOffset)
+        cmdrm = ('rm '+ calibConfig.runpath + 'mapRocOffset.txt')
+        print cmdrm
+        os.system(cmdrm)
+
+
+def RunPixelAliveAnalysis(run, nParallel=1):
+    path = '%s/Run_%s/Run_%d/'%(calibConfig.runDir, runfolder(run), run)
+    if(nParallel > 1):
+        print "\n=======> Running PixelAlive Analysis in FED shards <=======\n"
+        with externalTimer('PixelAnalysis.exe', analysis='PixelAlive', shards=nParallel):
+            sharded = runShardedAnalysis(run, path, calibConfig.pixelAnalysisExe, calibConfig.configPixelAlive, 'PixelAlive', nParallel, 'pixelAlive')
+        checkShardedAnalysis(sharded)
+        if(sharded is not None): return
     print "\n=======> Running PixelAlive Analysis <=======\n"
-    cmd = '%s %s %d'%(pixelAnalysisExe, configPixelAlive, run)
+    cmd = '%s %s %d'%(calibConfig.pixelAnalysisExe, calibConfig.configPixelAlive, run)
     print cmd
     writer = open("pixelAlive.log", 'w') 
-    process = subprocess.call(cmd, shell = True, stdout=writer)
+    with externalTimer('PixelAnalysis.exe', analysis='PixelAlive'):
+        process = subprocess.call(cmd, shell = True, stdout=writer)
 
     
-def CountDeadPixels (maxDeadPixels, outfile, excludedrocs):
-    maxeff = 100
-
-    for roc in ROOT.gDirectory.GetListOfKeys(): ## ROC folder: find one TH2F for each ROC                                                                                                                    
+def findDeadPixels(histo, maxeff):
+    # count the pixels with efficiency below maxeff with a single array comparison,
+    # return the number of dead pixels and their (x, y) bin coordinates
+    dead = histoContents(histo) < maxeff
+    ys, xs = numpy.nonzero(dead)
+    return len(xs), zip(xs+1, ys+1)
+
+
+def evalDeadPixels(rocname, histo, maxDeadPixels, maxeff=100):
+    # returns the number of dead pixels of the ROC and their (x, y), prints the failing ROCs
+    numDeadPixels, coords = findDeadPixels(histo, maxeff)
+    count('ROCs evaluated')
+    recordTrend('deadPixels', rocname, numDeadPixels)
+    if (numDeadPixels > maxDeadPixels):
+        print '%s - Number of dead pixels = %d' %(rocname,numDeadPixels)
+    return numDeadPixels, coords
+
+
+def selectDeadPixelRocs(maxDeadPixels):
+    # returns a list of (ROC name, number of dead pixels) of the failing ROCs in the
+    # current directory, and a dictionary ROC name -> (x, y) of the dead pixels
+    failing = []
+    deadPixels = {}
+
+    for roc in ROOT.gDirectory.GetListOfKeys(): ## ROC folder: find one TH2F for each ROC
         histo = roc.ReadObj()
-        hname   = histo.GetName()
-        xBins   = histo.GetNbinsX()
-        yBins   = histo.GetNbinsY()
-
-        # count dead pixels in each roc                                                                                                                                                                 
-        numDeadPixels = 0
-        for x in range(1,xBins+1):
-            for y in range(1,yBins+1):
-                if histo.GetBinContent(x,y) < maxeff:
-                    numDeadPixels=numDeadPixels+1;
+        count('histos read')
+        rocname = histo.GetName().replace(' (inv)','')
+
+        # count dead pixels in each roc
+        numDeadPixels, deadPixels[rocname] = evalDeadPixels(rocname, histo, maxDeadPixels)
+        releaseObject(histo)
         if (numDeadPixels > maxDeadPixels):
-            rocname = hname.replace(' (inv)','')
-            print '%s - Number of dead pixels = %d' %(rocname,numDeadPixels)
-            if (rocname not in excludedrocs):
-                outfile.write('%s\n'%rocname)
+            failing.append((rocname, numDeadPixels))
+    return failing, deadPixels
+
+
+def CountDeadPixels (maxDeadPixels, outfile, excludedrocs):
+    failing, deadPixels = selectDeadPixelRocs(maxDeadPixels)
+    for rocname, numDeadPixels in failing:
+        if (rocname not in excludedrocs):
+            outfile.write('%s\n'%rocname)
+    return deadPixels
 
 
+def CountDeadPixelsIndexed(index, maxDeadPixels, outfile, excludedrocs):
+    # same as CountDeadPixels, reading the efficiency histos of all the ROCs from the run index
+    deadPixels = {}
+    for rocname, histo in readIndexedObjects(index, 'Efficiency'):
+        count('histos read')
+        numDeadPixels, deadPixels[rocname] = evalDeadPixels(rocname, histo, maxDeadPixels)
+        if (numDeadPixels > maxDeadPixels and rocname not in excludedrocs):
+            outfile.write('%s\n'%rocname)
+    return deadPixels
 
-def CheckEfficiency(files, filename, iteration, maxDeadPixels, skipFPix, skipBPix, excluded):
+
+def countFailingDeadPixelRocs(maxDeadPixels):
+    return selectDeadPixelRocs(maxDeadPixels)[0]
+
+
+def deadPixelRocs(maxDeadPixels):
+    # failing ROCs of the current directory, in the order of the directory, and (ROC name,
+    # (x, y) of the dead pixels) of all its ROCs
+    failing, deadPixels = selectDeadPixelRocs(maxDeadPixels)
+    return [(failing, deadPixels.items())]
+
+
+
+def CheckEfficiency(files, filename, iteration, maxDeadPixels, skipFPix, skipBPix, excluded, nWorkers=1, index=None, stream=False, mapsFile=None):
     
     # excluded rocs
-    excludedrocs = []
-    if (excluded != '' and  os.path.isfile(excluded)):
-        excludedfile = open(excluded,'r')
-        if (excludedfile):
-            excludedrocs = [line.replace('\n','') for line in excludedfile]
+    excludedrocs = set(readExcludedRocs(excluded))
+    if(skipFPix or skipBPix): excludedrocs |= skippedRocs(os.path.dirname(files[0]) + '/', skipFPix, skipBPix)
 
     # prepare output file where ROCs failing PixelAlive will be written
     outfile = open("%s_%d.txt"%(filename,iteration),'w')
@@ -161,31 +271,89 @@ def CheckEfficiency(files, filename, iteration, maxDeadPixels, skipFPix, skipBPi
           
     #for dir in dirs:        
         #file.cd(dir)
-    browseROCChain(files, CountDeadPixels, maxDeadPixels, outfile, excludedrocs)
+    # dead pixels of all the ROCs, kept only for the dead pixel maps
+    deadPixels = {}
+    def CountAndKeepDeadPixels(*args):
+        deadPixels.update(CountDeadPixels(*args))
+    countDeadPixels = CountAndKeepDeadPixels if mapsFile else CountDeadPixels
+    with timer('CheckEfficiency', iteration=iteration):
+        if(index is not None):
+            deadPixels = CountDeadPixelsIndexed(index, maxDeadPixels, outfile, excludedrocs)
+        elif(nWorkers > 1 and mapsFile):
+            # the failing ROCs are written in the order of the browse, as the other paths
+            for failing, rocs in mergeTrendRecords(browseROCChainParallel(files, nWorkers, withTrendRecords, deadPixelRocs, maxDeadPixels)):
+                deadPixels.update(rocs)
+                for rocname, numDeadPixels in failing:
+                    if (rocname not in excludedrocs):
+                        outfile.write('%s\n'%rocname)
+        elif(nWorkers > 1):
+            failing = mergeTrendRecords(browseROCChainParallel(files, nWorkers, withTrendRecords, countFailingDeadPixelRocs, maxDeadPixels))
+            for rocname, numDeadPixels in failing:
+                if (rocname not in excludedrocs):
+                    outfile.write('%s\n'%rocname)
+        elif(stream):
+            browseROCChainStreaming(files, countDeadPixels, maxDeadPixels, outfile, excludedrocs)
+        else:
+            browseROCChain(files, countDeadPixels, maxDeadPixels, outfile, excludedrocs)
+    outfile.close()
+
+    maps = None
+    if(mapsFile):
+        with timer('DeadPixelMaps.save', rocs=len(deadPixels)):
+            maps = DeadPixelMaps.fromDeadPixels(deadPixels)
+            maps.save(mapsFile)
+        print 'Dead pixel maps of %d ROCs saved in %s'%(len(maps.names), mapsFile)
 
                         
     outfile = open("%s_%d.txt"%(filename,iteration),'r')
     print 'Number of failing ROCs = %d'% len(outfile.readlines())
     outfile.close()
+    return maps
 
 
     
-def fitVcalVcThr( savePlots, ignore):
-    failingRocs = 0 
-    if not os.path.isfile(runpath + 'mapRocVcalVcThr.txt'):
-        print "Saving New  Vcal VcThr map in ",runpath + 'mapRocVcalVcThr.txt'
-        ofile = open(runpath + 'mapRocVcalVcThr.txt', 'w')
+def openVcalVcThrMap():
+    if not os.path.isfile(calibConfig.runpath + 'mapRocVcalVcThr.txt'):
+        print "Saving New  Vcal VcThr map in ",calibConfig.runpath + 'mapRocVcalVcThr.txt'
+        ofile = open(calibConfig.runpath + 'mapRocVcalVcThr.txt', 'w')
         ofile.write('='*80)    
         ofile.write('\nROC name                              a      b     chi2/NDF   LowestThreshold \n')
         ofile.write('='*80)
         ofile.write('\nVcThr = a + b*Vcal \n')
         ofile.write('='*80)
     else:
-        ofile = open(runpath + 'mapRocVcalVcThr.txt', 'a')
+        ofile = open(calibConfig.runpath + 'mapRocVcalVcThr.txt', 'a')
+    return ofile
+
+
+def writeVcalVcThrFits(ofile, fits, ignore):
+    failingRocs = 0 
+    for fit in fits:
+        cName, a, b, chi2NDF, lowestThr = fit[:5]
+        recordTrend('vcThrFit', cName, a, b, chi2NDF, lowestThr)
+        ofile.write('\n%s   %.2f   %.2f   %.2f   %d '%(cName, a, b, chi2NDF, lowestThr))                      
+
+        if(chi2NDF > 10.): 
+            print chi2NDF
+            print ignore
+            if(ignore== 'False'):
+                print "hello"
+                failingRocs = failingRocs + 1
+                print failingRocs
+    return failingRocs
+
 
+### Fit the Vcal(VcThr) distribution of the ROCs in the current directory,
+### returns a list of (ROC name, a, b, chi2/NDF, lowest threshold)
+
+def fitRocsVcalVcThr(savePlots):
+    fits = []
     for roc in ROOT.gDirectory.GetListOfKeys(): # ROCs, e.g.:  BmI_SEC4_LYR1_LDR5F_MOD1_ROC0
         cName =  roc.GetName()
-        h = roc.ReadObj().GetPrimitive(cName)
+        canvas = roc.ReadObj()
+        count('histos read')
+        count('ROCs evaluated')
+        h = canvas.GetPrimitive(cName)
         step = h.GetYaxis().GetBinWidth(1)
         ### Fit range for intime WBC 
         #VcalMin = 50
@@ -212,6 +380,8 @@ def fitVcalVcThr( savePlots, ignore):
             firstBin = h_VcThr.FindFirstBinAbove(0.4)
             minVcThr.append( h_VcThr.GetBinCenter( h_VcThr.FindLastBinAbove(0.9) ) )
             VcThrs.append(h_VcThr.GetBinCenter(firstBin))
+            releaseObject(h_VcThr)
+        releaseObject(canvas) # deletes h too
         
 
         VcThrArray = array('f', VcThrs)
@@ -225,23 +395,41 @@ def fitVcalVcThr( savePlots, ignore):
         VcThrVcal_graph.GetXaxis().SetTitle("Vcal")
         VcThrVcal_graph.GetYaxis().SetTitle("VcThr")
         fitRes = VcThrVcal_graph.GetFunction("pol1")
-        ofile.write('\n%s   %.2f   %.2f   %.2f   %d '%(cName, fitRes.GetParameter(0), fitRes.GetParameter(1), fitRes.GetChisquare()/fitRes.GetNDF(), min(minVcThr)))                      
+        fit = (cName, fitRes.GetParameter(0), fitRes.GetParameter(1), fitRes.GetChisquare()/fitRes.GetNDF(), min(minVcThr))
+        # the points are kept for the plots, rendered once all the ROCs are fitted (see fitPlots.py)
+        if(savePlots == 'True'): fit = fit + (Vcals, VcThrs)
+        fits.append(fit)
+    return fits
 
-        if(fitRes.GetChisquare()/fitRes.GetNDF() > 10.): 
-            print fitRes.GetChisquare()/fitRes.GetNDF()
-            print ignore
-            if(ignore== 'False'):
-                print "hello"
-                failingRocs = failingRocs + 1
-                print failingRocs
 
-        if(savePlots == 'True'):
-            if(not os.path.isdir("plots")): os.system('mkdir plots')
-            c = ROOT.TCanvas(cName+'_fit')
-            c.cd()
-            VcThrVcal_graph.Draw("A*")
-            c.Print("plots/" + cName+".pdf")
-    if(failingRocs > 0): print "There were ", failingRocs, " failing ROCs in module: ", cName
+def fitVcalVcThr( savePlots, ignore):
+    ofile = openVcalVcThrMap()
+    with timer('fitRocsVcalVcThr'):
+        fits = fitRocsVcalVcThr(savePlots)
+    failingRocs = writeVcalVcThrFits(ofile, fits, ignore)
+    if(savePlots == 'True'): queueFitPlots(fits)
+    ofile.close()
+    if(failingRocs > 0): print "There were ", failingRocs, " failing ROCs in module: ", fits[-1][0]
+
+
+def fitVcalVcThrBatched(files, savePlots, ignore):
+    # all the ROCs of the files are fitted at once, see vcThrVcalFits.py
+    with timer('fitVcalVcThrBatch', files=len(files)):
+        fits = fitVcalVcThrBatch(iterVcThrVcalHistos(files), savePlots)
+    ofile = openVcalVcThrMap()
+    failingRocs = writeVcalVcThrFits(ofile, fits, ignore)
+    if(savePlots == 'True'): queueFitPlots(fits)
+    ofile.close()
+    if(failingRocs > 0): print "There were ", failingRocs, " failing ROCs"
+
+
+def fitVcalVcThrParallel(files, nWorkers, savePlots, ignore):
+    fits = browseROCChainParallel(files, nWorkers, fitRocsVcalVcThr, savePlots)
+    ofile = openVcalVcThrMap()
+    failingRocs = writeVcalVcThrFits(ofile, fits, ignore)
+    if(savePlots == 'True'): queueFitPlots(fits)
+    ofile.close()
+    if(failingRocs > 0): print "There were ", failingRocs, " failing ROCs"
 
 
 ### The following functions look into the SCurve results and check for each ROCs
@@ -250,7 +438,7 @@ def fitVcalVcThr( savePlots, ignore):
 ### of iterations 
 
 
-def checkROCthr(path, iteration):
+def openFailedRocsFile(iteration):
     filename = "failed_%d.txt"%(iteration)
     if not os.path.isfile(filename):
         ofile = open(filename,'w')
@@ -260,28 +448,100 @@ def checkROCthr(path, iteration):
         ofile.write('='*60)    
     else:
       ofile = open(filename, 'a')
+    return ofile
+
+
+### Look at the threshold histograms of the ROCs in the current directory,
+### returns a list of (ROC name, mean, RMS) of the failing ones
+
+def evalROCthr(rocname, h):
+    # returns (ROC name, mean, RMS) if the ROC is failing, None otherwise
+    count('ROCs evaluated')
+    recordTrend('threshold', rocname, h.GetMean(), h.GetRMS())
+    nPixelsOutRange = h.Integral(0, h.FindBin(30)) + h.Integral( h.FindBin(120), h.GetNbinsX()+2) 
+    
+    if(h.GetMean()<35):
+        print "ROC failing because of mean Thr <35: ", rocname
+    elif(nPixelsOutRange >2):
+        print "ROC failing because pixel Thr out of range: ", rocname
+        print "Number of bad pixels: " , nPixelsOutRange
+    else: return None
+    return (rocname, h.GetMean(), h.GetRMS())
 
+
+def selectFailingRocs(skip=None):
+    failing = []
     for roc in ROOT.gDirectory.GetListOfKeys(): # ROCs, e.g.:  BmI_SEC4_LYR1_LDR5F_MOD1_ROC0
         name =  roc.GetName()
         rocname =  name.replace("_Threshold1D", "")
         if(name.endswith("Threshold1D")):
+            if(skip and rocname in skip): continue # settled ROC, the histo is not even read
             h = roc.ReadObj()
-            #print "ROC Name: ", name
-            #print "ROC Mean: %.2f"%(h.GetMean())
-            nPixelsOutRange = h.Integral(0, h.FindBin(30)) + h.Integral( h.FindBin(120), h.GetNbinsX()+2) 
-            
-            if(h.GetMean()<35 or nPixelsOutRange >2):
-                ofile.write('\n%s  %.2f  %.2f'%(rocname, h.GetMean(), h.GetRMS()) )
-            else: continue
-
-            if(h.GetMean()<35):
-                print "ROC failing because of mean Thr <35: ", rocname
-            elif(nPixelsOutRange >2):
-                print "ROC failing because pixel Thr out of range: ", rocname
-                print "Number of bad pixels: " , nPixelsOutRange
-
-def readHistoInfo(name):
-    a =    ROOT.gDirectory.Get(name)
+            count('histos read')
+            res = evalROCthr(rocname, h)
+            releaseObject(h)
+            if res is not None: failing.append(res)
+    return failing
+
+
+def writeFailingRocs(ofile, failing):
+    for rocname, mean, rms in failing:
+        ofile.write('\n%s  %.2f  %.2f'%(rocname, mean, rms) )
+
+
+def checkROCthr(path, iteration, skip=None):
+    ofile = openFailedRocsFile(iteration)
+    writeFailingRocs(ofile, selectFailingRocs(skip))
+    ofile.close()
+
+
+def checkROCthrIndexed(index, iteration, skip=None):
+    # same as checkROCthr for all the ROCs of the run, reading the histos from the run index
+    failing = []
+    for rocname, h in readIndexedObjects(index, 'Threshold1D', skip):
+        count('histos read')
+        res = evalROCthr(rocname, h)
+        if res is not None: failing.append(res)
+    ofile = openFailedRocsFile(iteration)
+    writeFailingRocs(ofile, failing)
+    ofile.close()
+
+
+def checkROCthrSummary(files, path, iteration, cuts=(35, 30, 120, 2), index=None, skip=None):
+    # build (or reuse, if newer than the files) the threshold summary of the run and
+    # derive the failing ROCs from it. cuts = (min mean, min thr, max thr, max pixels out of range)
+    summaryFile = os.path.join(path, summaryName)
+    if(os.path.isfile(summaryFile) and os.path.getmtime(summaryFile) > max(os.path.getmtime(f) for f in files)):
+        print "Reading threshold summary ", summaryFile
+        summary = ThresholdSummary.load(summaryFile)
+    else:
+        if index is None: histos = iterThresholdHistos(files, skip)
+        else: histos = readIndexedObjects(index, 'Threshold1D', skip)
+        with timer('ThresholdSummary.fromHistos', files=len(files)):
+            summary = ThresholdSummary.fromHistos(histos)
+        # a summary without the skipped ROCs is not the summary of the run, it is not kept
+        if not skip:
+            print "Saving threshold summary ", summaryFile
+            summary.save(summaryFile)
+    keep = [i for i, rocname in enumerate(summary.names) if not (skip and rocname in skip)]
+    recordTrends('threshold', summary.names[keep], summary.mean[keep], summary.rms[keep])
+    ofile = openFailedRocsFile(iteration)
+    writeFailingRocs(ofile, summary.failingRocs(*cuts, skip=skip))
+    ofile.close()
+    return summary
+
+
+def checkROCthrParallel(files, nWorkers, path, iteration, skip=None):
+    # the thresholds of the ROCs are recorded for the trends in the workers, see trendStore.py
+    failing = mergeTrendRecords(browseROCChainParallel(files, nWorkers, withTrendRecords, selectFailingRocs, skip))
+    ofile = openFailedRocsFile(iteration)
+    writeFailingRocs(ofile, failing)
+    ofile.close()
+
+
+def readHistoInfo(name, index=None):
+    if index is None: a = ROOT.gDirectory.Get(name)
+    else: a = index.getByKey(name)
     print a.GetTitle()
     print "RMS   Mean"
     print  '%.2f  %.2f'%(a.GetRMS(), a.GetMean())
@@ -332,6 +592,18 @@ def listFromFile(filepath):
     f.close()
     return flist
 
+def moduleFileName(rocname):
+    # dac file of the module of the ROC, as in createModuleList
+    return "ROC_DAC_module_" + moduleName(rocname) + ".dat"
+
+def convergedRocs(deltafile, iteration, mod, history):
+    # ROCs settled at the previous iteration, which setDelta does not change anymore
+    if(iteration>1 and history.hasIteration(deltafile, iteration-1)):
+        return history.converged(deltafile, iteration-1, mod)
+    elif(iteration>1):
+        return set(listFromDeltaFile("%s_%d.txt"%(deltafile, iteration-1), mod))
+    return set()
+
 def listFromDeltaFile(filepath, mod):
     f = open(filepath)
     flist = f.readlines()
@@ -341,36 +613,57 @@ def listFromDeltaFile(filepath, mod):
     f.close()
     return flist
 
-def createModuleList(path):
+def detConfigIndexFromPath(path):
+    # index of the detconfig file of the run (see detConfigIndex.py), None if not found
     detconfig = findDetConfigFromPath(path)
-    if(detconfig!=0):
-        detconfiglist =listFromFile(detconfigdir + str(detconfig) + "/detectconfig.dat")
-        mods =[] 
-        for m in detconfiglist:
-            if (("noAnalogSignal" not in m) and ("noInit" not in m)):
-                if("FPix" in m ):mod = m.split("_")[:-2]
-                else: mod = m.split("_")[:-1]
-                mod = "_".join(mod)
-                if mod not in mods:mods.append(mod)
-                #           else:
-                #print "noAnalogSignal"
-        print "Number of Modules: ", len(mods)
-        print "Total number of ROCs in detconfig file: ", len(detconfiglist)
-        files = [ "ROC_DAC_module_"+mod+".dat" for mod in mods]
+    if(detconfig==0): return None
+    return getDetConfigIndex(calibConfig.detconfigdir + str(detconfig) + "/detectconfig.dat")
+
+def createModuleList(path):
+    index = detConfigIndexFromPath(path)
+    if(index is not None):
+        files = index.moduleFiles(index.enabled)
+        print "Number of Modules: ", len(files)
+        print "Total number of ROCs in detconfig file: ", len(index.names)
         return files
 
+def skippedRocs(path, skipFPix, skipBPix):
+    # ROCs of the subdetectors left out by --skipFPix/--skipBPix
+    index = detConfigIndexFromPath(path)
+    if(index is None): return set()
+    skipped = numpy.zeros(len(index.names), dtype=bool)
+    if(skipFPix): skipped |= index.select(subdet='FPix')
+    if(skipBPix): skipped |= index.select(subdet='BPix')
+    return set(index.rocNames(skipped))
+
               
-def createNewDACsettings(path, iteration, deltafile, outfile, mod, makeNewDac):
+def createNewDACsettings(path, iteration, deltafile, outfile, mod, makeNewDac, nWorkers=4, history=None, incremental=False):
     #delta = "delta"
     detconfiglist = createModuleList(path)
     #print "detconfiglist size: ", len(detconfiglist)
-    minimizedROCs = []
-    if(iteration>1):
-        minimizedROCs = listFromDeltaFile("%s_%d.txt"%(deltafile, iteration-1), mod)
-        #print "ROCs already fixed ", minimizedROCs
+    if history is None: history = IterationHistory()
+    minimizedROCs = convergedRocs(deltafile, iteration, mod, history)
+    #print "ROCs already fixed ", minimizedROCs
+    # incremental mode: the module files with only settled ROCs are carried over as they
+    # are, and the settled ROCs keep the verdict of the iteration they were evaluated at
+    previous = {}
+    carried = {}
+    if(incremental and history.hasIteration(deltafile, iteration-1)):
+        previous = history.records(deltafile, iteration-1)
+        # all the ROCs of each module from the detconfig file, not only the ones of the store
+        index = detConfigIndexFromPath(path)
+        modules = {}
+        for rocname in (index.names if index is not None else []):
+            modules.setdefault(moduleFileName(rocname), []).append(rocname)
+        for f in detconfiglist:
+            rocs = modules.get(f)
+            if rocs and all(rocname in minimizedROCs for rocname in rocs):
+                carried[f] = [(rocname, 0) for rocname in rocs]
+        print "Module files carried over: %d of %d"%(len(carried), len(detconfiglist))
     dac = findDacFromPath(path)
     if(dac!=0):
-        subdirs = [ int(x) for x in os.walk(dacdir).next()[1] ] 
+        # only the dac versions, not the temporary folders left by an interrupted writeNewDacVersion
+        subdirs = [ int(x) for x in os.walk(calibConfig.dacdir).next()[1] if x.isdigit() ]
         subdirs.sort()
         print 'Last dac dir: ', subdirs[-1]    
         lastsettings = subdirs[-1]
@@ -378,65 +671,50 @@ def createNewDACsettings(path, iteration, deltafile, outfile, mod, makeNewDac):
         newdir =  os.getcwd() +  '/ThresholdMinimization/dac/' + str(newsettings)
         print 'New dir: ', newdir
         os.makedirs(newdir)
-        os.makedirs(dacdir + str(newsettings))
-        cmd_cpdac = 'cp -r ' + dacdir + str(dac) + '/* ' + dacdir + str(newsettings)
 
-        print cmd_cpdac
-        os.system(cmd_cpdac)
+        failingRocs = getFailingRocInfo(outfile, iteration)
+        orgdacpath = calibConfig.dacdir + dac
+        dest_dir = calibConfig.dacdir + str(newsettings)
+        print 'Writing dac/%s from dac/%s'%(newsettings, dac)
+        # unchanged files are hard links to dac/<dac>, the changes are listed in the manifest
+        manifest = os.path.join(newdir, 'dacChanges.txt')
+        with timer('writeNewDacVersion', modules=len(detconfiglist), carried=len(carried)):
+            deltas = writeNewDacVersion(orgdacpath, dest_dir, detconfiglist,
+                                        lambda rocname: setDelta(rocname, minimizedROCs, failingRocs, mod), nWorkers, carried, manifest)
+        with open(manifest) as f:
+            print f.readline().strip('# \n')
 
-
-        failingRocs = getFailingRocs(path, outfile, iteration)
-        orgdacpath = dacdir + dac
         deltafilenew = open("%s_%d.txt"%(deltafile, iteration),'a')
-        
-        for f in detconfiglist:
-            newdacfile = open(newdir + '/'+f, 'w')
-            openfile = open(orgdacpath + '/'+ f, 'r')
-            #print 'Original file: ', orgdacpath + '/'+ f
-            #print 'New file: ', newdir + '/'+f
-            delta = 0
-            
-            for line in openfile.readlines():
-                if (line.startswith("ROC")):
-                    #if line.split()[1].startswith("BPix_BmI_SEC4"): print line
-                    rocname = line.split()[1]
-                    #print rocname
-                    delta = setDelta(rocname, minimizedROCs, failingRocs, mod)
-                    deltafilenew.write('%s %d\n'%(rocname,delta))
-                        
-                elif (line.startswith('VcThr') ): 
-                    newVcThr = int(line.split()[1]) + delta
-                    #print "old dac: ", line.split()[1]
-                    #print "new dac: ", newVcThr
-                    #print "old line: ",line
-                    line = string.replace(line, str(line.split()[1]), str(newVcThr))
-                    #print "new line: ",line
-                                        
-                newdacfile.write(line)
-
-            newdacfile.close()
-            openfile.close()
-         
-
+        for rocname, delta in deltas:
+            deltafilenew.write('%s %d\n'%(rocname,delta))
         deltafilenew.close()
+        # --- Keep a copy of the new dac files in the ThresholdMinimization folder
+        with timer('linkDacFiles'):
+            linkDacFiles(dest_dir, newdir, detconfiglist)
+
+        # --- Save the state of the iteration
+        thresholds = {}
+        if os.path.isfile(os.path.join(path, summaryName)):
+            summary = ThresholdSummary.load(os.path.join(path, summaryName))
+            thresholds = dict(zip(summary.names, zip(summary.mean, summary.rms)))
+        rows = []
+        for rocname, delta in deltas:
+            if(rocname in minimizedROCs and rocname in previous and rocname not in failingRocs and rocname not in thresholds):
+                rows.append((rocname, delta) + previous[rocname][1:])
+                continue
+            mean, rms = failingRocs.get(rocname) or thresholds.get(rocname, (None, None))
+            rows.append((rocname, delta, rocname in failingRocs, mean, rms))
+        with timer('IterationHistory.record', rocs=len(rows)):
+            history.record(deltafile, iteration, rows)
+
         # --- Print a summary         
-        deltafilenew = open("%s_%d.txt"%(deltafile,iteration),'r')
-        rocs = deltafilenew.readlines()
+        counts = history.countsPerDelta(deltafile, iteration)
         print 'Number of ROCs already failing at the previous iterations:'
-        print        len([ l for l in rocs if re.search(' 0',l) ])
+        print        counts.get(0, 0)
         print 'Number of ROC failing at this iteration:'
-        print        len([ l for l in rocs if re.search(' -4',l) ])
+        print        counts.get(-4, 0)
         print 'Number of ROC still succeeding:'
-        print        len([ l for l in rocs if re.search(' 2',l) ])
-        deltafilenew.close()
-        # --- Copy the new dac files in the newly created dac directory 
-        dest_dir = dacdir + str(newsettings)
-        #print "destination folder: ", dest_dir + "/"
-        #print "source folder:", newdir + "/*.dat "
-        for f in glob.glob( newdir + "/*.dat"):
-            #print f
-            shutil.copy(f, dest_dir)
-
+        print        counts.get(2, 0)
         # --- Make the new dac the default
         if(makeNewDac):
             cmd = 'PixelConfigDBCmd.exe --insertVersionAlias dac %d Default'%newsettings
@@ -543,54 +821,48 @@ def setDelta(rocname, minimizedROCs, failingRocs, mod):
 
 def findDacFromKey(key):
 
-    dac = []
-
-    with open(os.environ['PIXELCONFIGURATIONBASE']+'/configurations.txt','r') as f:
-        chunks = f.read().split('\n\n')
-    for c in chunks:
-        config = c.split('\n')
-        if 'key %s'%key in config:
-            dac = [item.split()[1] for item in config if item.startswith('dac')]
-    if len(dac)<1:
+    dac = getConfigurationKeys(calibConfig.confpath).lookup(key, 'dac')
+    if dac is None:
         sys.exit("Error: dac not found")
-    print "Used key %s with dac %s"%(key,dac[0])
-    return dac[0]
+    print "Used key %s with dac %s"%(key,dac)
+    return dac
 
 
 def findDetConfigFromKey(key):
     print 'Key ',key
-    detconfig = []
-
-    with open(os.environ['PIXELCONFIGURATIONBASE']+'/configurations.txt','r') as f:
-        chunks = f.read().split('\n\n')
-    for c in chunks:
-        config = c.split('\n')
-        if 'key %s'%key in config:
-            detconfig = [item.split()[1] for item in config if item.startswith('detconfig')]
-    if len(detconfig)<1:
+
+    detconfig = getConfigurationKeys(calibConfig.confpath).lookup(key, 'detconfig')
+    if detconfig is None:
         sys.exit("Error: detconfig not found")
-    print "Used key %s with detconfig %s"%(key,detconfig[0])
-    return detconfig[0]
+    print "Used key %s with detconfig %s"%(key,detconfig)
+    return detconfig
+
+
+def findAliasFromKeys(keys, alias):
+    # e.g. findAliasFromKeys([1234, 1235], 'dac') -> {1234: '56', 1235: '57'}, None if not found
+    return getConfigurationKeys(calibConfig.confpath).lookupMany(keys, alias)
 
         
-### Analyse the file produced by CheckROCThr and get a list of failing ROCs
-### to use it later by createNewDACsettings
-    
-def getFailingRocs(path, outfile, iteration):
+### Analyse the file produced by CheckROCThr and get the failing ROCs
+### to use them later by createNewDACsettings: a dictionary failing ROC -> (mean, RMS),
+### (None, None) if the thresholds are not in the file (e.g. PixelAlive)
+
+def getFailingRocInfo(outfile, iteration):
+    failrocs = {}
     if(iteration != 0):
         try:
             ofile = open("%s_%d.txt"%(outfile, iteration),'r')
         except IOError:
-            print "Cannot open ", "failed_%d.txt"%(iteration)
-            
+            print "Cannot open ", "%s_%d.txt"%(outfile, iteration)
         else:
-            lines = ofile.readlines() 
-            print "Failing ROCs: ", len(lines) 
-            rocs = [l.split()[0] for l in lines]
-            failrocs = [l.split()[0] for l in lines if (l.startswith("BPix") or l.startswith("FPix"))]
+            for l in ofile:
+                if (l.startswith("BPix") or l.startswith("FPix")):
+                    fields = l.split()
+                    if len(fields) > 2: failrocs[fields[0]] = (float(fields[1]), float(fields[2]))
+                    else: failrocs[fields[0]] = (None, None)
+            print "Failing ROCs: ", len(failrocs)
             ofile.close()
-            return failrocs
-    else:   return []
+    return failrocs
 
 
 
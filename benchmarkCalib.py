@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+# **************************************************************************************
+#
+#  Description: Time the analysis steps of the calibrations on the synthetic results
+#               created by makeSyntheticRun.py. Each stage runs in its own process
+#               and the wall time, the number of ROCs per second and the peak RSS
+#               are reported as JSON.
+#
+#  Usage: python benchmarkCalib.py -b /path/to/synthetic [-s stage1,stage2] [-o bench.json]
+#
+#  Stages:
+#     checkROCthr           browseROCChain + checkROCthr on the SCurve run
+#     CountDeadPixels       CheckEfficiency on the PixelAlive run
+#     fitVcalVcThr          browseROCChain + fitVcalVcThr on the VcThr-Vcal run
+#     createNewDACsettings  new dac version from the failed ROCs of checkROCthr
+#  plus the alternative implementations (checkROCthrParallel, checkROCthrIndexed,
+#  checkROCthrSummary, fitVcalVcThrParallel, fitVcalVcThrBatched)
+#     checkROCthrStreaming  browseROCChainStreaming + checkROCthr, with the RSS after each file
+#     import                import of the analysis modules, without reading any
+#                           histogram: reports whether ROOT was loaded
+#     dacModel              load dac 0 in a DacVersion, add VcThr deltas, diff and write it
+#                           back, with the time of each step
+#
+# **************************************************************************************
+
+
+import sys
+import os
+import json
+import time
+import resource
+import optparse
+import multiprocessing
+
+
+def runFiles(runDir, run, prefix):
+    path = '%s/Run_0/Run_%d/'%(runDir, run)
+    return path, sorted([path + f for f in os.listdir(path) if f.startswith(prefix) and f.endswith("root")])
+
+
+def stageFunctions(synthetic, nWorkers):
+    # import here, after the environment of the synthetic results has been set
+    from analysisCalibFuncs import browseROCChain, browseROCChainStreaming, checkROCthr, checkROCthrParallel, checkROCthrIndexed, \
+        checkROCthrSummary, CheckEfficiency, fitVcalVcThr, fitVcalVcThrParallel, fitVcalVcThrBatched, \
+        createNewDACsettings, RocIndex
+    runDir = os.environ['POS_OUTPUT_DIRS']
+    runs = synthetic['runs']
+    scPath, scFiles = runFiles(runDir, runs['SCurve'], 'SCurve')
+    paPath, paFiles = runFiles(runDir, runs['PixelAlive'], 'PixelAlive')
+    vcPath, vcFiles = runFiles(runDir, runs['VcThrVcal'], '2DEfficiency')
+    return {
+        'checkROCthr':          lambda: browseROCChain(scFiles, checkROCthr, scPath, 1),
+        'checkROCthrStreaming': lambda: {'rssPerFilekB': [(os.path.basename(f), rss, peak) for f, rss, peak in
+                                                         browseROCChainStreaming(scFiles, checkROCthr, scPath, 1)]},
+        'checkROCthrParallel':  lambda: checkROCthrParallel(scFiles, nWorkers, scPath, 1),
+        'checkROCthrIndexed':   lambda: checkROCthrIndexed(RocIndex(scPath, scFiles), 1),
+        'checkROCthrSummary':   lambda: checkROCthrSummary(scFiles, scPath, 1),
+        'CountDeadPixels':      lambda: CheckEfficiency(paFiles, 'failedAlive', 1, 10, False, False, ''),
+        'fitVcalVcThr':         lambda: browseROCChain(vcFiles, fitVcalVcThr, 'False', 'True'),
+        'fitVcalVcThrParallel': lambda: fitVcalVcThrParallel(vcFiles, nWorkers, 'False', 'True'),
+        'fitVcalVcThrBatched':  lambda: fitVcalVcThrBatched(vcFiles, 'False', 'True'),
+        'createNewDACsettings': lambda: createNewDACsettings(scPath, 1, 'delta', 'failed', 'minimize', 0),
+        'dacModel':             dacModelStage,
+        }
+
+
+def dacModelStage():
+    import tempfile, shutil
+    from dacModel import DacVersion
+    times = {}
+    start = time.time()
+    dac = DacVersion.load(os.path.join(os.environ['PIXELCONFIGURATIONBASE'], 'dac', '0'))
+    times['loadTime'] = time.time() - start
+    start = time.time()
+    new = dac.copy()
+    new.addDeltas(new.deltaVector(lambda rocname: 2))
+    times['addDeltasTime'] = time.time() - start
+    start = time.time()
+    changes = dac.diff(new)
+    times['diffTime'] = time.time() - start
+    tmpdir = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        new.write(tmpdir)
+        times['writeTime'] = time.time() - start
+    finally:
+        shutil.rmtree(tmpdir)
+    times['changes'] = len(changes)
+    return times
+
+
+def importStage(queue):
+    start = time.time()
+    import calibIterations
+    from calibEnv import rootLoaded
+    queue.put({'wallTime': time.time() - start, 'rootLoaded': rootLoaded(),
+               'peakRSSkB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+
+def runStage(stage, synthetic, nWorkers, queue):
+    if stage == 'import': return importStage(queue)
+    functions = stageFunctions(synthetic, nWorkers)
+    start = time.time()
+    extra = functions[stage]()
+    wallTime = time.time() - start
+    # ru_maxrss is in kB on Linux, the children are the workers of the parallel stages
+    peakRSS = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    result = {'wallTime': wallTime, 'rocsPerSecond': synthetic['rocs']/wallTime, 'peakRSSkB': peakRSS}
+    if isinstance(extra, dict): result.update(extra)
+    queue.put(result)
+
+
+if __name__ == '__main__':
+    usage = 'usage: %prog -b syntheticDir'
+    parser = optparse.OptionParser(usage)
+    parser.add_option('-b', '--base', dest='base', type='string', help='Folder created by makeSyntheticRun.py')
+    parser.add_option('-s', '--stages', dest='stages', type='string', default='import,checkROCthr,CountDeadPixels,fitVcalVcThr,createNewDACsettings', help='Comma separated list of the stages to run')
+    parser.add_option('-j', '--nWorkers', dest='nWorkers', type='int', default=4, help='Number of workers of the parallel stages. Default is 4')
+    parser.add_option('-o', '--output', dest='output', type='string', default='', help='JSON file with the results. Default is stdout')
+    (opt, args) = parser.parse_args()
+    sys.argv.append('-b')
+
+    if opt.base is None:
+        parser.error('Please define the folder of the synthetic results')
+
+    base = os.path.abspath(opt.base)
+    # the stages run in the work folder of the synthetic results, keep finding the analysis modules
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    synthetic = json.load(open(os.path.join(base, 'synthetic.json')))
+    os.environ['PIXELCONFIGURATIONBASE'] = os.path.join(base, 'config')
+    os.environ['POS_OUTPUT_DIRS'] = os.path.join(base, 'output')
+    os.environ.setdefault('BUILD_HOME', os.path.join(base, 'build'))
+    for d in [os.path.join(base, 'work'), os.path.join(os.environ['BUILD_HOME'], 'pixel/PixelRun')]:
+        if not os.path.isdir(d): os.makedirs(d)
+    # failed_N.txt, delta_N.txt and the ThresholdMinimization folder are written in the working directory
+    os.chdir(os.path.join(base, 'work'))
+
+    results = {'rocs': synthetic['rocs'], 'modules': synthetic['modules'], 'stages': {}}
+    for stage in opt.stages.split(','):
+        print "\n=======> Benchmark %s <=======\n"%stage
+        queue = multiprocessing.Queue()
+        p = multiprocessing.Process(target=runStage, args=(stage, synthetic, opt.nWorkers, queue))
+        p.start()
+        p.join()
+        if p.exitcode != 0:
+            results['stages'][stage] = {'error': 'exit code %d'%p.exitcode}
+        else:
+            results['stages'][stage] = queue.get()
+
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if opt.output != '':
+        with open(opt.output, 'w') as f: f.write(report + '\n')
+    print report
@@ -12,6 +12,18 @@
 #  Here a set of tools aimed to browse calibration files are collected.
 #
 #
+#  - walkDirectories(directory, depth, path): generator yielding (path, TDirectory) for
+#    the directories 'depth' levels below directory, or for the last directories of the
+#    tree if depth is None. Each folder key is read only once.
+#
+#  - isDirectoryKey(key): whether the key is a directory (a TDirectory, not any object for
+#    which IsFolder() is true such as the histos and the canvases)
+#
+#  - walkROCDirs(files) / walkFEDChannels(files): generators yielding (file, path, TDirectory)
+#    for the ROC directories and for the FED channel directories of the files. Each file
+#    is closed once all its directories have been yielded, together with the objects read
+#    from it: they must not be kept beyond that
+#
 #  - browseROCChain(files,  func, *args): opens all the files from the list
 #    and browse the directories up to the last one containing info on the ROCs 
 #    saved as canvanses or histos, 
@@ -20,6 +32,22 @@
 #    -- func:    function to execute
 #    -- *args:   arguments to pass to the function
 #
+#  - browseROCChainStreaming(files, func, *args): same as browseROCChain, one file at a time,
+#    printing the memory used after each file. Returns a list of (file, RSS, peak RSS) in kB
+#
+#  - releaseObject(obj): delete now a histo or canvas read from a file
+#
+#  - memoryUsage(): (current RSS, peak RSS) of the process in kB
+#
+#  - browseROCChainParallel(files, nWorkers, func, *args): same as browseROCChain, but the
+#    files are split by BPix/FPix shell (e.g. BPix/BPix_BmI) and the subtrees are browsed
+#    by a pool of nWorkers processes. func must return a list of results for the directory
+#    it is called in; the lists are joined in file and shell order and returned.
+#    -- files:    list of files to open and browse 
+#    -- nWorkers: number of worker processes
+#    -- func:     function to execute, defined at module level
+#    -- *args:    arguments to pass to the function
+#
 #  - browseFEDChannels(files,  func, *args): opens all the files of the list
 #    and accesses the FED directory and all the channel folders stored inside. 
 #    e.g FED26/FED26_Channel1
@@ -27,6 +55,17 @@
 #    -- func:    function to execute
 #    -- *args:   arguments to pass to the function
 #
+#  - browseFEDChannelsParallel(files, nWorkers, func, *args): calls func(channel directory, *args)
+#    for all the FED channel folders of the files, the FED folders being browsed by a pool of
+#    nWorkers processes (in this process if nWorkers is 1). gDirectory is not used and func
+#    does not write anything itself: its results are returned as a dictionary
+#    (FED, channel) -> result, e.g. {(26, 1): ..., (26, 2): ...}. None results are left out
+#    -- func:     function to execute, defined at module level, e.g.
+#       def countKeys(channel): return channel.GetListOfKeys().GetSize()
+#
+#  - fedChannelKey(path): (FED, channel) numbers of a channel folder, e.g. FED26/FED26_Channel1,
+#    None if the name of the folder does not give them (such folders are skipped and reported)
+#
 #  - browseFolder(files, dirName,  func, *args): opens all the files
 #    of the list and accesses the directory called dirName, and 
 #    executes the function func.
@@ -44,14 +83,54 @@
 
 import sys
 import os, commands
-import ROOT
+import re
+import multiprocessing
+import resource
+from calibEnv import ROOT
+from calibTrace import *
 
 def runfolder(run):
     f = int(run/1000)*1000
     return f 
 
 
-def browseROCChain(files,  func, *args):
+### Generic walker of the directory tree of a ROOT file. Every folder key is read
+### only once and the directories are yielded lazily, so the caller can stop early,
+### filter or pipeline them. gDirectory is not changed.
+
+_directoryClasses = {}
+
+def isDirectoryKey(key):
+    # TKey.IsFolder() is also true for histos and canvases, the class of the key is checked
+    # instead (once per class name)
+    className = key.GetClassName()
+    if className not in _directoryClasses:
+        cls = ROOT.TClass.GetClass(className)
+        _directoryClasses[className] = bool(cls) and cls.InheritsFrom('TDirectory')
+    return _directoryClasses[className]
+
+
+def walkDirectories(directory, depth=None, path=''):
+    # yields (path, TDirectory) of the directories found 'depth' levels below
+    # 'directory', or of the last directories of the tree (no subfolders) if depth is None
+    if(depth == 0):
+        yield path, directory
+        return
+    hasSubdirs = False
+    for key in directory.GetListOfKeys():
+        if isDirectoryKey(key):
+            hasSubdirs = True
+            subpath = path + '/' + key.GetName() if path else key.GetName()
+            count('keys read')
+            for leaf in walkDirectories(key.ReadObj(), None if depth is None else depth-1, subpath):
+                yield leaf
+    if(depth is None and not hasSubdirs):
+        yield path, directory
+
+
+def walkROCDirs(files):
+    # yields (file, path, TDirectory) for the last directory of the BPix and FPix trees,
+    # e.g  BPix/BPix_BmI/BPix_BmI_SEC4/BPix_BmI_SEC4_LYR1/BPix_BmI_SEC4_LYR1_LDR5F/BPix_BmI_SEC4_LYR1_LDR5F_MOD1
     for file in files:
         try:
             f = ROOT.TFile.Open(file)
@@ -59,44 +138,108 @@ def browseROCChain(files,  func, *args):
             print "Cannot open ", file
         else:
             print "Opening file ",  file
-            f.cd()
-            
-            ### Browse the file up to the last directory
+            count('files opened')
+            for r in f.GetListOfKeys(): # BPIX or FPIX
+                if((r.GetName()=="BPix" or r.GetName()=="FPix") and isDirectoryKey(r)):
+                    for path, d in walkDirectories(r.ReadObj(), None, r.GetName()):
+                        yield file, path, d
+            f.Close()
 
-            for r in ROOT.gDirectory.GetListOfKeys(): # BPIX or FPIX
-                if(r.ReadObj().GetName()=="BPix" or r.ReadObj().GetName()=="FPix"):
-                    if r.IsFolder():
-                        r.ReadObj().cd()
 
-                        for shell in ROOT.gDirectory.GetListOfKeys(): # BmI, BmO, BpI, BpO folders
-                            if shell.IsFolder():
-                                shell.ReadObj().cd()
-                            
-                            for disk in ROOT.gDirectory.GetListOfKeys(): # Disk folders, e.g: BmI_D1
-                                if disk.IsFolder():
-                                    disk.ReadObj().cd()
-                                    
-                                    for bld in ROOT.gDirectory.GetListOfKeys(): # Blade folders, e.g.: BmI_D1_BLD1
-                                        if bld.IsFolder():
-                                            bld.ReadObj().cd()
+def browseROCChain(files,  func, *args):
+    with timer('browseROCChain', func=func.__name__, files=len(files)):
+        for file, path, d in walkROCDirs(files):
+            d.cd()
+            func(*args)
 
-                                            for pnl in ROOT.gDirectory.GetListOfKeys(): # Panel folders, e.g.:  BmI_D1_BLD1_PNL1
-                                                if pnl.IsFolder():
-                                                    pnl.ReadObj().cd()
-                                                    
-                                                    for plq in ROOT.gDirectory.GetListOfKeys(): # Plaquette folders, e.g.:  BmI_D1_BLD1_PNL1_PLQ1
-                                                        if plq.IsFolder():
-                                                            plq.ReadObj().cd()
-                                                            
-                                                            func(*args)
 
-                                                            
+### Objects read from a file belong to its directory (histos) or to the list of canvases
+### of ROOT (canvases) and stay in memory until the file is closed, or forever. The
+### callbacks release them as soon as they are done with them, so that the memory
+### does not grow with the number of ROCs.
 
-        
+def releaseObject(obj):
+    obj.IsA().Destructor(obj)
 
 
+def memoryUsage():
+    # current RSS from /proc (Linux only, None elsewhere), peak RSS from getrusage
+    try:
+        rss = int(open('/proc/self/statm').read().split()[1])*resource.getpagesize()/1024
+    except IOError:
+        rss = None
+    return rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
 
-def browseFEDChannels(files,  func, *args):
+
+def browseROCChainStreaming(files, func, *args):
+    report = []
+    for file in files:
+        with timer('browse file', func=func.__name__, file=os.path.basename(file)):
+            for f, path, d in walkROCDirs([file]):
+                d.cd()
+                func(*args)
+        rss, peak = memoryUsage()
+        print "Memory after %s: RSS %s kB, peak RSS %d kB"%(os.path.basename(file), rss, peak)
+        report.append((file, rss, peak))
+    return report
+
+
+
+### Parallel version of browseROCChain: the unit of work is a shell subtree of a file
+
+def listROCSubtrees(file):
+    subtrees = []
+    try:
+        f = ROOT.TFile.Open(file)
+    except IOError:
+        print "Cannot open ", file
+    else:
+        for r in f.GetListOfKeys(): # BPIX or FPIX
+            if((r.GetName()=="BPix" or r.GetName()=="FPix") and isDirectoryKey(r)):
+                for shell in r.ReadObj().GetListOfKeys(): # BmI, BmO, BpI, BpO folders
+                    if isDirectoryKey(shell):
+                        subtrees.append(r.GetName() + '/' + shell.GetName())
+        f.Close()
+    return subtrees
+
+
+def _browseSubtree(task):
+    file, subtree, func, args = task
+    results = []
+    f = ROOT.TFile.Open(file)
+    print "Browsing ", file, subtree
+    for path, d in walkDirectories(f.GetDirectory(subtree), None, subtree):
+        d.cd()
+        res = func(*args)
+        if res: results.extend(res)
+    f.Close()
+    return results
+
+
+def browseROCChainParallel(files, nWorkers, func, *args):
+    tasks = []
+    for file in files:
+        for subtree in listROCSubtrees(file):
+            tasks.append((file, subtree, func, args))
+    print "Browsing %d subtrees with %d workers"%(len(tasks), nWorkers)
+    pool = multiprocessing.Pool(nWorkers)
+    try:
+        # map keeps the order of the tasks, so the output does not depend on the scheduling
+        with timer('browseROCChainParallel', func=func.__name__, subtrees=len(tasks), workers=nWorkers):
+            results = pool.map(_browseSubtree, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+    merged = []
+    for res in results:
+        merged.extend(res)
+    return merged
+
+
+
+
+def walkFEDChannels(files):
+    # yields (file, path, TDirectory) for the channel folders, e.g FED26/FED26_Channel1
     for file in files:
         try:
             f = ROOT.TFile.Open(file)
@@ -104,21 +247,83 @@ def browseFEDChannels(files,  func, *args):
             print "Cannot open ", file
         else:
             print "Opening file ",  file
-            f.cd()
-            
-            ### Browse the file up to the last directory
+            count('files opened')
+            for fedDir in f.GetListOfKeys(): # access FED folder
+                if(fedDir.GetName().startswith("FED") and isDirectoryKey(fedDir)):
+                    for path, ch in walkDirectories(fedDir.ReadObj(), 1, fedDir.GetName()): # FED channels
+                        yield file, path, ch
+            f.Close()
+
+
+def browseFEDChannels(files,  func, *args):
+    for file, path, ch in walkFEDChannels(files):
+        ch.cd()
+        func(*args)
 
-            for fedDir in ROOT.gDirectory.GetListOfKeys(): # access FED folder
-                if(fedDir.ReadObj().GetName().startswith("FED")):
-                    if fedDir.IsFolder():
-                        fedDir.ReadObj().cd()
 
-                        for ch in ROOT.gDirectory.GetListOfKeys(): # FED channels
-                            if ch.IsFolder():
-                                ch.ReadObj().cd()
-                                func(*args)
+### Parallel version of browseFEDChannels: the unit of work is a FED folder of a file
+
+_channelPattern = re.compile(r'FED_?(\d+)_Channel_?(\d+)$', re.IGNORECASE)
+
+
+def fedChannelKey(path):
+    m = _channelPattern.search(path)
+    if m is None: return None
+    return int(m.group(1)), int(m.group(2))
+
+
+def listFEDs(file):
+    feds = []
+    try:
+        f = ROOT.TFile.Open(file)
+    except IOError:
+        print "Cannot open ", file
+    else:
+        feds = [k.GetName() for k in f.GetListOfKeys() if k.GetName().startswith("FED") and isDirectoryKey(k)]
+        f.Close()
+    return feds
+
+
+def _browseFED(task):
+    file, fed, func, args = task
+    results = []
+    f = ROOT.TFile.Open(file)
+    count('files opened')
+    for path, ch in walkDirectories(f.GetDirectory(fed), 1, fed): # FED channels
+        key = fedChannelKey(path)
+        if key is None:
+            print "Skipping %s in %s: not a FED channel folder"%(path, file)
+            continue
+        res = func(ch, *args)
+        if res is not None: results.append((key, res))
+    f.Close()
+    return results
+
+
+def browseFEDChannelsParallel(files, nWorkers, func, *args):
+    tasks = []
+    for file in files:
+        for fed in listFEDs(file):
+            tasks.append((file, fed, func, args))
+    print "Browsing %d FED folders with %d workers"%(len(tasks), nWorkers)
+    table = {}
+    with timer('browseFEDChannelsParallel', func=func.__name__, feds=len(tasks), workers=nWorkers):
+        if nWorkers > 1:
+            pool = multiprocessing.Pool(nWorkers)
+            try:
+                # the results are keyed by channel, the order the FEDs end in does not matter
+                for results in pool.imap_unordered(_browseFED, tasks):
+                    table.update(results)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for task in tasks:
+                table.update(_browseFED(task))
+    count('FED channels browsed', len(table))
+    return table
+
 
-                                                      
 
 def browseFolder(files, treeName,  func, *args):
     for file in files:
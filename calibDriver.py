@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# **************************************************************************************
+#
+#  Description: Resident driver of the threshold minimization. It runs the iterations
+#               of SCurveSR.py and PixelAlive.py one after the other in the same process,
+#               so that ROOT is loaded once and the parsed configurations.txt, the module
+#               lists of the detconfig files and the iteration history stay in memory.
+#
+#  Start the driver (in the working directory of the procedure, where failed_N.txt
+#  and delta_N.txt are written):
+#               python calibDriver.py --serve &
+#
+#  Send it the iterations, with the same options as the scripts:
+#               python calibDriver.py scurve -r 'VcThrVcalRunNumber' -i 0
+#               python calibDriver.py scurve -r 'SCurveSmartRangeRunNumber' -i N --makeNewDac 1
+#               python calibDriver.py pixelalive -r 'PixelAliveRunNumber' -i N --makeNewDac 1
+#               python calibDriver.py status
+#               python calibDriver.py stop
+#
+#  The output of the iteration is sent back to the client, which exits with the status
+#  of the iteration. The commands run one at a time, in the order they arrive, in the
+#  current directory of the client. The output of the external commands (PixelAnalysis.exe,
+#  PixelConfigDBCmd.exe) stays in their log files and in the terminal of the driver.
+#  The driver listens on a local socket, by default calibDriver.sock in the current
+#  directory (--socket to change it).
+#
+# **************************************************************************************
+
+
+import sys
+import os
+import json
+import time
+import socket
+import optparse
+import traceback
+import SocketServer
+
+
+socketName = 'calibDriver.sock'
+statusTag = '#calibDriver status '
+
+
+class DriverHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        status = self.server.execute(request['argv'], request['cwd'], self.wfile)
+        self.wfile.write('%s%d\n'%(statusTag, status))
+
+
+class CalibDriver(SocketServer.UnixStreamServer):
+    def __init__(self, filename):
+        SocketServer.UnixStreamServer.__init__(self, filename, DriverHandler)
+        # imported once, here, for all the requests: ROOT and its libraries take seconds to load
+        import ROOT
+        ROOT.gROOT.SetBatch(True)
+        import calibIterations, configKeys, detConfigIndex
+        self.calib = calibIterations
+        self.caches = (configKeys._cache, detConfigIndex._cache)
+        self.histories = {}
+        self.started = time.time()
+        self.done = []
+        self.stopped = False
+
+    def execute(self, argv, cwd, out):
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = out
+        start = time.time()
+        status = 0
+        try:
+            os.chdir(cwd)
+            status = self.command(argv)
+        except SystemExit, e:
+            # parser errors and missing files of the iteration
+            if e.code is None: status = 0
+            elif isinstance(e.code, int): status = e.code
+            else:
+                print e.code
+                status = 1
+        except Exception:
+            traceback.print_exc(file=out)
+            status = 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        if argv and argv[0] in ('scurve', 'pixelalive'):
+            self.done.append((' '.join(argv), status, time.time()-start))
+            print "%s -> status %d in %.1f s"%(' '.join(argv), status, time.time()-start)
+        return status
+
+    def history(self):
+        # one iteration history per working directory, as the scripts
+        cwd = os.getcwd()
+        if cwd not in self.histories: self.histories[cwd] = self.calib.IterationHistory()
+        return self.histories[cwd]
+
+    def command(self, argv):
+        if not argv: raise SystemExit('No command given')
+        if argv[0] == 'scurve':
+            self.calib.runSCurveIteration(self.calib.parseSCurveOptions(argv[1:]), self.history())
+        elif argv[0] == 'pixelalive':
+            self.calib.runPixelAliveIteration(self.calib.parsePixelAliveOptions(argv[1:]), self.history())
+        elif argv[0] == 'status':
+            self.printStatus()
+        elif argv[0] == 'stop':
+            print "Stopping the driver"
+            self.stopped = True
+        else:
+            raise SystemExit('Unknown command %s, use scurve, pixelalive, status or stop'%argv[0])
+        return 0
+
+    def printStatus(self):
+        print "Driver pid %d, running since %.0f s"%(os.getpid(), time.time()-self.started)
+        print "Cached configurations files: ", len(self.caches[0])
+        print "Cached detconfig indexes: ", len(self.caches[1])
+        print "Iterations run:"
+        for command, status, seconds in self.done:
+            print "  %-60s status %d  %.1f s"%(command, status, seconds)
+
+    def serve(self):
+        while not self.stopped:
+            self.handle_request()
+        self.server_close()
+        os.remove(self.server_address)
+
+
+def connect(filename):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(filename)
+    return s
+
+
+def sendCommand(filename, argv):
+    s = connect(filename)
+    s.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}) + '\n')
+    status = 1
+    for line in s.makefile('r'):
+        if line.startswith(statusTag): status = int(line[len(statusTag):])
+        else: sys.stdout.write(line)
+    s.close()
+    return status
+
+
+if __name__ == '__main__':
+    usage = 'usage: %prog --serve | %prog scurve|pixelalive [options of the script] | %prog status|stop'
+    parser = optparse.OptionParser(usage)
+    parser.disable_interspersed_args()
+    parser.add_option('', '--serve', dest='serve', default=False, action='store_true', help='Start the driver')
+    parser.add_option('', '--socket', dest='socket', type='string', default=socketName, help='Socket of the driver. Default is calibDriver.sock')
+    (opt, args) = parser.parse_args()
+
+    filename = os.path.abspath(opt.socket)
+    if opt.serve:
+        if os.path.exists(filename):
+            try:
+                connect(filename).close()
+                sys.exit('A driver is already listening on %s'%filename)
+            except socket.error:
+                # left over by a driver that did not stop cleanly
+                os.remove(filename)
+        driver = CalibDriver(filename)
+        print "Driver listening on ", filename
+        driver.serve()
+    else:
+        if not args:
+            parser.error('Please give a command: scurve, pixelalive, status or stop')
+        try:
+            sys.exit(sendCommand(filename, args))
+        except socket.error, e:
+            sys.exit('Cannot reach the driver on %s (%s), start it with --serve'%(filename, e))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Environment of the calibration analysis: the folders and files of the pixel online
+#  software, resolved from PIXELCONFIGURATIONBASE, POS_OUTPUT_DIRS and BUILD_HOME only
+#  when they are needed, and ROOT, imported only on first use. Tools that do not read
+#  histograms (dac settings, iteration summaries, ...) thus start without ROOT and
+#  without the variables they do not use.
+#
+#  - CalibConfig(configurationBase, outputDirs, buildHome): paths of the analysis, each
+#    argument left to None is taken from the environment variable when first needed
+#    -- dacdir, detconfigdir, confpath: dac and detconfig folders, configurations.txt
+#    -- runDir: output folder of the runs (POS_OUTPUT_DIRS)
+#    -- runpath: PixelRun folder, where the maps of the ROCs are written
+#    -- pixelAnalysisExe, config, configPixelAlive: PixelAnalysis.exe and its SCurve and
+#       PixelAlive configurations
+#
+#  - calibConfig: the configuration used by the analysis functions, calibConfig.set(...)
+#    changes it, e.g. calibConfig.set(outputDirs='/data/runs')
+#
+#  - ROOT: stand-in for the ROOT module, the real one is imported on the first
+#    attribute access (ROOT.TFile, ROOT.gDirectory, ...)
+#
+#  - rootLoaded(): True once ROOT has been imported
+#
+# ***************************************************************************************************************
+
+
+import sys
+import os
+
+
+#dacdir      = os.environ['PIXELCONFIGURATIONBASE'] +'dac/'
+#detconfigdir      = os.environ['PIXELCONFIGURATIONBASE'] +'/detconfig/'
+#confpath    = os.environ['PIXELCONFIGURATIONBASE'] +"/configurations.txt"
+#runDir    = os.environ['POS_OUTPUT_DIRS']
+#pixelAnalysisExe   = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/bin/linux/x86_64_slc5/PixelAnalysis.exe'
+#config             = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/configuration/SCurveAnalysis_FPix.xml'
+#runpath            = os.environ['BUILD_HOME'] + '/pixel/PixelRun/'
+#configPixelAlive   = os.environ['BUILD_HOME'] + '/pixel/PixelAnalysisTools/test/configuration/PixelAliveAnalysis.xml'
+#runpath     = os.environ['HOME'] + '/run/'
+
+
+class CalibConfig(object):
+    def __init__(self, configurationBase=None, outputDirs=None, buildHome=None):
+        self.set(configurationBase, outputDirs, buildHome)
+
+    def set(self, configurationBase=None, outputDirs=None, buildHome=None):
+        self.configurationBase = configurationBase
+        self.outputDirs = outputDirs
+        self.buildHome = buildHome
+
+    def _get(self, value, name):
+        if value is not None: return value
+        if name not in os.environ:
+            raise EnvironmentError('%s is not set: source the environment of the pixel online software first'%name)
+        return os.environ[name]
+
+    @property
+    def dacdir(self):
+        return self._get(self.configurationBase, 'PIXELCONFIGURATIONBASE') + '/dac/'
+
+    @property
+    def detconfigdir(self):
+        return self._get(self.configurationBase, 'PIXELCONFIGURATIONBASE') + '/detconfig/'
+
+    @property
+    def confpath(self):
+        return self._get(self.configurationBase, 'PIXELCONFIGURATIONBASE') + '/configurations.txt'
+
+    @property
+    def runDir(self):
+        return self._get(self.outputDirs, 'POS_OUTPUT_DIRS')
+
+    @property
+    def runpath(self):
+        return self._get(self.buildHome, 'BUILD_HOME') + '/pixel/PixelRun/'
+
+    @property
+    def pixelAnalysisExe(self):
+        return self._get(self.buildHome, 'BUILD_HOME') + '/pixel/PixelAnalysisTools/test/bin/linux/i386_slc5/PixelAnalysis.exe'
+
+    @property
+    def config(self):
+        return self._get(self.buildHome, 'BUILD_HOME') + '/pixel/PixelAnalysisTools/test/configuration/SCurveAnalysis_BaseExample.xml'
+
+    @property
+    def configPixelAlive(self):
+        return self._get(self.buildHome, 'BUILD_HOME') + '/pixel/PixelAnalysisTools/test/configuration/PixelAliveAnalysis_BaseExample.xml'
+
+
+calibConfig = CalibConfig()
+
+
+class LazyROOT:
+    # the attributes are not cached: some of them (gDirectory, gPad, ...) change
+    # while the analysis runs
+    def __getattr__(self, name):
+        if name.startswith('__'): raise AttributeError(name)
+        import ROOT
+        return getattr(ROOT, name)
+
+
+ROOT = LazyROOT()
+
+
+def rootLoaded():
+    return 'ROOT' in sys.modules
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Options and steps of the threshold minimization iterations, shared by the scripts
+#  (SCurveSR.py, PixelAlive.py) and by the resident driver (calibDriver.py), which runs
+#  several iterations in the same process.
+#
+#  - scurveParser() / pixelAliveParser(): option parsers of SCurveSR.py and PixelAlive.py
+#
+#  - parseSCurveOptions(argv) / parsePixelAliveOptions(argv): parse and check the options
+#
+#  - runSCurveIteration(opt, history): iteration 0 (VcThr-Vcal fits) or iteration N
+#    (SCurveSmartRange analysis and new dac settings) of the threshold minimization
+#
+#  - runPixelAliveIteration(opt, history): iteration with PixelAliveAllEnabled
+#    -- history: IterationHistory to record the iteration in, a new one if None
+#    With --trace, the timers and counters of the iteration are written as a Chrome
+#    trace (see calibTrace.py)
+#    The results of the ROCs (thresholds, dead pixels, VcThr(Vcal) fits) are added to the
+#    trend store of the runs, unless --noTrends is given (see trendStore.py)
+#
+#  - compareDeadPixelMaps(opt, maps): print the pixels which died or came back since the
+#    PixelAlive run --compareRun
+#
+#  - fitVcalVcThrMap(opt, files) / checkThresholds(opt, path, files, skip): the VcThr-Vcal
+#    fits and the threshold checks, with the implementation chosen by the options. With
+#    --savePlots True, the fit plots are rendered after the fits (see fitPlots.py)
+#
+# ***************************************************************************************************************
+
+
+import sys
+import os
+import optparse
+from browseCalibFiles import *
+from analysisCalibFuncs import *
+from calibTrace import *
+
+
+def scurveParser():
+    usage = 'usage: %prog -r runNum'
+    parser = optparse.OptionParser(usage)
+    parser.add_option('-r', '--run', dest='run', type='int', help='Number of the run to analyze')
+    parser.add_option('-i', '--iter', dest='iter', type='int', help='Iteration')
+    parser.add_option('-k', '--key', dest='key', type='int', help='Starting Key Number')
+    #parser.add_option('-d', '--dac', dest='dac', type='int', help='Starting dac Number')
+    parser.add_option('-s', '--savePlots', dest='savePlots', default='False', help='Set this flag to True to save fits to graphs as pdf')
+    parser.add_option('', '--ignore', dest='ignore', default='False', help='IgnoreError')
+    parser.add_option("-m","--modality",dest="mod",type="string",default="minimize",help="Modality of dac setting: \"minimize\" for minimizing thresholds and \"increase\" to only increase thresholds of failing rocs. Default is \"minimize\"")
+    parser.add_option("-o","--outputFile",dest="output",type="string",default="failed",help="Name of the output file containing the list of failing rocs. Default is failed.txt")
+    parser.add_option("-d","--deltaFile",dest="delta",type="string",default="delta",help="Name of the output file containing the deltaVcThr. Default is delta.txt")
+    parser.add_option("","--makeNewDac",dest="makeNewDac",type="int",default=0,help="If 1, new dac is created. Default is 0.")
+    parser.add_option("-j","--nWorkers",dest="nWorkers",type="int",default=1,help="Number of worker processes used to browse the ROOT files. Default is 1.")
+    parser.add_option("","--nAnalysis",dest="nAnalysis",type="int",default=1,help="Number of PixelAnalysis.exe to run at the same time on FED shards of the run. Default is 1 (whole run at once)")
+    parser.add_option("","--batchFit",dest="batchFit",default=False,action="store_true",help="Iteration 0: fit all the ROCs at once with NumPy instead of one MINUIT fit per ROC")
+    parser.add_option("","--summary",dest="summary",default=False,action="store_true",help="Check the thresholds through the columnar summary of the run (thresholdSummary.npz), reused if already there")
+    parser.add_option("","--minMeanThr",dest="minMeanThr",type="float",default=35,help="ROCs with mean threshold below this value are failing. Default is 35 (only with --summary)")
+    parser.add_option("","--thrRange",dest="thrRange",type="string",default="30,120",help="Range of good pixel thresholds. Default is 30,120 (only with --summary)")
+    parser.add_option("","--maxOutOfRange",dest="maxOutOfRange",type="int",default=2,help="ROCs with more pixels out of the threshold range are failing. Default is 2 (only with --summary)")
+    parser.add_option("","--useIndex",dest="useIndex",default=False,action="store_true",help="Read the histograms through the run index (rocIndex.sqlite in the run folder), built on first access")
+    parser.add_option("","--stream",dest="stream",default=False,action="store_true",help="Browse the files one at a time and print the memory used after each one")
+    parser.add_option("","--trace",dest="trace",type="string",default="",help="Write the timers and counters of the iteration in this file (Chrome trace JSON). Default is no trace")
+    parser.add_option("","--profileStage",dest="profileStage",type="string",default="",help="With --trace, run the timer with this name (e.g. browseROCChain, writeNewDacVersion) under cProfile")
+    parser.add_option("","--noTrends",dest="trends",default=True,action="store_false",help="Do not record the results of the ROCs in the trend store ($POS_OUTPUT_DIRS/trendStore)")
+    parser.add_option("","--plotFormat",dest="plotFormat",type="choice",choices=["pdf","png"],default="pdf",help="With --savePlots True: \"pdf\" for one multi-page PDF per module or sector, \"png\" for one thumbnail per ROC. Default is pdf")
+    parser.add_option("","--plotGroup",dest="plotGroup",type="choice",choices=["module","sector"],default="module",help="With --savePlots True: group the plots by \"module\" or \"sector\". Default is module")
+    parser.add_option("","--plotFailing",dest="plotFailing",default=False,action="store_true",help="With --savePlots True: plot only the ROCs with chi2/NDF above 10")
+    parser.add_option("","--plotWorkers",dest="plotWorkers",type="int",default=4,help="Number of worker processes rendering the plots. Default is 4")
+    parser.add_option("","--incremental",dest="incremental",default=False,action="store_true",help="Do not check again the ROCs settled at the previous iterations and carry over their module files")
+    return parser
+
+
+def pixelAliveParser():
+    usage = 'usage: %prog -r runNum'
+    parser = optparse.OptionParser(usage)
+    parser.add_option('-r', '--run', dest='run', type='int', help='Number of the run to analyze')
+    parser.add_option('-i', '--iter', dest='iter', type='int', help='Iteration')
+    parser.add_option('-k', '--key', dest='key', type='int', help='Starting Key Number')
+    #parser.add_option('-d', '--dac', dest='dac', type='int', help='Starting dac Number')
+    parser.add_option('-s', '--savePlots', dest='savePlots', default='False', help='Set this flag to True to save fits to graphs as pdf')
+    parser.add_option("-m","--modality",dest="mod",type="string",default="increase",help="Modality of dac setting: \"minimize\" for minimizing thresholds and \"increase\" to only increase thresholds of failing rocs. Default is \"increase\"")
+    parser.add_option("-o","--outputFile",dest="output",type="string",default="failedAlive",help="Name of the output file containing the list of failing rocs. Default is failed.txt")
+    parser.add_option("-d","--deltaFile",dest="delta",type="string",default="deltaAlive",help="Name of the output file containing the deltaVcThr. Default is delta.txt")
+    parser.add_option("-e","--exclude",dest="exclude",type="string",default="",help="List of the ROCs you want to exclude from the iterative procedure")
+    parser.add_option("","--skipFPix",dest="skipFPix",default=False,action="store_true",help="Skip FPix")
+    parser.add_option("","--skipBPix",dest="skipBPix",default=False,action="store_true",help="Skip BPix")
+    parser.add_option("","--makeNewDac",dest="makeNewDac",type="int",default=0,help="If 1, new dac is created. Default is 0.")
+    parser.add_option("-j","--nWorkers",dest="nWorkers",type="int",default=1,help="Number of worker processes used to browse the ROOT files. Default is 1.")
+    parser.add_option("","--nAnalysis",dest="nAnalysis",type="int",default=1,help="Number of PixelAnalysis.exe to run at the same time on FED shards of the run. Default is 1 (whole run at once)")
+    parser.add_option("","--useIndex",dest="useIndex",default=False,action="store_true",help="Read the histograms through the run index (rocIndex.sqlite in the run folder), built on first access")
+    parser.add_option("","--maxDeadPixels",dest="maxDeadPixels",type="int",default=10,help="Maximum number of dead pixels per ROC. Default is 10.")
+    parser.add_option("","--deadMaps",dest="deadMaps",default=False,action="store_true",help="Save the dead pixel maps of all the ROCs in the run folder (deadPixelMaps.npz)")
+    parser.add_option("","--compareRun",dest="compareRun",type="int",default=None,help="With --deadMaps, print the pixels which died or came back since this PixelAlive run (its dead pixel maps must have been saved)")
+    parser.add_option("","--stream",dest="stream",default=False,action="store_true",help="Browse the files one at a time and print the memory used after each one")
+    parser.add_option("","--trace",dest="trace",type="string",default="",help="Write the timers and counters of the iteration in this file (Chrome trace JSON). Default is no trace")
+    parser.add_option("","--profileStage",dest="profileStage",type="string",default="",help="With --trace, run the timer with this name (e.g. browseROCChain, writeNewDacVersion) under cProfile")
+    parser.add_option("","--noTrends",dest="trends",default=True,action="store_false",help="Do not record the results of the ROCs in the trend store ($POS_OUTPUT_DIRS/trendStore)")
+    return parser
+
+
+def parseSCurveOptions(argv):
+    parser = scurveParser()
+    (opt, args) = parser.parse_args(argv)
+    if opt.run is None:
+        parser.error('Please define the run number')
+    elif opt.iter is None:
+        parser.error('Please define the iteration number')
+    return opt
+
+
+def parsePixelAliveOptions(argv):
+    parser = pixelAliveParser()
+    (opt, args) = parser.parse_args(argv)
+    if opt.run is None:
+        parser.error('Please define the run number')
+    elif opt.iter is None:
+        parser.error('Please define the iteration number')
+    elif opt.iter == 0:
+        parser.error('First iteration must be 1 and not 0')
+    return opt
+
+
+def removeIterationFiles(opt):
+    cmdrm = ('rm '+os.getcwd()+ '/'+opt.output+'_'+str(opt.iter)+'.txt' )
+    print cmdrm
+    os.system(cmdrm)
+    cmdrm = ('rm '+os.getcwd()+ '/'+opt.delta+'_'+str(opt.iter)+'.txt' )
+    print cmdrm
+    os.system(cmdrm)
+
+
+def scurveIteration(opt, history):
+    path = '%s/Run_%s/Run_%d/'%(calibConfig.runDir, runfolder(opt.run), opt.run)
+    print "Current directory is ", os.getcwd()
+    print "Directory to analyze is ", path
+
+    filename = '2DEfficiency'
+    if(opt.iter != 0): filename = 'SCurve'
+    files = []
+
+    ##First iteration creates the map VcThr-Vcal
+    if(opt.iter==0):
+        cmdrm = ('rm '+ calibConfig.runpath + 'mapRocVcalVcThr.txt')
+        print cmdrm
+        os.system(cmdrm)
+        files = getRunCatalog().runFiles(opt.run, filename, "root")
+        if len(files)<1:
+            sys.exit('Could not find %s file'%filename)
+        else:
+            with timer('fitVcalVcThr'):
+                fitVcalVcThrMap(opt, files)
+            #initThresholdMinimizationSCurve(path, opt.iter)
+
+    elif(opt.iter==100):
+        print 'Creating newROCList'
+        createROCList(path)
+    ## Iterations with SCurveSR
+    else:
+        removeIterationFiles(opt)
+        print path
+
+        with timer('RunSCurveSmartRangeAnalysis'):
+            RunSCurveSmartRangeAnalysis(opt.run, opt.nAnalysis)
+        print sorted(getRunCatalog().entries(opt.run))
+        files = getRunCatalog().runFiles(opt.run, filename, "root")
+        if len(files)<1:
+            sys.exit('Could not find %s file'%filename)
+        else:
+            skip = None
+            if(opt.incremental):
+                if history is None: history = IterationHistory()
+                skip = frozenset(convergedRocs(opt.delta, opt.iter, opt.mod, history))
+                print "Incremental iteration: %d ROCs already settled are not checked"%len(skip)
+            with timer('checkROCthr', iteration=opt.iter):
+                checkThresholds(opt, path, files, skip)
+            with timer('createNewDACsettings', iteration=opt.iter):
+                createNewDACsettings(path, opt.iter, opt.delta, opt.output, opt.mod, opt.makeNewDac, history=history, incremental=opt.incremental)
+
+    if(opt.makeNewDac==0): print "N.B: new dac settings were not saved -> set makeNewDac to ture if you want to save them"
+
+
+def fitVcalVcThrMap(opt, files):
+    if(opt.batchFit): fitVcalVcThrBatched(files, opt.savePlots, opt.ignore)
+    elif(opt.nWorkers > 1): fitVcalVcThrParallel(files, opt.nWorkers, opt.savePlots, opt.ignore)
+    elif(opt.stream): browseROCChainStreaming(files, fitVcalVcThr, opt.savePlots, opt.ignore)
+    else: browseROCChain(files, fitVcalVcThr, opt.savePlots, opt.ignore)
+    # plots of the fits, once the map is written
+    if(opt.savePlots == 'True'):
+        renderFitPlots(takeFitPlots(), opt.plotFormat, opt.plotGroup, opt.plotFailing, opt.plotWorkers)
+
+
+def checkThresholds(opt, path, files, skip):
+    if(opt.summary):
+        minThr, maxThr = [float(t) for t in opt.thrRange.split(',')]
+        index = None
+        if(opt.useIndex): index = RocIndex(path, files)
+        checkROCthrSummary(files, path, opt.iter, (opt.minMeanThr, minThr, maxThr, opt.maxOutOfRange), index, skip)
+    elif(opt.useIndex): checkROCthrIndexed(RocIndex(path, files), opt.iter, skip)
+    elif(opt.nWorkers > 1): checkROCthrParallel(files, opt.nWorkers, path, opt.iter, skip)
+    elif(opt.stream): browseROCChainStreaming(files, checkROCthr, path, opt.iter, skip)
+    else: browseROCChain(files, checkROCthr, path, opt.iter, skip)
+
+
+def pixelAliveIteration(opt, history):
+    path = '%s/Run_%s/Run_%d/'%(calibConfig.runDir, runfolder(opt.run), opt.run)
+    print "Current directory is ", os.getcwd()
+    print "Directory to analyze is ", path
+
+    filename = "PixelAlive"
+    files = []
+
+    ## Iterations with PixelAlive
+    removeIterationFiles(opt)
+    print path
+
+    # --- Analyze PixelAlive run
+    #RunPixelAliveAnalysis(opt.run, opt.nAnalysis)
+
+    # --- Check the efficiency of all ROCS and make a list of failed rocs (i.e. rocs with more than maxDeadPixels pixels)
+    files = getRunCatalog().runFiles(opt.run, filename, "root")
+    if len(files)<1:
+        sys.exit('Could not find %s file'%filename)
+    else:
+        index = None
+        if(opt.useIndex): index = RocIndex(path, files)
+        mapsFile = path + mapsName if opt.deadMaps else None
+        maps = CheckEfficiency(files, opt.output, opt.iter, opt.maxDeadPixels,opt.skipFPix, opt.skipBPix, opt.exclude, opt.nWorkers, index, opt.stream, mapsFile)
+        if(maps is not None and opt.compareRun is not None): compareDeadPixelMaps(opt, maps)
+        # --- Prepare new dac settings (change VcThr)
+        with timer('createNewDACsettings', iteration=opt.iter):
+            createNewDACsettings(path, opt.iter, opt.delta, opt.output, opt.mod, opt.makeNewDac, history=history)
+
+    if(opt.makeNewDac==0): print "N.B: new dac settings were not saved -> set makeNewDac to ture if you want to save them"
+
+
+def compareDeadPixelMaps(opt, maps):
+    previous = '%s/Run_%s/Run_%d/%s'%(calibConfig.runDir, runfolder(opt.compareRun), opt.compareRun, mapsName)
+    if not os.path.isfile(previous):
+        print "No dead pixel maps for run %d, nothing to compare"%opt.compareRun
+        return
+    changes = DeadPixelMaps.load(previous).diff(maps, readExcludedRocs(opt.exclude))
+    for rocname, died, back in changes:
+        print "%-45s %4d dead %4d back"%(rocname, len(died), len(back))
+    print "Since run %d: %d ROCs changed, %d pixels died, %d came back"%(opt.compareRun, len(changes),
+        sum(len(c[1]) for c in changes), sum(len(c[2]) for c in changes))
+
+
+def runSCurveIteration(opt, history=None):
+    if(opt.trace): startTrace(opt.trace, opt.profileStage or None)
+    try:
+        if(opt.trends): startTrends()
+        with timer('SCurve iteration', run=opt.run, iteration=opt.iter):
+            scurveIteration(opt, history)
+        if(opt.trends):
+            with timer('flushTrends'):
+                flushTrends(opt.run)
+    finally:
+        # nothing left for the next iteration of the driver
+        stopTrends()
+        takeFitPlots()
+        stopTrace()
+
+
+def runPixelAliveIteration(opt, history=None):
+    if(opt.trace): startTrace(opt.trace, opt.profileStage or None)
+    try:
+        if(opt.trends): startTrends()
+        with timer('PixelAlive iteration', run=opt.run, iteration=opt.iter):
+            pixelAliveIteration(opt, history)
+        if(opt.trends):
+            with timer('flushTrends'):
+                flushTrends(opt.run)
+    finally:
+        # nothing left for the next iteration of the driver
+        stopTrends()
+        stopTrace()
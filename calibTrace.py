@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Instrumentation of the calibration analysis: nested timers and counters (files opened,
+#  keys read, ROCs evaluated, bytes written, time of the external processes, ...).
+#  Nothing is recorded unless a trace is started, and then the timers and counters are
+#  written at the end as a Chrome trace (JSON, open it in chrome://tracing or Perfetto).
+#  When the trace is off, timer() returns a shared do-nothing object and count() returns
+#  straight away, so the instrumentation can stay in the loops over the ROCs.
+#  Only the process which started the trace is recorded, not the workers of the pools.
+#
+#  - startTrace(filename, profileStage): start recording, the trace is written to filename
+#    -- profileStage: optional name of a timer to run under cProfile, the statistics
+#       are written to filename.<profileStage>.prof
+#
+#  - stopTrace(): write the trace (and the profile) and stop recording
+#
+#  - timer(name, **args): context manager timing the block, e.g.
+#       with timer('checkROCthr', iteration=3): ...
+#
+#  - externalTimer(name, **args): same as timer for a block running external processes
+#    (PixelAnalysis.exe, ...), their wall and CPU time are added to the counters
+#
+#  - count(name, n): add n to the counter name
+#
+#  - traceEnabled(): True while recording
+#
+# ***************************************************************************************************************
+
+
+import os
+import time
+import json
+import resource
+import threading
+import cProfile
+
+
+_enabled = False
+_filename = None
+_start = 0.
+_events = []
+_counters = {}
+_lock = threading.Lock()
+_profileStage = None
+_profiler = None
+_profileDepth = 0
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_noTimer = _NoTimer()
+
+
+class _Timer:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        global _profileDepth
+        if self.name == _profileStage:
+            if _profileDepth == 0: _profiler.enable()
+            _profileDepth += 1
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        global _profileDepth
+        end = time.time()
+        if self.name == _profileStage:
+            _profileDepth -= 1
+            if _profileDepth == 0: _profiler.disable()
+        event = {'name': self.name, 'ph': 'X', 'ts': (self.start-_start)*1e6, 'dur': (end-self.start)*1e6,
+                 'pid': os.getpid(), 'tid': threading.current_thread().ident}
+        if self.args: event['args'] = self.args
+        with _lock:
+            _events.append(event)
+        return False
+
+
+class _ExternalTimer(_Timer):
+    def __enter__(self):
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.cpu = children.ru_utime + children.ru_stime
+        return _Timer.__enter__(self)
+
+    def __exit__(self, *exc):
+        _Timer.__exit__(self, *exc)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        count('external process wall s', time.time()-self.start)
+        count('external process CPU s', children.ru_utime + children.ru_stime - self.cpu)
+        return False
+
+
+def timer(name, **args):
+    if not _enabled: return _noTimer
+    return _Timer(name, args)
+
+
+def externalTimer(name, **args):
+    if not _enabled: return _noTimer
+    return _ExternalTimer(name, args)
+
+
+def count(name, n=1):
+    if not _enabled: return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def traceEnabled():
+    return _enabled
+
+
+def startTrace(filename, profileStage=None):
+    global _enabled, _filename, _start, _events, _counters, _profileStage, _profiler, _profileDepth
+    _filename = filename
+    _start = time.time()
+    _events = []
+    _counters = {}
+    _profileStage = profileStage
+    _profiler = cProfile.Profile() if profileStage else None
+    _profileDepth = 0
+    _enabled = True
+
+
+def stopTrace():
+    global _enabled
+    if not _enabled: return
+    _enabled = False
+    end = (time.time()-_start)*1e6
+    # counters are shown as counter tracks with their final value
+    counters = [{'name': name, 'ph': 'C', 'ts': end, 'pid': os.getpid(), 'args': {name: value}}
+                for name, value in sorted(_counters.items())]
+    with open(_filename, 'w') as f:
+        json.dump({'traceEvents': _events + counters, 'displayTimeUnit': 'ms', 'counters': _counters}, f)
+    print "Trace written in ", _filename
+    for name, value in sorted(_counters.items()):
+        print "  %-35s %s"%(name, value)
+    if _profiler is not None:
+        _profiler.dump_stats('%s.%s.prof'%(_filename, _profileStage))
+        print "Profile of %s written in %s.%s.prof"%(_profileStage, _filename, _profileStage)
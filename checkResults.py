@@ -6,47 +6,73 @@
 #          decosa@cern.ch
 #          March/2014
 #
-#  test.py
-#  Usage: test.py -r runNum -i iter -k key 
-#  Description: Script to run Threshold Minimization
-#               Procedure with SCurveCustomRange
-#
-#  Iteration 0: python test.py -r 'runVcThrVcal' -i 0 -d dac 
+#  checkResults.py
+#  Usage: checkResults.py -i iter [-d deltaFile] [--roc rocName]
+#  Description: Print the number of ROCs per delta VcThr of an iteration of the
+#               Threshold Minimization, read from the iteration store
+#               (iterationHistory.sqlite) or from delta_N.txt.
+#               With --roc the history of a single ROC is printed instead,
+#               with --export the text files of the iteration are written from the store
 # **********************************************************
 
 
 import sys
 import os, commands
 import optparse 
+from iterationStore import *
 
 
 usage = 'usage: %prog -i iteration'
 parser = optparse.OptionParser(usage)
 parser.add_option('-i', '--iter', dest='iter', type='int', help='Iteration')
+parser.add_option("-d","--deltaFile",dest="delta",type="string",default="delta",help="Name of the delta files of the iterations (delta, deltaAlive). Default is delta")
+parser.add_option("","--export",dest="export",type="string",default="",help="Export the iteration from the store to the text files (e.g. --export failed writes failed_N.txt and delta_N.txt)")
+parser.add_option("","--roc",dest="roc",type="string",default="",help="Print the history of the given ROC over the iterations")
 (opt, args) = parser.parse_args()
 sys.argv.append('-b')
 
 
-if opt.iter is None:
+if opt.iter is None and opt.roc == '':
     parser.error('Please define the iteration number')
 
 
 
 print sys.argv[0]
 
-
-cmd_0 = 'grep \" 0\" delta_%d.txt | wc -l'%(opt.iter)
-cmd_m4 = 'grep \" -4\" delta_%d.txt | wc -l'%(opt.iter)
-cmd_2 = 'grep \" 2\" delta_%d.txt | wc -l '%(opt.iter)
-print cmd_0
-os.system(cmd_0)
-print cmd_m4
-os.system(cmd_m4)
-print cmd_2
-os.system(cmd_2)
-
- 
-
-    
-
-
+# the store of the folder the iterations ran in, not created here if missing
+history = None
+if os.path.isfile(historyName): history = IterationHistory()
+deltaname = '%s_%d.txt'%(opt.delta, opt.iter) if opt.iter is not None else None
+
+if opt.roc != '':
+    if history is None: sys.exit('No iteration store (%s) in %s'%(historyName, os.getcwd()))
+    print "Iteration   Delta   Failing   ThrMean   ThrRMS"
+    for series, iteration, delta, failing, mean, rms in history.rocHistory(opt.roc, opt.delta):
+        print '%9d   %5d   %7d   %7s   %6s'%(iteration, delta, failing, '-' if mean is None else '%.2f'%mean, '-' if rms is None else '%.2f'%rms)
+    sys.exit()
+
+if opt.export != '':
+    # the text files are only overwritten from an iteration found in the store
+    if history is None or not history.hasIteration(opt.delta, opt.iter):
+        sys.exit('Iteration %d of %s not found in the store, %s_%d.txt and %s_%d.txt left as they are'%(opt.iter, opt.delta, opt.delta, opt.iter, opt.export, opt.iter))
+    history.exportDeltaFile(opt.delta, opt.iter, '%s_%d.txt'%(opt.delta, opt.iter))
+    history.exportFailedFile(opt.delta, opt.iter, '%s_%d.txt'%(opt.export, opt.iter))
+    print 'Exported %s_%d.txt and %s_%d.txt'%(opt.delta, opt.iter, opt.export, opt.iter)
+
+if history is not None and history.hasIteration(opt.delta, opt.iter):
+    counts = history.countsPerDelta(opt.delta, opt.iter)
+elif not os.path.isfile(deltaname):
+    sys.exit('Iteration %d of %s found neither in the store (%s) nor in %s, in %s'%(opt.iter, opt.delta, historyName, deltaname, os.getcwd()))
+else:
+    # iteration not in the store, count the deltas in the text file
+    counts = {}
+    for l in open(deltaname):
+        fields = l.split()
+        if len(fields) > 1: counts[int(fields[1])] = counts.get(int(fields[1]), 0) + 1
+
+print 'Number of ROCs with delta 0 (already failing at the previous iterations):'
+print counts.get(0, 0)
+print 'Number of ROCs with delta -4 (failing at this iteration):'
+print counts.get(-4, 0)
+print 'Number of ROCs with delta 2 (still succeeding):'
+print counts.get(2, 0)
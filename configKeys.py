@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Parsed index of the configuration keys defined in configurations.txt.
+#  The file is parsed once into key -> {alias: version} (dac, detconfig, ...) and the index
+#  is cached on disk next to the file (configurations.txt.idx) and in memory. The cache is
+#  rebuilt whenever the mtime or size of configurations.txt change.
+#
+#  - getConfigurationKeys(filename): return the ConfigurationKeys of the file, from the
+#    in-memory or disk cache if still valid
+#
+#  - ConfigurationKeys.lookup(key, alias): version of alias (e.g. 'dac') for the key, None if missing
+#
+#  - ConfigurationKeys.lookupMany(keys, alias): dictionary key -> version for several keys
+#
+#  - ConfigurationKeys.aliases(key): dictionary alias -> version of the key
+#
+# ***************************************************************************************************************
+
+
+import os
+import cPickle
+
+
+_cache = {}
+
+
+def parseConfigurations(filename):
+    keys = {}
+    with open(filename, 'r') as f:
+        chunks = f.read().split('\n\n')
+    for c in chunks:
+        config = c.split('\n')
+        # a chunk belongs to the key given by its 'key N' line
+        names = [item[4:] for item in config if item.startswith('key ')]
+        if len(names) < 1: continue
+        aliases = {}
+        for item in config:
+            fields = item.split()
+            if len(fields) > 1 and fields[0] not in aliases: aliases[fields[0]] = fields[1]
+        for name in names:
+            keys[name] = aliases
+    return keys
+
+
+class ConfigurationKeys:
+    def __init__(self, keys):
+        self.keys = keys
+
+    def aliases(self, key):
+        return self.keys.get(str(key), {})
+
+    def lookup(self, key, alias):
+        return self.aliases(key).get(alias)
+
+    def lookupMany(self, keys, alias):
+        return dict((key, self.lookup(key, alias)) for key in keys)
+
+
+def getConfigurationKeys(filename):
+    st = os.stat(filename)
+    stamp = (st.st_mtime, st.st_size)
+    if filename in _cache and _cache[filename][0] == stamp:
+        return _cache[filename][1]
+
+    idxname = filename + '.idx'
+    keys = None
+    try:
+        with open(idxname, 'rb') as f:
+            idxstamp, idxkeys = cPickle.load(f)
+        if idxstamp == stamp: keys = idxkeys
+    except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+        pass
+
+    if keys is None:
+        keys = parseConfigurations(filename)
+        try:
+            tmpname = '%s.%d'%(idxname, os.getpid())
+            with open(tmpname, 'wb') as f:
+                cPickle.dump((stamp, keys), f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmpname, idxname)
+        except (IOError, OSError):
+            print "Cannot write the configuration key index ", idxname
+
+    _cache[filename] = (stamp, ConfigurationKeys(keys))
+    return _cache[filename][1]
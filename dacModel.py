@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  In-memory model of a dac version: the values of all the ROC_DAC_module files of the folder
+#  in a ROC x register integer matrix, with the ROC names and the register names as index.
+#  The layout of the files (order of the ROCs and of the registers, spacing, comments, ...)
+#  is kept as one format string per kind of ROC block, shared by all the ROCs with the same
+#  layout, so that writing the files back gives the same text as the original ones.
+#  Loading, changing and comparing the dac settings of the whole detector then takes
+#  array operations instead of passes over the text lines.
+#
+#  Usage: python dacModel.py dacdir1 dacdir2 [-r VcThr]
+#         prints the differences between two dac versions
+#
+#  - DacVersion.load(dacdir, files): read the files (default all the ROC_DAC_module files of
+#    dacdir). Lines which are not "register: value" lines are kept as they are
+#    -- names, index: ROC names, row of each ROC
+#    -- registers, columns: register names, column of each register
+#    -- values: matrix of the values (numpy int32), present: which registers each ROC has
+#
+#  - DacVersion.deltaVector(deltaFor): vector of the deltas of the ROCs, deltaFor as in
+#    rewriteDacLines
+#
+#  - DacVersion.addDeltas(deltas, register): add the vector of deltas to the register
+#    (default VcThr) of all the ROCs
+#
+#  - DacVersion.diff(other, registers): list of (ROC name, register, value, other value) of
+#    the ROCs and registers found in both versions
+#
+#  - DacVersion.fileText(filename) / DacVersion.write(destdir, files): text of a module file,
+#    write the files (default all) in destdir
+#
+# ***************************************************************************************************************
+
+
+import sys
+import os
+import time
+import optparse
+import numpy
+from dacSettings import *
+from calibTrace import *
+
+
+def _isRocLine(tokens):
+    return len(tokens) == 2 and tokens[0] in ('ROC:', 'ROC')
+
+
+def _isInt(value):
+    # written back the same by %d: no sign, no leading zeros
+    if value.isdigit(): return value[0] != '0' or value == '0'
+    return value[0] == '-' and _isInt(value[1:]) and value != '-0'
+
+
+def _format(line, value, field):
+    # the line with its last token replaced by the field
+    stripped = line.rstrip()
+    start = len(stripped) - len(value)
+    return line[:start].replace('%', '%%') + field + line[len(stripped):].replace('%', '%%')
+
+
+def _parseDacLine(line):
+    # ('ROC', format, ROC name), ('value', register, format, value) or ('text', format)
+    if line is None: return ('ROC', None, None)
+    tokens = line.split()
+    if _isRocLine(tokens): return ('ROC', _format(line, tokens[1], '%s'), tokens[1])
+    # only the values written back the same way by %d go in the matrix
+    if len(tokens) == 2 and _isInt(tokens[1]):
+        return ('value', tokens[0].rstrip(':'), _format(line, tokens[1], '%d'), int(tokens[1]))
+    return ('text', line.replace('%', '%%'))
+
+
+class DacVersion:
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.registers = []
+        self.columns = {}
+        self.values = numpy.zeros((0, 0), dtype=numpy.int32)
+        self.present = numpy.zeros((0, 0), dtype=bool)
+        self.layouts = []                  # (format string, tuple of columns) of the kinds of ROC blocks
+        self.rowLayouts = numpy.zeros(0, dtype=numpy.int32)
+        self.files = []                    # (file name, text before the first ROC, first row, end row)
+        self.fileIndex = {}
+
+    @staticmethod
+    def load(dacdir, files=None):
+        if files is None:
+            files = sorted(f for f in os.listdir(dacdir) if f.startswith('ROC_DAC_module_'))
+        dac = DacVersion()
+        layouts = {}
+        rowLayouts = []
+        rows, cols, vals = [], [], []
+        # the same lines come back in most of the ROC blocks, they are parsed once
+        parsed = {}
+        for filename in files:
+            with open(os.path.join(dacdir, filename)) as f:
+                lines = f.readlines()
+            count('dac files read')
+            first = len(dac.names)
+            header = []
+            block = None
+            for line in lines + [None]:
+                kind = parsed.get(line)
+                if kind is None: kind = parsed[line] = _parseDacLine(line)
+                if kind[0] == 'ROC':
+                    if block is not None:
+                        key = (''.join(block[0]), tuple(block[1]))
+                        if key not in layouts:
+                            layouts[key] = len(dac.layouts)
+                            dac.layouts.append(key)
+                        rowLayouts.append(layouts[key])
+                    if line is None: break
+                    row = len(dac.names)
+                    dac.index[kind[2]] = row
+                    dac.names.append(kind[2])
+                    # format of the block and columns of its values, the ROC name comes first
+                    block = ([kind[1]], [])
+                    continue
+                if block is None:
+                    header.append(line)
+                    continue
+                col = dac.columns.get(kind[1]) if kind[0] == 'value' else None
+                # a register found twice in the block is kept as text after the first time
+                if kind[0] == 'value' and col not in block[1]:
+                    if col is None:
+                        col = dac.columns[kind[1]] = len(dac.registers)
+                        dac.registers.append(kind[1])
+                    block[0].append(kind[2])
+                    block[1].append(col)
+                    rows.append(row)
+                    cols.append(col)
+                    vals.append(kind[3])
+                elif kind[0] == 'value':
+                    block[0].append(line.replace('%', '%%'))
+                else:
+                    block[0].append(kind[-1])
+            dac.fileIndex[filename] = len(dac.files)
+            dac.files.append((filename, ''.join(header), first, len(dac.names)))
+        dac.values = numpy.zeros((len(dac.names), len(dac.registers)), dtype=numpy.int32)
+        dac.values[rows, cols] = vals
+        dac.present = numpy.zeros(dac.values.shape, dtype=bool)
+        dac.present[rows, cols] = True
+        dac.rowLayouts = numpy.array(rowLayouts, dtype=numpy.int32)
+        count('ROCs in dac model', len(dac.names))
+        return dac
+
+    def copy(self):
+        dac = DacVersion()
+        dac.__dict__.update(self.__dict__)
+        dac.values = self.values.copy()
+        return dac
+
+    def deltaVector(self, deltaFor):
+        return numpy.array([deltaFor(name) for name in self.names], dtype=numpy.int32)
+
+    def addDeltas(self, deltas, register='VcThr'):
+        col = self.columns[register]
+        # the ROCs without the register keep not having it
+        self.values[:, col] += numpy.where(self.present[:, col], deltas, 0).astype(numpy.int32)
+
+    def diff(self, other, registers=None):
+        names = [name for name in self.names if name in other.index]
+        if registers is None: registers = [r for r in self.registers if r in other.columns]
+        rows = numpy.array([self.index[name] for name in names], dtype=numpy.intp)
+        otherRows = numpy.array([other.index[name] for name in names], dtype=numpy.intp)
+        cols = numpy.array([self.columns[r] for r in registers], dtype=numpy.intp)
+        otherCols = numpy.array([other.columns[r] for r in registers], dtype=numpy.intp)
+        mine = self.values[rows[:, None], cols]
+        theirs = other.values[otherRows[:, None], otherCols]
+        both = self.present[rows[:, None], cols] & other.present[otherRows[:, None], otherCols]
+        changed = numpy.nonzero((mine != theirs) & both)
+        return [(names[i], registers[j], int(mine[i, j]), int(theirs[i, j])) for i, j in zip(*changed)]
+
+    def fileText(self, filename):
+        name, header, first, end = self.files[self.fileIndex[filename]]
+        text = [header]
+        values = self.values[first:end].tolist()
+        layouts = self.rowLayouts[first:end].tolist()
+        for i, row in enumerate(xrange(first, end)):
+            fmt, cols = self.layouts[layouts[i]]
+            rowValues = values[i]
+            text.append(fmt%((self.names[row],) + tuple([rowValues[c] for c in cols])))
+        return ''.join(text)
+
+    def write(self, destdir, files=None):
+        if files is None: files = [f[0] for f in self.files]
+        written = 0
+        for filename in files:
+            text = self.fileText(filename)
+            with open(os.path.join(destdir, filename), 'w') as f:
+                f.write(text)
+            written += len(text)
+        count('bytes written', written)
+        return written
+
+
+if __name__ == '__main__':
+    usage = 'usage: %prog dacdir1 dacdir2'
+    parser = optparse.OptionParser(usage)
+    parser.add_option('-r', '--registers', dest='registers', type='string', default='', help='Comma separated list of the registers to compare. Default is all')
+    (opt, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error('Please give the two dac folders to compare')
+
+    start = time.time()
+    old, new = DacVersion.load(args[0]), DacVersion.load(args[1])
+    loaded = time.time()
+    registers = opt.registers.split(',') if opt.registers else None
+    changes = old.diff(new, registers)
+    for name, register, before, after in changes:
+        print "%-45s %-12s %5d -> %5d"%(name, register, before, after)
+    onlyOld = [name for name in old.names if name not in new.index]
+    onlyNew = [name for name in new.names if name not in old.index]
+    if onlyOld: print "ROCs only in %s: %d"%(args[0], len(onlyOld))
+    if onlyNew: print "ROCs only in %s: %d"%(args[1], len(onlyNew))
+    print "%d changes in %d ROCs (loaded in %.2f s, compared in %.2f s)"%(len(changes), len(set(c[0] for c in changes)), loaded-start, time.time()-loaded)
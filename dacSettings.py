@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Tools to write a new dac version from an existing one in a single pass.
+#  The new version is copy-on-write: the files which do not change are hard links to the
+#  ones of the parent version (copies if the two folders are not on the same file system),
+#  only the module files where a register changes are written. The dac files are never
+#  modified in place, a new version always writes new files, so the links are safe.
+#  Everything goes in a temporary directory that is renamed to the final dac/N directory
+#  when complete, so an interrupted iteration never leaves a half-written dac version behind.
+#  The file I/O is spread over a pool of threads.
+#
+#  - splitDacLine(line): (register, text before the value, value, text after the value) of a
+#    "register: value" line of a ROC_DAC_module file, None for the other lines
+#
+#  - rewriteDacLines(lines, deltaFor): apply the VcThr deltas to the lines of a
+#    ROC_DAC_module file, returns the new lines and the list of (ROC name, delta).
+#    Only the value of the VcThr lines changes, the rest of the line is kept as it is
+#    -- deltaFor: function returning the delta for a ROC name
+#
+#  - writeNewDacVersion(srcdir, destdir, moduleFiles, deltaFor, nWorkers, carried, manifest): create
+#    destdir from srcdir where the moduleFiles are rewritten with rewriteDacLines.
+#    Returns the list of (ROC name, delta) in the order of moduleFiles
+#    -- carried: optional dictionary module file -> list of (ROC name, delta) of the module
+#       files that do not change (all deltas 0): they are linked without being read
+#    -- manifest: optional file where the changes of the new version are written (see
+#       writeDacManifest)
+#
+#  - writeDacManifest(filename, srcdir, destdir, written, linked, changes): write the changes
+#    of a dac version, one line per changed register: module file, ROC, register, old and
+#    new value, after a line with the parent version and the number of files written and linked
+#
+#  - linkDacFiles(srcdir, destdir, files): hard link (or copy, if linking is not possible)
+#    the files of srcdir in destdir
+#
+# ***************************************************************************************************************
+
+
+import os
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
+from calibTrace import *
+
+
+def splitDacLine(line):
+    tokens = line.split()
+    if len(tokens) != 2: return None
+    stripped = line.rstrip()
+    start = len(stripped) - len(tokens[1])
+    return tokens[0].rstrip(':'), line[:start], tokens[1], line[len(stripped):]
+
+
+def rewriteDacLines(lines, deltaFor):
+    newlines = []
+    deltas = []
+    delta = 0
+    for line in lines:
+        if (line.startswith("ROC")):
+            rocname = line.split()[1]
+            delta = deltaFor(rocname)
+            deltas.append((rocname, delta))
+        elif (line.startswith('VcThr') ):
+            # replace the value only: a replace on the whole line would also change any
+            # other occurrence of the same digits
+            parts = splitDacLine(line)
+            if parts is not None and parts[0] == 'VcThr':
+                line = parts[1] + str(int(parts[2]) + delta) + parts[3]
+        newlines.append(line)
+    return newlines, deltas
+
+
+def _linkDacFile(src, dest):
+    # True if linked, False if copied
+    try:
+        os.link(src, dest)
+        return True
+    except OSError:
+        shutil.copy(src, dest)
+        count('bytes written', os.path.getsize(dest))
+        return False
+
+
+def _changedRegisters(lines, newlines):
+    changes = []
+    rocname = None
+    for line, newline in zip(lines, newlines):
+        if (line.startswith("ROC")): rocname = line.split()[1]
+        elif line != newline:
+            register, before, value, after = splitDacLine(line)
+            changes.append((rocname, register, int(value), int(splitDacLine(newline)[2])))
+    return changes
+
+
+def _rewriteDacFile(task):
+    src, dest, deltaFor = task
+    with open(src, 'r') as f:
+        lines = f.readlines()
+    newlines, deltas = rewriteDacLines(lines, deltaFor)
+    changes = _changedRegisters(lines, newlines)
+    if not changes:
+        return deltas, changes, _linkDacFile(src, dest)
+    with open(dest, 'w') as f:
+        f.writelines(newlines)
+    count('dac files written')
+    count('bytes written', sum(len(l) for l in newlines))
+    return deltas, changes, False
+
+
+def _copyDacFile(task):
+    src, dest = task
+    if os.path.isdir(src):
+        shutil.copytree(src, dest)
+        return False
+    return _linkDacFile(src, dest)
+
+
+def writeNewDacVersion(srcdir, destdir, moduleFiles, deltaFor, nWorkers=4, carried=None, manifest=None):
+    parent, name = os.path.split(destdir.rstrip('/'))
+    tmpdir = tempfile.mkdtemp(prefix='.%s.'%name, dir=parent)
+    if carried is None: carried = {}
+    modules = set(f for f in moduleFiles if f not in carried)
+    pool = ThreadPool(nWorkers)
+    try:
+        # files which are not rewritten are carried over as they are
+        copies = [(os.path.join(srcdir, f), os.path.join(tmpdir, f)) for f in os.listdir(srcdir) if f not in modules]
+        rewrites = [(os.path.join(srcdir, f), os.path.join(tmpdir, f), deltaFor) for f in moduleFiles if f in modules]
+        copying = pool.map_async(_copyDacFile, copies)
+        rewritten = dict(zip([f for f in moduleFiles if f in modules], pool.map(_rewriteDacFile, rewrites)))
+        linked = sum(copying.get()) + sum(res[2] for res in rewritten.values())
+        deltas = [carried[f] if f in carried else rewritten[f][0] for f in moduleFiles]
+        os.chmod(tmpdir, 0755)
+        os.rename(tmpdir, destdir)
+    except:
+        shutil.rmtree(tmpdir, True)
+        raise
+    finally:
+        pool.close()
+        pool.join()
+    written = [f for f in moduleFiles if f in rewritten and rewritten[f][1]]
+    count('dac files linked', linked)
+    if manifest is not None:
+        changes = [(f, ) + change for f in written for change in rewritten[f][1]]
+        writeDacManifest(manifest, srcdir, destdir, len(written), linked, changes)
+    return [d for fileDeltas in deltas for d in fileDeltas]
+
+
+def writeDacManifest(filename, srcdir, destdir, written, linked, changes):
+    with open(filename, 'w') as f:
+        f.write('# dac %s from dac %s: %d files written, %d linked, %d registers changed\n'%(
+            os.path.basename(destdir.rstrip('/')), os.path.basename(srcdir.rstrip('/')), written, linked, len(changes)))
+        for change in changes:
+            f.write('%s %s %s %d %d\n'%change)
+
+
+def linkDacFiles(srcdir, destdir, files):
+    for f in files:
+        try:
+            os.link(os.path.join(srcdir, f), os.path.join(destdir, f))
+        except OSError:
+            shutil.copy(os.path.join(srcdir, f), destdir)
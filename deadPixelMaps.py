@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Dead pixel maps of the PixelAlive runs. The dead/alive map of each ROC (80 rows x 52 columns)
+#  is kept as a packed bitmap of 520 bytes, all the ROCs of a run in one (nROC x 520) array
+#  (about 8 MB for the detector), saved as a .npz file in the run folder (deadPixelMaps.npz).
+#  Counts, differences between runs and exclusions are then array operations on the bitmaps,
+#  without reading the ROOT files again.
+#
+#  Usage: python deadPixelMaps.py maps1.npz maps2.npz [-e excludedROCs.txt]
+#         prints the pixels which died or came back between two runs
+#
+#  - DeadPixelMaps.fromDeadPixels(deadPixels): build the maps from a dictionary ROC name ->
+#    list of (x, y) of the dead pixels, as returned by CountDeadPixels
+#
+#  - DeadPixelMaps.load(filename) / save(filename): read and write the .npz file
+#
+#  - DeadPixelMaps.deadPixels(rocname): list of (x, y) of the dead pixels of a ROC
+#
+#  - DeadPixelMaps.counts(): number of dead pixels of each ROC
+#
+#  - DeadPixelMaps.mask(excludedrocs): False for the excluded ROCs, True for the others
+#
+#  - DeadPixelMaps.failingRocs(maxDeadPixels, excludedrocs): list of (ROC name, number of dead
+#    pixels) of the ROCs with more than maxDeadPixels dead pixels, as CountDeadPixels
+#
+#  - DeadPixelMaps.diff(other, excludedrocs): list of (ROC name, pixels dead in other only,
+#    pixels dead here only) of the ROCs found in both maps, for the ROCs which changed
+#
+#  - readExcludedRocs(filename): ROC names listed in the file of --exclude, empty if no file
+#
+# ***************************************************************************************************************
+
+
+import os
+import optparse
+import numpy
+
+
+mapsName = 'deadPixelMaps.npz'
+rocShape = (80, 52)     # rows x columns of a ROC, as the contents of the efficiency histos
+_bitCounts = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.int32)
+
+
+def readExcludedRocs(filename):
+    if filename == '' or not os.path.isfile(filename): return []
+    with open(filename) as f:
+        return [line.replace('\n','') for line in f]
+
+
+class DeadPixelMaps:
+    def __init__(self, names, bits, shape=rocShape):
+        self.names = names          # ROC names
+        self.bits = bits            # packed dead pixel maps, one row of bytes per ROC
+        self.shape = shape
+        self.index = dict((name, i) for i, name in enumerate(names))
+
+    @classmethod
+    def fromDeadPixels(cls, deadPixels, shape=rocShape):
+        names = sorted(deadPixels)
+        dead = numpy.zeros((len(names),) + shape, dtype=bool)
+        for i, name in enumerate(names):
+            if deadPixels[name]:
+                xs, ys = numpy.array(deadPixels[name]).T
+                dead[i, ys-1, xs-1] = True
+        return cls(numpy.array(names), numpy.packbits(dead.reshape(len(names), shape[0]*shape[1]), axis=1), shape)
+
+    @classmethod
+    def load(cls, filename):
+        t = numpy.load(filename)
+        return cls(t['names'], t['bits'], tuple(int(n) for n in t['shape']))
+
+    def save(self, filename):
+        numpy.savez(filename, names=self.names, bits=self.bits, shape=numpy.array(self.shape))
+
+    def _unpack(self, bits):
+        return numpy.unpackbits(bits)[:self.shape[0]*self.shape[1]].reshape(self.shape)
+
+    def deadPixels(self, rocname):
+        ys, xs = numpy.nonzero(self._unpack(self.bits[self.index[rocname]]))
+        return zip(xs+1, ys+1)
+
+    def counts(self):
+        return _bitCounts[self.bits].sum(axis=1)
+
+    def mask(self, excludedrocs=()):
+        excluded = set(excludedrocs)
+        return numpy.array([name not in excluded for name in self.names], dtype=bool)
+
+    def failingRocs(self, maxDeadPixels, excludedrocs=()):
+        counts = self.counts()
+        failing = numpy.nonzero((counts > maxDeadPixels) & self.mask(excludedrocs))[0]
+        return [(self.names[i], int(counts[i])) for i in failing]
+
+    def diff(self, other, excludedrocs=()):
+        common = [i for i in numpy.nonzero(self.mask(excludedrocs))[0] if self.names[i] in other.index]
+        mine = self.bits[common]
+        theirs = other.bits[[other.index[self.names[i]] for i in common]]
+        died = theirs & ~mine
+        back = mine & ~theirs
+        changes = []
+        for j in numpy.nonzero((died | back).any(axis=1))[0]:
+            ysDied, xsDied = numpy.nonzero(self._unpack(died[j]))
+            ysBack, xsBack = numpy.nonzero(self._unpack(back[j]))
+            changes.append((self.names[common[j]], zip(xsDied+1, ysDied+1), zip(xsBack+1, ysBack+1)))
+        return changes
+
+
+if __name__ == '__main__':
+    usage = 'usage: %prog maps1.npz maps2.npz'
+    parser = optparse.OptionParser(usage)
+    parser.add_option("-e","--exclude",dest="exclude",type="string",default="",help="List of the ROCs to leave out of the comparison")
+    (opt, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error('Please give the two dead pixel maps to compare')
+
+    before, after = DeadPixelMaps.load(args[0]), DeadPixelMaps.load(args[1])
+    changes = before.diff(after, readExcludedRocs(opt.exclude))
+    for rocname, died, back in changes:
+        print "%-45s %4d dead %4d back"%(rocname, len(died), len(back))
+    print "Dead pixels: %d in %s, %d in %s"%(before.counts().sum(), args[0], after.counts().sum(), args[1])
+    print "%d ROCs changed, %d pixels died, %d came back"%(len(changes), sum(len(c[1]) for c in changes), sum(len(c[2]) for c in changes))
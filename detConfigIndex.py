@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Parsed index of the ROCs listed in a detectconfig.dat file. The ROC names are split once
+#  into arrays (subdetector, module, shell, sector, layer, ladder, disk, blade, panel) and the
+#  flags of the ROCs (noInit, noAnalogSignal, ...) into a bit mask, so that the ROCs can be
+#  selected with array operations, e.g. the enabled FPix ROCs of disk 2:
+#       index.select(subdet='FPix', disk=2, enabled=True)
+#  As the configuration keys (see configKeys.py), the index is cached on disk next to the
+#  file (detectconfig.dat.idx) and in memory, and rebuilt when the mtime or size of the
+#  file change.
+#
+#  - getDetConfigIndex(filename): return the DetConfigIndex of the file, from the in-memory
+#    or disk cache if still valid
+#
+#  - DetConfigIndex.select(subdet, enabled, names, **fields): boolean array of the ROCs
+#    matching all the given conditions
+#    -- subdet: 'BPix' or 'FPix'
+#    -- enabled: True for the ROCs without noInit/noAnalogSignal flag, False for the others
+#    -- names: list of ROC names, e.g. the excluded ROCs
+#    -- fields: shell, sector, layer, ladder, module, disk, blade, panel number (0 when
+#       not relevant for the subdetector), e.g. layer=1
+#
+#  - DetConfigIndex.rocNames(selection) / DetConfigIndex.moduleFiles(selection): ROC names
+#    and dac files of the modules (ROC_DAC_module_*.dat) of the selected ROCs, in the order
+#    of the file
+#
+#  - DetConfigIndex.hasFlag(flag): boolean array of the ROCs with the flag
+#
+# ***************************************************************************************************************
+
+
+import os
+import re
+import cPickle
+import numpy
+
+
+_cache = {}
+subdets = ('BPix', 'FPix')
+disabledFlags = ('noInit', 'noAnalogSignal')
+# part of the name (e.g. SEC4) giving each field of a BPix or FPix module
+_fieldPrefixes = {'BPix': {'SEC': 'sector', 'LYR': 'layer', 'LDR': 'ladder', 'MOD': 'module'},
+                  'FPix': {'D': 'disk', 'BLD': 'blade', 'PNL': 'panel'}}
+fieldNames = ('shell', 'sector', 'layer', 'ladder', 'module', 'disk', 'blade', 'panel')
+_part = re.compile(r'([A-Za-z]+)(\d+)[A-Za-z]*$')
+
+
+def moduleName(rocname):
+    # module of the dac files: without _ROCn for BPix, without _PLQn_ROCn for FPix
+    if("FPix" in rocname): return "_".join(rocname.split("_")[:-2])
+    return "_".join(rocname.split("_")[:-1])
+
+
+def _moduleFields(module):
+    parts = module.split('_')
+    fields = dict((name, 0) for name in fieldNames)
+    prefixes = _fieldPrefixes.get(parts[0], {})
+    for part in parts[2:]:
+        m = _part.match(part)
+        if m is not None and m.group(1) in prefixes: fields[prefixes[m.group(1)]] = int(m.group(2))
+    return fields
+
+
+def parseDetConfig(filename):
+    # arrays of the index, as saved in the disk cache
+    names, modules, moduleIds, flags = [], [], [], []
+    moduleIndex = {}
+    flagNames = list(disabledFlags)
+    with open(filename, 'r') as f:
+        lines = f.readlines()[1:]   # first line is "Rocs:"
+    for line in lines:
+        tokens = line.split()
+        if not tokens: continue
+        names.append(tokens[0])
+        module = moduleName(tokens[0])
+        if module not in moduleIndex:
+            moduleIndex[module] = len(modules)
+            modules.append(module)
+        moduleIds.append(moduleIndex[module])
+        bits = 0
+        for flag in tokens[1:]:
+            if flag not in flagNames: flagNames.append(flag)
+            bits |= 1 << flagNames.index(flag)
+        flags.append(bits)
+    shells = sorted(set(m.split('_')[1] for m in modules if '_' in m))
+    perModule = dict((name, numpy.zeros(len(modules), dtype=numpy.int16)) for name in fieldNames)
+    perModule['subdet'] = numpy.zeros(len(modules), dtype=numpy.int8)
+    for i, module in enumerate(modules):
+        for name, value in _moduleFields(module).items():
+            perModule[name][i] = value
+        parts = module.split('_')
+        perModule['subdet'][i] = subdets.index(parts[0]) if parts[0] in subdets else -1
+        if len(parts) > 1 and parts[1] in shells: perModule['shell'][i] = shells.index(parts[1]) + 1
+    arrays = {'names': names, 'modules': modules, 'shells': shells, 'flagNames': flagNames,
+              'moduleIds': numpy.array(moduleIds, dtype=numpy.int32),
+              'flags': numpy.array(flags, dtype=numpy.int64)}
+    arrays.update(('module_' + name, values) for name, values in perModule.items())
+    return arrays
+
+
+class DetConfigIndex:
+    def __init__(self, arrays):
+        self.names = arrays['names']            # ROC names, in the order of the file
+        self.modules = arrays['modules']        # module names, in the order of the file
+        self.shells = arrays['shells']          # shell names, e.g. BmI, shell = position + 1
+        self.flagNames = arrays['flagNames']    # flag of each bit of flags
+        self.moduleIds = arrays['moduleIds']    # module of each ROC
+        self.flags = arrays['flags']
+        # per ROC arrays from the per module ones
+        self.subdet = arrays['module_subdet'][self.moduleIds]
+        self.fields = dict((name, arrays['module_' + name][self.moduleIds]) for name in fieldNames)
+        disabled = sum(1 << self.flagNames.index(flag) for flag in disabledFlags)
+        self.enabled = (self.flags & disabled) == 0
+        self.rows = dict((name, i) for i, name in enumerate(self.names))
+
+    def hasFlag(self, flag):
+        if flag not in self.flagNames: return numpy.zeros(len(self.names), dtype=bool)
+        return (self.flags & (1 << self.flagNames.index(flag))) != 0
+
+    def select(self, subdet=None, enabled=None, names=None, **fields):
+        selection = numpy.ones(len(self.names), dtype=bool)
+        if subdet is not None: selection &= self.subdet == subdets.index(subdet)
+        if enabled is not None: selection &= self.enabled == enabled
+        if names is not None:
+            inList = numpy.zeros(len(self.names), dtype=bool)
+            inList[[self.rows[name] for name in names if name in self.rows]] = True
+            selection &= inList
+        for name, value in fields.items():
+            if name == 'shell': value = self.shells.index(value) + 1 if value in self.shells else -1
+            selection &= self.fields[name] == value
+        return selection
+
+    def rocNames(self, selection):
+        return [self.names[i] for i in numpy.nonzero(selection)[0]]
+
+    def moduleFiles(self, selection):
+        # modules in the order of their first selected ROC
+        ids = self.moduleIds[selection]
+        modules, first = numpy.unique(ids, return_index=True)
+        return ["ROC_DAC_module_" + self.modules[m] + ".dat" for m in modules[numpy.argsort(first)]]
+
+
+def getDetConfigIndex(filename):
+    st = os.stat(filename)
+    stamp = (st.st_mtime, st.st_size)
+    if filename in _cache and _cache[filename][0] == stamp:
+        return _cache[filename][1]
+
+    idxname = filename + '.idx'
+    arrays = None
+    try:
+        with open(idxname, 'rb') as f:
+            idxstamp, idxarrays = cPickle.load(f)
+        if idxstamp == stamp: arrays = idxarrays
+    except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+        pass
+
+    if arrays is None:
+        arrays = parseDetConfig(filename)
+        try:
+            tmpname = '%s.%d'%(idxname, os.getpid())
+            with open(tmpname, 'wb') as f:
+                cPickle.dump((stamp, arrays), f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmpname, idxname)
+        except (IOError, OSError):
+            print "Cannot write the detconfig index ", idxname
+
+    _cache[filename] = (stamp, DetConfigIndex(arrays))
+    return _cache[filename][1]
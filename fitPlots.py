@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Plots of the VcThr(Vcal) fits, rendered once all the ROCs are fitted instead of inside the
+#  fit loop. The fit functions keep the points of each ROC with its fit (savePlots True), the
+#  plots are queued and then drawn by a pool of worker processes, either as one multi-page PDF
+#  per module or sector (one page per ROC) or as small PNG thumbnails, one per ROC, in a
+#  folder per module or sector.
+#
+#  - fitPlotPoints(fits): list of (ROC name, Vcals, VcThrs, a, b, chi2/NDF) of the fits which
+#    carry their points, i.e. (ROC name, a, b, chi2/NDF, lowest threshold, Vcals, VcThrs)
+#
+#  - queueFitPlots(fits) / takeFitPlots(): keep the plots of the fits until they are rendered,
+#    takeFitPlots returns them and empties the queue
+#
+#  - plotGroupName(rocName, group): module (ROC name without _ROCn) or sector (first three
+#    fields, e.g. BPix_BmI_SEC4) of a ROC
+#
+#  - renderFitPlots(plots, fmt, group, onlyFailing, nWorkers, outdir): draw the plots in outdir
+#    -- fmt: 'pdf' (multi-page PDF per group) or 'png' (thumbnails)
+#    -- group: 'module' or 'sector'
+#    -- onlyFailing: only the ROCs with chi2/NDF above maxChi2NDF (10)
+#    Returns the list of files written
+#
+# ***************************************************************************************************************
+
+
+import os
+import re
+import multiprocessing
+from array import array
+from calibEnv import ROOT
+from calibTrace import *
+
+
+maxChi2NDF = 10.
+plotFormats = ('pdf', 'png')
+plotGroups = ('module', 'sector')
+_rocSuffix = re.compile(r'_ROC\d+$')
+_queued = []
+
+
+def fitPlotPoints(fits):
+    return [(fit[0], fit[5], fit[6], fit[1], fit[2], fit[3]) for fit in fits if len(fit) > 5]
+
+
+def queueFitPlots(fits):
+    _queued.extend(fitPlotPoints(fits))
+
+
+def takeFitPlots():
+    plots = list(_queued)
+    del _queued[:]
+    return plots
+
+
+def plotGroupName(rocName, group):
+    if group == 'sector': return '_'.join(rocName.split('_')[:3])
+    return _rocSuffix.sub('', rocName)
+
+
+def _drawFit(canvas, plot):
+    name, Vcals, VcThrs, a, b, chi2NDF = plot
+    graph = ROOT.TGraph(len(Vcals), array('f', Vcals), array('f', VcThrs))
+    graph.SetTitle('%s  #chi^{2}/NDF = %.2f'%(name, chi2NDF))
+    graph.GetXaxis().SetTitle("Vcal")
+    graph.GetYaxis().SetTitle("VcThr")
+    line = ROOT.TF1(name+'_pol1', "pol1", min(Vcals), max(Vcals))
+    line.SetParameters(a, b)
+    if chi2NDF > maxChi2NDF: line.SetLineColor(ROOT.kRed)
+    canvas.cd()
+    graph.Draw("A*")
+    line.Draw("same")
+    # the graph and the line have to live until the canvas is printed
+    return graph, line
+
+
+def _renderGroup(task):
+    fmt, filename, plots = task
+    ROOT.gROOT.SetBatch(True)
+    # no "file ... has been created" for each page, restored for the caller when run in its process
+    ignoreLevel = ROOT.gErrorIgnoreLevel
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+    try:
+        if fmt == 'pdf':
+            canvas = ROOT.TCanvas('fitPlots', '', 600, 450)
+            canvas.Print(filename + '[')
+            for plot in plots:
+                drawn = _drawFit(canvas, plot)
+                canvas.Print(filename, 'Title:' + plot[0])
+            canvas.Print(filename + ']')
+            return [filename]
+        canvas = ROOT.TCanvas('fitPlots', '', 200, 150)
+        files = []
+        for plot in plots:
+            drawn = _drawFit(canvas, plot)
+            files.append(os.path.join(filename, plot[0] + '.png'))
+            canvas.Print(files[-1])
+        return files
+    finally:
+        ROOT.gErrorIgnoreLevel = ignoreLevel
+
+
+def renderFitPlots(plots, fmt='pdf', group='module', onlyFailing=False, nWorkers=4, outdir='plots'):
+    if onlyFailing: plots = [plot for plot in plots if plot[5] > maxChi2NDF]
+    groups = {}
+    for plot in plots:
+        groups.setdefault(plotGroupName(plot[0], group), []).append(plot)
+    if not groups:
+        print "No fit plots to render"
+        return []
+    # the folders are created here once, not by the workers
+    if not os.path.isdir(outdir): os.makedirs(outdir)
+    tasks = []
+    for name, rocs in sorted(groups.items()):
+        if fmt == 'pdf':
+            tasks.append((fmt, os.path.join(outdir, name + '.pdf'), rocs))
+        else:
+            if not os.path.isdir(os.path.join(outdir, name)): os.makedirs(os.path.join(outdir, name))
+            tasks.append((fmt, os.path.join(outdir, name), rocs))
+    print "Rendering %d fit plots (%s per %s) with %d workers in %s"%(len(plots), fmt, group, nWorkers, outdir)
+    files = []
+    with timer('renderFitPlots', plots=len(plots), groups=len(tasks), workers=nWorkers):
+        if nWorkers > 1:
+            pool = multiprocessing.Pool(nWorkers)
+            try:
+                for res in pool.imap_unordered(_renderGroup, tasks):
+                    files.extend(res)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for task in tasks:
+                files.extend(_renderGroup(task))
+    count('plot files written', len(files))
+    return files
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Helpers to look at the bin contents of ROOT histograms as NumPy arrays.
+#  The arrays are views on the histogram buffer (no copy is made), so they
+#  are only valid as long as the histogram itself is alive.
+#
+#  - histoBuffer(histo): full bin buffer of a TH1/TH2, including under/overflow bins.
+#    1D histograms give an array of size nbins+2, 2D histograms an array of
+#    shape (nbinsY+2, nbinsX+2) indexed as [y, x] like ROOT global bins.
+#
+#  - histoContents(histo): same as histoBuffer, without under/overflow bins,
+#    e.g. contents[y-1, x-1] == histo.GetBinContent(x, y)
+#
+#  - axisBinning(axis): (nbins, xmin, xmax) of a TAxis with fixed bins
+#
+#  - findBin(binning, x) / binCenters(binning, bins): TAxis::FindBin and TAxis::GetBinCenter
+#    for the given binning, the latter working on arrays of bins
+#
+# ***************************************************************************************************************
+
+
+import numpy
+
+
+# Storage type of the ROOT histogram classes, from the last letter of the class name
+_histoTypes = {'F': numpy.float32,
+               'D': numpy.float64,
+               'I': numpy.int32,
+               'S': numpy.int16,
+               'C': numpy.int8}
+
+
+def histoBuffer(histo):
+    dtype = _histoTypes[histo.IsA().GetName()[-1]]
+    size = histo.GetSize()
+    buf = histo.GetArray()
+    # PyROOT buffers do not know their length, tell them before wrapping
+    if hasattr(buf, 'SetSize'): buf.SetSize(size)
+    elif hasattr(buf, 'reshape'): buf.reshape((size,))
+    arr = numpy.frombuffer(buf, dtype=dtype, count=size)
+    if histo.GetDimension() == 2:
+        arr = arr.reshape(histo.GetNbinsY()+2, histo.GetNbinsX()+2)
+    return arr
+
+
+def histoContents(histo):
+    arr = histoBuffer(histo)
+    if arr.ndim == 2: return arr[1:-1, 1:-1]
+    return arr[1:-1]
+
+
+def axisBinning(axis):
+    return (axis.GetNbins(), axis.GetXmin(), axis.GetXmax())
+
+
+def findBin(binning, x):
+    # TAxis::FindBin for fixed bins
+    nbins, xmin, xmax = binning
+    if x < xmin: return 0
+    if x >= xmax: return nbins+1
+    return 1 + int(nbins*(x-xmin)/(xmax-xmin))
+
+
+def binCenters(binning, bins):
+    # TAxis::GetBinCenter for fixed bins, also outside the axis range (e.g. bin -1)
+    nbins, xmin, xmax = binning
+    width = (xmax-xmin)/nbins
+    return xmin + (bins-0.5)*width
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Store of the state of the threshold minimization iterations, one record per ROC per
+#  iteration with delta VcThr, verdict (failing or not), threshold mean and RMS.
+#  The records are kept in a SQLite file in the working directory (iterationHistory.sqlite),
+#  next to the failed_N.txt and delta_N.txt files, which can still be exported from it.
+#  Each series of iterations is identified by the name of its delta file (e.g. delta, deltaAlive).
+#
+#  - IterationHistory(filename): open (or create) the store
+#
+#  - IterationHistory.record(series, iteration, rows): save the records of an iteration,
+#    rows are (ROC name, delta, failing, mean, RMS), mean and RMS can be None
+#
+#  - IterationHistory.hasIteration(series, iteration): True if the iteration was recorded
+#
+#  - IterationHistory.deltas(series, iteration): dictionary ROC name -> delta
+#
+#  - IterationHistory.records(series, iteration): dictionary ROC name -> (delta, failing, mean, RMS)
+#
+#  - IterationHistory.rocNames(series, iteration): list of the ROCs, in the order they were recorded
+#
+#  - IterationHistory.converged(series, iteration, mod): set of the ROCs that are not going
+#    to be changed anymore (delta 0 or -4 in minimize modality, 0 otherwise), as listFromDeltaFile
+#
+#  - IterationHistory.countsPerDelta(series, iteration): dictionary delta -> number of ROCs
+#
+#  - IterationHistory.rocHistory(roc, series): list of (series, iteration, delta, failing, mean, RMS)
+#
+#  - IterationHistory.exportDeltaFile(series, iteration, filename) /
+#    IterationHistory.exportFailedFile(series, iteration, filename): write the text files
+#
+# ***************************************************************************************************************
+
+
+import sqlite3
+
+
+historyName = 'iterationHistory.sqlite'
+
+
+class IterationHistory:
+    def __init__(self, filename=historyName):
+        self.db = sqlite3.connect(filename)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS rocs (series TEXT, iteration INTEGER, roc TEXT,
+                           delta INTEGER, failing INTEGER, mean REAL, rms REAL,
+                           PRIMARY KEY (series, iteration, roc))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS rocs_roc ON rocs (roc)')
+
+    def record(self, series, iteration, rows):
+        self.db.execute('DELETE FROM rocs WHERE series = ? AND iteration = ?', (series, iteration))
+        self.db.executemany('INSERT OR REPLACE INTO rocs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            [(series, iteration, roc, delta, int(failing), mean, rms) for roc, delta, failing, mean, rms in rows])
+        self.db.commit()
+
+    def hasIteration(self, series, iteration):
+        return self.db.execute('SELECT 1 FROM rocs WHERE series = ? AND iteration = ? LIMIT 1', (series, iteration)).fetchone() is not None
+
+    def deltas(self, series, iteration):
+        return dict(self.db.execute('SELECT roc, delta FROM rocs WHERE series = ? AND iteration = ?', (series, iteration)))
+
+    def records(self, series, iteration):
+        return dict((roc, (delta, bool(failing), mean, rms)) for roc, delta, failing, mean, rms in
+                    self.db.execute('SELECT roc, delta, failing, mean, rms FROM rocs WHERE series = ? AND iteration = ?', (series, iteration)))
+
+    def rocNames(self, series, iteration):
+        return [roc for (roc,) in self.db.execute('SELECT roc FROM rocs WHERE series = ? AND iteration = ? ORDER BY rowid', (series, iteration))]
+
+    def converged(self, series, iteration, mod):
+        if (mod == "minimize"): query = 'SELECT roc FROM rocs WHERE series = ? AND iteration = ? AND delta IN (0, -4)'
+        else: query = 'SELECT roc FROM rocs WHERE series = ? AND iteration = ? AND delta = 0'
+        return set(roc for (roc,) in self.db.execute(query, (series, iteration)))
+
+    def countsPerDelta(self, series, iteration):
+        return dict(self.db.execute('SELECT delta, COUNT(*) FROM rocs WHERE series = ? AND iteration = ? GROUP BY delta', (series, iteration)))
+
+    def rocHistory(self, roc, series=None):
+        if series is None:
+            return self.db.execute('SELECT series, iteration, delta, failing, mean, rms FROM rocs WHERE roc = ? ORDER BY series, iteration', (roc,)).fetchall()
+        return self.db.execute('SELECT series, iteration, delta, failing, mean, rms FROM rocs WHERE roc = ? AND series = ? ORDER BY iteration', (roc, series)).fetchall()
+
+    def exportDeltaFile(self, series, iteration, filename):
+        with open(filename, 'w') as f:
+            for roc, delta in self.db.execute('SELECT roc, delta FROM rocs WHERE series = ? AND iteration = ? ORDER BY rowid', (series, iteration)):
+                f.write('%s %d\n'%(roc, delta))
+
+    def exportFailedFile(self, series, iteration, filename):
+        with open(filename, 'w') as f:
+            f.write('='*60)
+            f.write('\nFalingROC name                              ThrMean      ThrRMS     \n')
+            f.write('='*60)
+            for roc, mean, rms in self.db.execute('SELECT roc, mean, rms FROM rocs WHERE series = ? AND iteration = ? AND failing = 1 ORDER BY rowid', (series, iteration)):
+                if mean is None: f.write('\n%s'%roc)
+                else: f.write('\n%s  %.2f  %.2f'%(roc, mean, rms))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# **************************************************************************************
+#
+#  Description: Create synthetic calibration results at full detector scale, to
+#               measure the analysis steps without carrying around real ROOT outputs.
+#
+#  Usage: python makeSyntheticRun.py -o /path/to/synthetic [--fraction 0.1] [--nFiles 40]
+#
+#  Layout of the output folder:
+#     config/                         -> PIXELCONFIGURATIONBASE: configurations.txt,
+#                                        detconfig/0/detectconfig.dat, dac/0/ROC_DAC_module_*.dat
+#     output/Run_0/Run_1/             -> VcThr-Vcal run, 2DEfficiency_Fed_N_Run_1.root (canvases)
+#     output/Run_0/Run_2/             -> SCurveSmartRange run, SCurve_Fed_N_Run_2.root (Threshold1D)
+#     output/Run_0/Run_3/             -> PixelAlive run, PixelAlive_Fed_N_Run_3.root (efficiency TH2)
+#     synthetic.json                  -> number of ROCs and modules, run numbers
+#
+#  Each run folder also has the PixelConfigurationKey.txt pointing to key 1
+#  (dac 0, detconfig 0). The modules are spread round robin over nFiles files, each one
+#  with the usual BPix/FPix folder hierarchy.
+#
+# **************************************************************************************
+
+
+import sys
+import os
+import json
+import optparse
+import numpy
+import ROOT
+from histoArrays import *
+
+
+runs = {'VcThrVcal': 1, 'SCurve': 2, 'PixelAlive': 3}
+filePrefix = {'VcThrVcal': '2DEfficiency', 'SCurve': 'SCurve', 'PixelAlive': 'PixelAlive'}
+
+dacRegisters = ['Vdd', 'Vana', 'Vsh', 'Vcomp', 'VwllPr', 'VwllSh', 'VHldDel', 'Vtrim', 'VcThr', 'VIbias_bus',
+                'PHOffset', 'Vcomp_ADC', 'PHScale', 'VIColOr', 'Vcal', 'CalDel', 'TempRange', 'WBC',
+                'ChipContReg', 'Readback']
+dacDefaults = [6, 140, 250, 0, 30, 30, 230, 100, 80, 30, 200, 50, 100, 50, 200, 90, 0, 96, 0, 0]
+
+
+def detectorModules():
+    # returns a list of (module name, folder path, ROC names) for the whole detector
+    modules = []
+    shells = ['BmI', 'BmO', 'BpI', 'BpO']
+    # BPix: ladders per layer in each half shell, 4 modules per ladder, 16 ROCs per module
+    ladders = {1: 10, 2: 16, 3: 22}
+    for shell in shells:
+        for layer in (1, 2, 3):
+            for ladder in range(1, ladders[layer]+1):
+                sector = 1 + (ladder-1)*8//ladders[layer]
+                folders = ['BPix', 'BPix_%s'%shell, 'BPix_%s_SEC%d'%(shell, sector),
+                           'BPix_%s_SEC%d_LYR%d'%(shell, sector, layer),
+                           'BPix_%s_SEC%d_LYR%d_LDR%dF'%(shell, sector, layer, ladder)]
+                for mod in range(1, 5):
+                    name = '%s_MOD%d'%(folders[-1], mod)
+                    modules.append((name, folders + [name], ['%s_ROC%d'%(name, roc) for roc in range(16)]))
+    # FPix: 2 disks, 12 blades, 2 panels, plaquettes with 2/6/8/10 and 6/8/10 ROCs
+    plaquettes = {1: [2, 6, 8, 10], 2: [6, 8, 10]}
+    for shell in shells:
+        for disk in (1, 2):
+            for blade in range(1, 13):
+                for panel in (1, 2):
+                    folders = ['FPix', 'FPix_%s'%shell, 'FPix_%s_D%d'%(shell, disk),
+                               'FPix_%s_D%d_BLD%d'%(shell, disk, blade),
+                               'FPix_%s_D%d_BLD%d_PNL%d'%(shell, disk, blade, panel)]
+                    for plq, nRocs in enumerate(plaquettes[panel]):
+                        name = '%s_PLQ%d'%(folders[-1], plq+1)
+                        modules.append((name, folders + [name], ['%s_ROC%d'%(name, roc) for roc in range(nRocs)]))
+    return modules
+
+
+def moduleFileName(rocname):
+    # module of the ROC as built by createModuleList
+    if("FPix" in rocname): mod = rocname.split("_")[:-2]
+    else: mod = rocname.split("_")[:-1]
+    return "ROC_DAC_module_" + "_".join(mod) + ".dat"
+
+
+def writeConfig(base, modules, nKeys):
+    config = os.path.join(base, 'config')
+    for d in ['detconfig/0', 'dac/0']:
+        if not os.path.isdir(os.path.join(config, d)): os.makedirs(os.path.join(config, d))
+
+    with open(os.path.join(config, 'configurations.txt'), 'w') as f:
+        chunks = ['key 1\ndac 0\ndetconfig 0\nnametranslation 0\nfedcard 0']
+        # other keys, to have a configurations.txt of realistic size
+        for key in range(2, nKeys+1):
+            chunks.append('key %d\ndac %d\ndetconfig %d\nnametranslation %d\nfedcard %d\ntrim %d\nmask %d'%((key,)+(key//7,)*6))
+        f.write('\n\n'.join(chunks) + '\n')
+
+    rocs = [roc for name, folders, rocnames in modules for roc in rocnames]
+    with open(os.path.join(config, 'detconfig/0/detectconfig.dat'), 'w') as f:
+        f.write('Rocs:\n')
+        for roc in rocs: f.write('%s \n'%roc)
+
+    files = {}
+    for roc in rocs:
+        files.setdefault(moduleFileName(roc), []).append(roc)
+    rng = numpy.random.RandomState(1)
+    for filename, rocnames in files.items():
+        with open(os.path.join(config, 'dac/0', filename), 'w') as f:
+            for roc in rocnames:
+                f.write('ROC:           %s\n'%roc)
+                for reg, val in zip(dacRegisters, dacDefaults):
+                    if reg == 'VcThr': val = rng.randint(70, 90)
+                    f.write('%s%d\n'%((reg + ':').ljust(15), val))
+    return len(rocs), len(files)
+
+
+def createHistos(kind, roc, rng):
+    # returns the objects of the ROC, the first one is the one to write. They are owned
+    # by python and deleted as soon as they are not referenced anymore
+    if kind == 'SCurve':
+        h = ROOT.TH1F(roc + '_Threshold1D', roc + '_Threshold1D', 255, 0., 255.)
+        thr = rng.normal(rng.uniform(30., 60.), 3., 4160)
+        histoBuffer(h)[:] = numpy.bincount(numpy.clip(thr.astype(int)+1, 0, 256), minlength=257)
+        h.ResetStats()
+        return [h]
+    if kind == 'PixelAlive':
+        h = ROOT.TH2F(roc + ' (inv)', roc, 52, 0., 52., 80, 0., 80.)
+        eff = numpy.where(rng.uniform(size=(80, 52)) < 0.002, 0., 100.)
+        histoContents(h)[:] = eff
+        h.ResetStats()
+        return [h]
+    # VcThr (x) vs Vcal (y) efficiency, turning on at VcThr = a + b*Vcal
+    h = ROOT.TH2F(roc, roc, 128, 0., 256., 64, 0., 256.)
+    a, b = rng.uniform(20., 40.), rng.uniform(0.8, 1.2)
+    VcThr = numpy.arange(1., 256., 2.)
+    Vcal = numpy.arange(2., 256., 4.)
+    histoContents(h)[:] = 1./(1. + numpy.exp(-(VcThr[numpy.newaxis, :] - a - b*Vcal[:, numpy.newaxis])/3.))
+    h.ResetStats()
+    c = ROOT.TCanvas(roc, roc)
+    h.Draw('colz')
+    return [c, h]
+
+
+def writeRun(base, kind, modules, nFiles, rng):
+    path = os.path.join(base, 'output', 'Run_0', 'Run_%d'%runs[kind])
+    if not os.path.isdir(path): os.makedirs(path)
+    with open(os.path.join(path, 'PixelConfigurationKey.txt'), 'w') as f:
+        f.write('Configuration key used\nkey: 1\n')
+    for n in range(nFiles):
+        filename = os.path.join(path, '%s_Fed_%d_Run_%d.root'%(filePrefix[kind], n+1, runs[kind]))
+        print "Writing ", filename
+        f = ROOT.TFile(filename, 'RECREATE')
+        for name, folders, rocnames in modules[n::nFiles]:
+            d = f
+            for folder in folders:
+                d = d.GetDirectory(folder) or d.mkdir(folder)
+            d.cd()
+            for roc in rocnames:
+                objs = createHistos(kind, roc, rng)
+                objs[0].Write()
+        f.Close()
+
+
+if __name__ == '__main__':
+    usage = 'usage: %prog -o outputDir'
+    parser = optparse.OptionParser(usage)
+    parser.add_option('-o', '--output', dest='output', type='string', help='Folder where the synthetic results are created')
+    parser.add_option('', '--fraction', dest='fraction', type='float', default=1., help='Fraction of the detector modules to create. Default is 1 (full detector)')
+    parser.add_option('', '--nFiles', dest='nFiles', type='int', default=40, help='Number of ROOT files (FEDs) per run. Default is 40')
+    parser.add_option('', '--nKeys', dest='nKeys', type='int', default=20000, help='Number of keys in configurations.txt. Default is 20000')
+    (opt, args) = parser.parse_args()
+    sys.argv.append('-b')
+
+    if opt.output is None:
+        parser.error('Please define the output folder')
+
+    ROOT.gROOT.SetBatch(True)
+    modules = detectorModules()
+    modules = modules[:max(1, int(len(modules)*opt.fraction))]
+    nRocs, nModuleFiles = writeConfig(opt.output, modules, opt.nKeys)
+    rng = numpy.random.RandomState(0)
+    for kind in ['VcThrVcal', 'SCurve', 'PixelAlive']:
+        writeRun(opt.output, kind, modules, opt.nFiles, rng)
+
+    with open(os.path.join(opt.output, 'synthetic.json'), 'w') as f:
+        json.dump({'rocs': nRocs, 'modules': len(modules), 'moduleFiles': nModuleFiles, 'runs': runs}, f, indent=2)
+    print "Created %d ROCs in %d modules (%d dac module files)"%(nRocs, len(modules), nModuleFiles)
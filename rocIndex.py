@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Persistent index of the objects stored for each ROC in the calibration files of a run.
+#  The index is a SQLite file saved in the run directory (rocIndex.sqlite) mapping
+#  ROC name and histogram type to file, directory and key name, so that the
+#  histograms can be read without walking the directory tree of the files again.
+#  A file is (re)indexed the first time it is accessed and whenever its mtime or size change.
+#
+#  Histogram types: 'Threshold1D' (and the other <ROC>_<type> histos of SCurve files),
+#  'Efficiency' (PixelAlive TH2, <ROC> (inv)) and 'VcThrVcal' (canvas of 2DEfficiency files)
+#
+#  - RocIndex(path, files): open (and update) the index of the run directory path
+#    -- path:  run directory
+#    -- files: list of ROOT files of the run to index
+#
+#  - RocIndex.locate(roc, htype): (file, directory, key) of the object, None if not found
+#
+#  - RocIndex.locations(htype): list of (roc, file, directory, key) for all ROCs,
+#    ordered by file and as in the file
+#
+#  - RocIndex.getObject(roc, htype) / RocIndex.getByKey(key): read a single object
+#
+#  - RocIndex.closeFile(file): close a file opened by the index
+#
+#  - readIndexedObjects(index, htype, skip): generator yielding (roc, object) for all
+#    the ROCs with an object of type htype, each file is opened only once. The objects
+#    of the ROCs in the optional set skip are not read. Each object is deleted when the
+#    next one is read and each file closed when done, they must not be kept. An object
+#    not found in its file (index out of date) is skipped and its file indexed again next time
+#
+# ***************************************************************************************************************
+
+
+import os
+import re
+import sqlite3
+from calibEnv import ROOT
+from browseCalibFiles import *
+
+
+indexName = 'rocIndex.sqlite'
+
+# e.g. BPix_BmI_SEC4_LYR1_LDR5F_MOD1_ROC0_Threshold1D, FPix_BmI_D1_BLD1_PNL1_PLQ1_ROC0 (inv)
+_keyPattern = re.compile(r'^(.*_ROC\d+)(?:_(\w+))?( \(inv\))?$')
+
+
+def splitKeyName(name, className):
+    # returns (roc name, histogram type) for the given key, None if it is not a ROC object
+    m = _keyPattern.match(name)
+    if m is None: return None
+    roc, htype = m.group(1), m.group(2)
+    if htype is None:
+        if className == 'TCanvas': htype = 'VcThrVcal'
+        elif className.startswith('TH2'): htype = 'Efficiency'
+        else: htype = className
+    return roc, htype
+
+
+class RocIndex:
+    def __init__(self, path, files):
+        self.filename = os.path.join(path, indexName)
+        self.db = sqlite3.connect(self.filename)
+        # indexes written before the position of the objects was kept are built again
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(objects)')]
+        if columns and 'position' not in columns:
+            self.db.execute('DROP TABLE objects')
+            self.db.execute('DROP TABLE IF EXISTS files')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, mtime REAL, size INTEGER)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS objects (roc TEXT, htype TEXT, file TEXT, dir TEXT, key TEXT, position INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS objects_roc ON objects (htype, roc)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS objects_key ON objects (key)')
+        self.openFiles = {}
+        self.update(files)
+
+    def update(self, files):
+        known = dict((name, (mtime, size)) for name, mtime, size in self.db.execute('SELECT name, mtime, size FROM files'))
+        for name in set(known) - set(files):
+            self.removeFile(name)
+        for file in files:
+            st = os.stat(file)
+            if known.get(file) != (st.st_mtime, st.st_size):
+                self.indexFile(file, st)
+        self.db.commit()
+
+    def removeFile(self, file):
+        self.db.execute('DELETE FROM objects WHERE file = ?', (file,))
+        self.db.execute('DELETE FROM files WHERE name = ?', (file,))
+
+    def indexFile(self, file, st):
+        print "Indexing file ", file
+        self.removeFile(file)
+        rows = []
+        for f, path, d in walkROCDirs([file]):
+            for key in d.GetListOfKeys():
+                roc = splitKeyName(key.GetName(), key.GetClassName())
+                if roc is not None:
+                    rows.append((roc[0], roc[1], file, path, key.GetName(), len(rows)))
+        self.db.executemany('INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.db.execute('INSERT INTO files VALUES (?, ?, ?)', (file, st.st_mtime, st.st_size))
+
+    def locate(self, roc, htype):
+        return self.db.execute('SELECT file, dir, key FROM objects WHERE htype = ? AND roc = ?', (htype, roc)).fetchone()
+
+    def locations(self, htype):
+        # by file and position, not rowid: a file indexed again keeps its place
+        return self.db.execute('SELECT roc, file, dir, key FROM objects WHERE htype = ? ORDER BY file, position', (htype,)).fetchall()
+
+    def invalidateFile(self, file):
+        # the file is indexed again at the next update
+        self.db.execute('DELETE FROM files WHERE name = ?', (file,))
+        self.db.commit()
+
+    def openFile(self, file):
+        if file not in self.openFiles:
+            count('files opened')
+            self.openFiles[file] = ROOT.TFile.Open(file)
+        return self.openFiles[file]
+
+    def closeFile(self, file):
+        if file in self.openFiles:
+            self.openFiles.pop(file).Close()
+
+    def getObject(self, roc, htype):
+        loc = self.locate(roc, htype)
+        if loc is None: return None
+        file, dir, key = loc
+        return self.openFile(file).Get(dir + '/' + key)
+
+    def getByKey(self, key):
+        loc = self.db.execute('SELECT file, dir FROM objects WHERE key = ?', (key,)).fetchone()
+        if loc is None: return None
+        return self.openFile(loc[0]).Get(loc[1] + '/' + key)
+
+
+def readIndexedObjects(index, htype, skip=None):
+    currentFile, f = None, None
+    for roc, file, dir, key in index.locations(htype):
+        if(skip and roc in skip): continue
+        if file != currentFile:
+            if currentFile is not None: index.closeFile(currentFile)
+            print "Opening file ",  file
+            currentFile, f = file, index.openFile(file)
+        obj = f.Get(dir + '/' + key)
+        if not obj:
+            print "Cannot find %s/%s in %s, the file will be indexed again"%(dir, key, file)
+            index.invalidateFile(file)
+            continue
+        yield roc, obj
+        releaseObject(obj)
+    if currentFile is not None: index.closeFile(currentFile)
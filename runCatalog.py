@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Catalog of the run folders of the output area (POS_OUTPUT_DIRS/Run_N000/Run_N). The files of
+#  each run are listed once, classified by calibration type (SCurveSmartRange, SCurve,
+#  2DEfficiency, PixelAlive, from the start of the file name) and kept with their size and mtime.
+#  A run folder is listed again only when its mtime changed (files added, removed or renamed),
+#  and a folder Run_N000 only when its own mtime changed, so the runs of a calibration type are
+#  found without walking the whole tree. The catalog is saved in the output area
+#  (runCatalog.idx) and kept in memory. The folders are listed with os.scandir, or the scandir
+#  module, or os.listdir and os.stat when none of them is there.
+#
+#  Usage: python runCatalog.py PixelAlive        lists the runs with PixelAlive files
+#         python runCatalog.py -r 1234           lists the files of run 1234
+#
+#  - getRunCatalog(runDir): return the RunCatalog of the output area (default POS_OUTPUT_DIRS)
+#
+#  - RunCatalog.runPath(run): folder of a run, as '%s/Run_%s/Run_%d/'
+#
+#  - RunCatalog.runFiles(run, prefix, ext): paths of the files of the run whose name starts
+#    with prefix and ends with ext, as the os.listdir filters of the iterations
+#
+#  - RunCatalog.entries(run): dictionary file name -> (calibration type, size, mtime) of a run,
+#    the calibration type is None for the other files
+#
+#  - RunCatalog.runs(calibType): runs with files of the calibration type (all runs if None)
+#
+#  - RunCatalog.update(): look for new runs in the Run_N000 folders which changed
+#
+# ***************************************************************************************************************
+
+
+import os
+import stat
+import time
+import cPickle
+import optparse
+from calibEnv import *
+from calibTrace import *
+from browseCalibFiles import *
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+catalogName = 'runCatalog.idx'
+# the longest prefix first: SCurveSmartRange files are not SCurve files
+calibTypes = ('SCurveSmartRange', 'SCurve', '2DEfficiency', 'PixelAlive')
+# a folder modified less than this many seconds before it was listed is listed again next
+# time, files may still have been added within the same mtime
+_settleTime = 2.
+_catalogs = {}
+
+
+def calibType(filename):
+    for t in calibTypes:
+        if filename.startswith(t): return t
+    return None
+
+
+def _scan(path, withStat=True):
+    # list of (name, is a folder, size, mtime) of the entries of path
+    entries = []
+    if scandir is not None:
+        for entry in scandir(path):
+            if not withStat:
+                entries.append((entry.name, entry.is_dir(), 0, 0))
+                continue
+            try: st = entry.stat()
+            except OSError: st = entry.stat(follow_symlinks=False)   # broken link
+            entries.append((entry.name, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime))
+    else:
+        for name in os.listdir(path):
+            filename = os.path.join(path, name)
+            if not withStat:
+                entries.append((name, os.path.isdir(filename), 0, 0))
+                continue
+            try: st = os.stat(filename)
+            except OSError: st = os.lstat(filename)
+            entries.append((name, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime))
+    count('folders listed')
+    return entries
+
+
+def _runNumber(name):
+    if not name.startswith('Run_') or not name[4:].isdigit(): return None
+    return int(name[4:])
+
+
+def _mtime(path):
+    # mtime of a folder, None when it may still change within its mtime
+    mtime = os.stat(path).st_mtime
+    if time.time() - mtime < _settleTime: return None
+    return mtime
+
+
+class RunCatalog:
+    def __init__(self, runDir=None):
+        if runDir is None: runDir = calibConfig.runDir
+        self.runDir = runDir
+        self.filename = os.path.join(runDir, catalogName)
+        self.groups = {}    # Run_N000 folder -> mtime when it was listed
+        self.folders = {}   # run -> (Run_N000 folder, mtime when listed, {file: (type, size, mtime)})
+        self.modified = False
+        try:
+            with open(self.filename, 'rb') as f:
+                self.groups, self.folders = cPickle.load(f)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            pass
+
+    def save(self):
+        if not self.modified: return
+        try:
+            tmpname = '%s.%d'%(self.filename, os.getpid())
+            with open(tmpname, 'wb') as f:
+                cPickle.dump((self.groups, self.folders), f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmpname, self.filename)
+            self.modified = False
+        except (IOError, OSError):
+            print "Cannot write the run catalog ", self.filename
+
+    def runPath(self, run):
+        return '%s/Run_%s/Run_%d/'%(self.runDir, runfolder(run), run)
+
+    def _listRun(self, run, group):
+        path = os.path.join(self.runDir, group, 'Run_%d'%run)
+        mtime = _mtime(path)
+        old = self.folders.get(run, (None, None, {}))[2]
+        files = {}
+        for name, isDir, size, fileMtime in _scan(path):
+            if isDir: continue
+            # the type of the files already known is kept, only the new ones are classified
+            files[name] = (old[name][0] if name in old else calibType(name), size, fileMtime)
+        self.folders[run] = (group, mtime, files)
+        self.modified = True
+        return files
+
+    def entries(self, run):
+        group = 'Run_%s'%runfolder(run)
+        cached = self.folders.get(run)
+        if cached is not None:
+            try: mtime = os.stat(os.path.join(self.runDir, cached[0], 'Run_%d'%run)).st_mtime
+            except OSError: mtime = None
+            if mtime is not None and mtime == cached[1]: return cached[2]
+            group = cached[0]
+        if not os.path.isdir(os.path.join(self.runDir, group, 'Run_%d'%run)):
+            if run in self.folders:
+                del self.folders[run]
+                self.modified = True
+            return {}
+        files = self._listRun(run, group)
+        self.save()
+        return files
+
+    def runFiles(self, run, prefix='', ext=''):
+        path = self.runPath(run)
+        return [path + name for name in sorted(self.entries(run)) if name.startswith(prefix) and name.endswith(ext)]
+
+    def update(self):
+        # only the Run_N000 folders whose mtime changed are listed, the new runs in them are
+        # listed once, the runs already known are listed again by entries when they change
+        # or by update as long as they were modified just before being listed
+        if not os.path.isdir(self.runDir): return
+        found = set()
+        for group, isDir, size, mtime in _scan(self.runDir, withStat=False):
+            if not isDir or _runNumber(group) is None: continue
+            found.add(group)
+            path = os.path.join(self.runDir, group)
+            groupMtime = os.stat(path).st_mtime
+            if self.groups.get(group) == groupMtime: continue
+            runs = set()
+            for name, isRunDir, s, m in _scan(path, withStat=False):
+                run = _runNumber(name)
+                if not isRunDir or run is None: continue
+                runs.add(run)
+                if run not in self.folders: self._listRun(run, group)
+            for run in [r for r, cached in self.folders.items() if cached[0] == group and r not in runs]:
+                del self.folders[run]
+            self.groups[group] = _mtime(path)
+            self.modified = True
+        # the runs listed while they were still being written
+        for run, (group, mtime, files) in self.folders.items():
+            if mtime is None and group in found:
+                try: self._listRun(run, group)
+                except OSError: pass
+        for group in [g for g in self.groups if g not in found]:
+            del self.groups[group]
+            for run in [r for r, cached in self.folders.items() if cached[0] == group]:
+                del self.folders[run]
+            self.modified = True
+        self.save()
+
+    def runs(self, calibType=None):
+        self.update()
+        return sorted(run for run, (group, mtime, files) in self.folders.items()
+                      if calibType is None or any(f[0] == calibType for f in files.values()))
+
+
+def getRunCatalog(runDir=None):
+    if runDir is None: runDir = calibConfig.runDir
+    if runDir not in _catalogs: _catalogs[runDir] = RunCatalog(runDir)
+    return _catalogs[runDir]
+
+
+if __name__ == '__main__':
+    usage = 'usage: %prog [calibration type] | -r run'
+    parser = optparse.OptionParser(usage)
+    parser.add_option('-d', '--dir', dest='dir', type='string', default=None, help='Output area of the runs. Default is $POS_OUTPUT_DIRS')
+    parser.add_option('-r', '--run', dest='run', type='int', default=None, help='List the files of the run')
+    (opt, args) = parser.parse_args()
+    if len(args) > 1 or (args and args[0] not in calibTypes):
+        parser.error('Please give one calibration type (%s)'%', '.join(calibTypes))
+
+    start = time.time()
+    catalog = getRunCatalog(opt.dir)
+    if opt.run is not None:
+        for name, (t, size, mtime) in sorted(catalog.entries(opt.run).items()):
+            print "%-50s %-16s %12d  %s"%(name, t or '-', size, time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime)))
+    else:
+        runs = catalog.runs(args[0] if args else None)
+        for run in runs:
+            print run
+        print "%d runs"%len(runs)
+    print "(%.2f s)"%(time.time()-start)
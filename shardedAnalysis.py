@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Run PixelAnalysis.exe on a run split in FED shards, with several processes at the same time.
+#  Each shard gets its own output area (<run folder>/shards/Fed_N/, used as POS_OUTPUT_DIRS)
+#  with links to the .dmp files of its FED and to the other files of the run, its own copy of
+#  the analysis configuration and its own log file. Progress and failures are printed as soon
+#  as each shard ends. The ROOT files produced by the shards are moved back side by side in the
+#  run folder (renamed with the FED number if needed), so that the browse functions find them.
+#
+#  - fedShards(path, prefix): dictionary FED number -> .dmp files of the run folder path
+#    starting with prefix, and list of the .dmp files starting with prefix without FED number
+#
+#  - prepareShard(path, run, fed, files, config, rename): create the output area of a shard
+#    -- rename: optional (old, new) replacement applied to the .dmp names, e.g.
+#       ('SCurveSmartRange', 'SCurve')
+#
+#  - runShards(shards, exe, run, nParallel, logname): run up to nParallel PixelAnalysis.exe at
+#    the same time, each one logging to logname_Fed_N.log. Returns the list of the failed shards
+#
+#  - collectShardOutputs(path, shards): move the outputs of the shards in the run folder
+#
+#  - runShardedAnalysis(run, path, exe, config, prefix, nParallel, logname, rename): all of the above.
+#    Returns the outputs and the failed shards, or None, without running anything, when a .dmp
+#    file has no FED number: the run is then to be analyzed by a single PixelAnalysis.exe
+#
+# ***************************************************************************************************************
+
+
+import os
+import re
+import time
+import shutil
+import subprocess
+from browseCalibFiles import *
+from stageFiles import *
+
+
+_fedPattern = re.compile(r'_Fed_?(\d+)', re.IGNORECASE)
+
+
+class Shard:
+    def __init__(self, fed, root, runDir, config):
+        self.fed = fed
+        self.root = root        # POS_OUTPUT_DIRS of the shard
+        self.runDir = runDir    # run folder of the shard
+        self.config = config    # configuration file of the shard
+        self.process = None
+        self.start = 0.
+        self.log = None
+
+
+def fedShards(path, prefix):
+    shards = {}
+    leftOut = []
+    for f in sorted(os.listdir(path)):
+        if not f.startswith(prefix) or not f.endswith(".dmp"): continue
+        m = _fedPattern.search(f)
+        if m is None: leftOut.append(os.path.join(path, f))
+        else: shards.setdefault(int(m.group(1)), []).append(os.path.join(path, f))
+    return shards, leftOut
+
+
+def prepareShard(path, run, fed, files, config, rename=None):
+    root = os.path.join(path, 'shards', 'Fed_%d'%fed)
+    runDir = os.path.join(root, 'Run_%s'%runfolder(run), 'Run_%d'%run)
+    if os.path.isdir(root): shutil.rmtree(root)
+    os.makedirs(runDir)
+    # the .dmp files of the FED and the other files of the run (configuration key, ...)
+    pairs = []
+    for f in files:
+        name = os.path.basename(f)
+        if rename is not None: name = name.replace(rename[0], rename[1])
+        pairs.append((f, os.path.join(runDir, name)))
+    for f in os.listdir(path):
+        if os.path.isfile(os.path.join(path, f)) and not f.endswith(".dmp") and not f.endswith(".root"):
+            pairs.append((os.path.join(path, f), os.path.join(runDir, f)))
+    stageFiles(pairs)
+    # configuration of the shard: same as the one of the run, pointing to the shard folders
+    shardConfig = os.path.join(root, os.path.basename(config))
+    with open(config) as f:
+        text = f.read()
+    with open(shardConfig, 'w') as f:
+        f.write(text.replace(os.path.dirname(os.path.dirname(path.rstrip('/'))), root))
+    return Shard(fed, root, runDir, shardConfig)
+
+
+def _launch(shard, exe, run, logname):
+    env = dict(os.environ)
+    env['POS_OUTPUT_DIRS'] = shard.root
+    shard.log = open('%s_Fed_%d.log'%(logname, shard.fed), 'w')
+    cmd = '%s %s %d'%(exe, shard.config, run)
+    shard.start = time.time()
+    shard.process = subprocess.Popen(cmd, shell = True, stdout=shard.log, stderr=subprocess.STDOUT, cwd=shard.root, env=env)
+
+
+def runShards(shards, exe, run, nParallel, logname, poll=0.5):
+    waiting = list(shards)
+    running = []
+    failed = []
+    done = 0
+    while waiting or running:
+        while waiting and len(running) < nParallel:
+            shard = waiting.pop(0)
+            _launch(shard, exe, run, logname)
+            running.append(shard)
+        time.sleep(poll)
+        for shard in list(running):
+            code = shard.process.poll()
+            if code is None: continue
+            running.remove(shard)
+            shard.log.close()
+            done += 1
+            if code != 0:
+                failed.append(shard)
+                print "[%d/%d] FED %d FAILED with exit code %d after %.0f s, see %s"%(done, len(shards), shard.fed, code, time.time()-shard.start, shard.log.name)
+            else:
+                print "[%d/%d] FED %d done in %.0f s"%(done, len(shards), shard.fed, time.time()-shard.start)
+    return failed
+
+
+def collectShardOutputs(path, shards):
+    outputs = []
+    merged = set()
+    for shard in shards:
+        for f in os.listdir(shard.runDir):
+            src = os.path.join(shard.runDir, f)
+            if not f.endswith(".root") or os.path.islink(src): continue
+            dest = os.path.join(path, f)
+            if os.path.exists(dest) or _fedPattern.search(f) is None:
+                dest = os.path.join(path, f.replace(".root", "_Fed_%d.root"%shard.fed))
+            shutil.move(src, dest)
+            outputs.append(dest)
+        # other outputs of the analysis, e.g. mapRocOffset.txt written by each PixelAnalysis.exe in
+        # its working folder (the shard folder), are appended shard after shard
+        for f in os.listdir(shard.root):
+            src = os.path.join(shard.root, f)
+            if f.endswith(".txt") and os.path.isfile(src):
+                # start from scratch the first time, not on top of a previous analysis
+                with open(os.path.join(path, f), 'a' if f in merged else 'w') as out:
+                    out.write(open(src).read())
+                merged.add(f)
+    return outputs
+
+
+def runShardedAnalysis(run, path, exe, config, prefix, nParallel, logname, rename=None):
+    feds, leftOut = fedShards(path, prefix)
+    if not feds:
+        print "No %s .dmp file with a FED number in %s, the run cannot be split in FED shards"%(prefix, path)
+        return None
+    if leftOut:
+        # they would not be analyzed at all
+        print "%d %s .dmp files without FED number, the run cannot be split in FED shards:"%(len(leftOut), prefix)
+        for f in leftOut: print "   ", os.path.basename(f)
+        return None
+    shards = [prepareShard(path, run, fed, files, config, rename) for fed, files in sorted(feds.items())]
+    print "Running %d FED shards, %d at a time"%(len(shards), nParallel)
+    with timer('runShards', shards=len(shards), parallel=nParallel):
+        failed = runShards(shards, exe, run, nParallel, logname)
+    outputs = collectShardOutputs(path, [s for s in shards if s not in failed])
+    for shard in shards:
+        if shard not in failed: shutil.rmtree(shard.root)
+    if failed:
+        print "Failed FEDs: ", " ".join(str(s.fed) for s in failed), " - their folders are kept in ", os.path.join(path, 'shards')
+    return outputs, failed
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Staging of files under a different name without duplicating the data, e.g. the
+#  SCurveSmartRange*.dmp files that PixelAnalysis.exe looks for as SCurve*.dmp.
+#  A file is staged as a hard link, as a symbolic link if hard links are not possible
+#  (e.g. different file systems) and only as a last resort copied. Copies are made by
+#  a pool of threads and keep size and mtime of the source, so that a file already
+#  staged and identical to its source is recognized and left as it is.
+#
+#  - stageFile(src, dest): stage src as dest, returns how ('present', 'link', 'symlink')
+#    or 'copy' if the file has to be copied
+#
+#  - stageFiles(pairs, nWorkers): stage a list of (src, dest), copies are made in parallel.
+#    Returns the list of the staged aliases
+#
+#  - unstageFiles(aliases): remove the staged aliases
+#
+# ***************************************************************************************************************
+
+
+import os
+import shutil
+from multiprocessing.pool import ThreadPool
+
+
+def isStaged(src, dest):
+    if not os.path.exists(dest): return False
+    if os.path.samefile(src, dest): return True
+    s, d = os.stat(src), os.stat(dest)
+    return (s.st_size, s.st_mtime) == (d.st_size, d.st_mtime)
+
+
+def stageFile(src, dest):
+    if isStaged(src, dest): return 'present'
+    if os.path.lexists(dest): os.remove(dest)
+    try:
+        os.link(src, dest)
+        return 'link'
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(src), dest)
+        return 'symlink'
+    except OSError:
+        return 'copy'
+
+
+def _copyFile(pair):
+    src, dest = pair
+    shutil.copyfile(src, dest + '.tmp')
+    shutil.copystat(src, dest + '.tmp')
+    os.rename(dest + '.tmp', dest)
+
+
+def stageFiles(pairs, nWorkers=4):
+    counts = {}
+    copies = []
+    for src, dest in pairs:
+        how = stageFile(src, dest)
+        counts[how] = counts.get(how, 0) + 1
+        if how == 'copy': copies.append((src, dest))
+    if copies:
+        pool = ThreadPool(nWorkers)
+        try:
+            pool.map(_copyFile, copies)
+        finally:
+            pool.close()
+            pool.join()
+    print "Staged %d files: %s"%(len(pairs), ", ".join('%d %s'%(n, how) for how, n in sorted(counts.items())))
+    return [dest for src, dest in pairs]
+
+
+def unstageFiles(aliases):
+    for alias in aliases:
+        if os.path.lexists(alias): os.remove(alias)
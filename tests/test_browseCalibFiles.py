@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Tests of the directory walker of browseCalibFiles.py: only the directories are browsed, not
+#  the histos and canvases of the ROC folders (TKey.IsFolder() is true for them too).
+#  - WalkerKeysTest: folders, histos and canvases as fake keys, no ROOT needed
+#  - WalkerSyntheticTest: small files written by makeSyntheticRun, skipped without ROOT
+#
+#  Usage: python -m unittest discover tests
+#
+# ***************************************************************************************************************
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import browseCalibFiles
+from browseCalibFiles import *
+
+try:
+    import ROOT
+    ROOT.gROOT.SetBatch(True)
+except ImportError:
+    ROOT = None
+
+
+class FakeClass:
+    def __init__(self, name): self.name = name
+    def InheritsFrom(self, base): return self.name in ('TDirectory', 'TDirectoryFile')
+
+
+class FakeROOT:
+    class TClass:
+        @staticmethod
+        def GetClass(name): return FakeClass(name)
+
+
+class FakeKey:
+    def __init__(self, name, obj):
+        self.name, self.obj = name, obj
+    def GetName(self): return self.name
+    def GetClassName(self): return 'TDirectoryFile' if isinstance(self.obj, FakeDirectory) else self.obj
+    def IsFolder(self): return True     # as for TH1 and TPad
+    def ReadObj(self): return self.obj
+
+
+class FakeDirectory:
+    def __init__(self, children):
+        self.keys = [FakeKey(name, FakeDirectory(c) if isinstance(c, dict) else c) for name, c in sorted(children.items())]
+    def GetListOfKeys(self): return self.keys
+
+
+class WalkerKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.root = browseCalibFiles.ROOT
+        browseCalibFiles.ROOT = FakeROOT()
+        browseCalibFiles._directoryClasses.clear()
+
+    def tearDown(self):
+        browseCalibFiles.ROOT = self.root
+        browseCalibFiles._directoryClasses.clear()
+
+    def testLeafDirectories(self):
+        tree = FakeDirectory({'BmI': {'MOD1': {'MOD1_ROC0_Threshold1D': 'TH1F', 'MOD1_ROC0': 'TCanvas'},
+                                      'MOD2': {'MOD2_ROC0 (inv)': 'TH2F'}},
+                              'BmO': {}})
+        leaves = [path for path, d in walkDirectories(tree, None, 'BPix')]
+        self.assertEqual(leaves, ['BPix/BmI/MOD1', 'BPix/BmI/MOD2', 'BPix/BmO'])
+        self.assertEqual([path for path, d in walkDirectories(tree, 1, 'BPix')], ['BPix/BmI', 'BPix/BmO'])
+
+
+@unittest.skipIf(ROOT is None, 'ROOT is not available')
+class WalkerSyntheticTest(unittest.TestCase):
+    def setUp(self):
+        import makeSyntheticRun
+        import numpy
+        self.dir = tempfile.mkdtemp()
+        modules = makeSyntheticRun.detectorModules()
+        # a few BPix and FPix modules, 2 files
+        self.modules = modules[:3] + [m for m in modules if m[0].startswith('FPix')][:3]
+        rng = numpy.random.RandomState(0)
+        self.files = {}
+        for kind in ('SCurve', 'VcThrVcal'):
+            makeSyntheticRun.writeRun(self.dir, kind, self.modules, 2, rng)
+            path = os.path.join(self.dir, 'output', 'Run_0', 'Run_%d'%makeSyntheticRun.runs[kind])
+            self.files[kind] = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.root'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testROCDirs(self):
+        for kind in ('SCurve', 'VcThrVcal'):
+            leaves = []
+            for file, path, d in walkROCDirs(self.files[kind]):
+                names = [k.GetName() for k in d.GetListOfKeys()]
+                leaves.append((path.split('/')[-1], len(names)))
+            self.assertEqual(sorted(leaves), sorted((m[0], len(m[2])) for m in self.modules))
+
+    def testSubtrees(self):
+        subtrees = set()
+        for file in self.files['SCurve']:
+            subtrees.update(listROCSubtrees(file))
+        self.assertEqual(subtrees, set('/'.join(m[1][:2]) for m in self.modules))
+
+
+if __name__ == '__main__':
+    unittest.main()
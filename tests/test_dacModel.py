@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Tests of dacModel.py: the dac files are written back the same way after a load, also with a
+#  register found twice in a ROC block.
+#
+#  Usage: python -m unittest discover tests
+#
+# ***************************************************************************************************************
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dacModel import *
+
+
+moduleText = '''ROC:           BPix_BmI_SEC1_LYR1_LDR1F_MOD1_ROC0
+Vdd:           6
+VcThr:         80
+Vcal:          200
+ROC:           BPix_BmI_SEC1_LYR1_LDR1F_MOD1_ROC1
+Vdd:           6
+VcThr:         85
+VcThr:         90
+Vcal:          100%
+'''
+
+
+class DacVersionTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = 'ROC_DAC_module_BPix_BmI_SEC1_LYR1_LDR1F_MOD1.dat'
+        with open(os.path.join(self.dir, self.filename), 'w') as f:
+            f.write(moduleText)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testRoundTrip(self):
+        dac = DacVersion.load(self.dir)
+        self.assertEqual(dac.fileText(self.filename), moduleText)
+
+    def testDuplicatedRegister(self):
+        # the second VcThr of ROC1 is kept as text, only the first one is in the matrix
+        dac = DacVersion.load(self.dir)
+        row, col = dac.index['BPix_BmI_SEC1_LYR1_LDR1F_MOD1_ROC1'], dac.columns['VcThr']
+        self.assertEqual(dac.values[row, col], 85)
+        dac.addDeltas(numpy.array([2, 2]))
+        text = dac.fileText(self.filename)
+        self.assertIn('VcThr:         87\nVcThr:         90\n', text)
+        self.assertIn('VcThr:         82\n', text)
+        self.assertIn('Vcal:          100%\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Tests of deadPixelMaps.py: packing of the dead pixels, counts, masks, failing ROCs and
+#  differences between two runs.
+#
+#  Usage: python -m unittest discover tests
+#
+# ***************************************************************************************************************
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from deadPixelMaps import *
+
+
+deadPixels = {'ROC_A': [(1, 1), (52, 80)],
+              'ROC_B': [],
+              'ROC_C': [(3, 4), (5, 6), (7, 8)]}
+
+
+class DeadPixelMapsTest(unittest.TestCase):
+    def testPacking(self):
+        maps = DeadPixelMaps.fromDeadPixels(deadPixels)
+        self.assertEqual(list(maps.names), ['ROC_A', 'ROC_B', 'ROC_C'])
+        self.assertEqual(maps.bits.shape, (3, 80*52/8))
+        for name, pixels in deadPixels.items():
+            self.assertEqual(sorted(maps.deadPixels(name)), sorted(pixels))
+
+    def testEmpty(self):
+        maps = DeadPixelMaps.fromDeadPixels({})
+        self.assertEqual(maps.bits.shape, (0, 80*52/8))
+        self.assertEqual(list(maps.counts()), [])
+        self.assertEqual(maps.failingRocs(0), [])
+
+    def testSaveLoad(self):
+        d = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(d, mapsName)
+            DeadPixelMaps.fromDeadPixels(deadPixels).save(filename)
+            maps = DeadPixelMaps.load(filename)
+            self.assertEqual(maps.shape, rocShape)
+            self.assertEqual(sorted(maps.deadPixels('ROC_C')), deadPixels['ROC_C'])
+        finally:
+            shutil.rmtree(d)
+
+    def testCountsAndMask(self):
+        maps = DeadPixelMaps.fromDeadPixels(deadPixels)
+        self.assertEqual(list(maps.counts()), [2, 0, 3])
+        self.assertEqual(list(maps.mask(['ROC_B'])), [True, False, True])
+        self.assertEqual(maps.failingRocs(1), [('ROC_A', 2), ('ROC_C', 3)])
+        self.assertEqual(maps.failingRocs(1, ['ROC_C']), [('ROC_A', 2)])
+
+    def testDiff(self):
+        before = DeadPixelMaps.fromDeadPixels(deadPixels)
+        after = dict(deadPixels)
+        after['ROC_A'] = [(1, 1)]               # (52, 80) came back
+        after['ROC_B'] = [(10, 20)]             # (10, 20) died
+        after['ROC_D'] = [(1, 2)]               # not in before, not compared
+        after = DeadPixelMaps.fromDeadPixels(after)
+        changes = before.diff(after)
+        self.assertEqual(changes, [('ROC_A', [], [(52, 80)]), ('ROC_B', [(10, 20)], [])])
+        self.assertEqual(before.diff(after, ['ROC_B']), [('ROC_A', [], [(52, 80)])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Tests of shardedAnalysis.py with a stub PixelAnalysis.exe: a script which writes one .root
+#  file per .dmp file of the run folder of its shard and fails for FED 3.
+#
+#  Usage: python -m unittest discover tests
+#
+# ***************************************************************************************************************
+
+
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shardedAnalysis import *
+
+
+# stub of PixelAnalysis.exe config run: POS_OUTPUT_DIRS is the output area of the shard
+stubText = '''#!/bin/sh
+dir=$POS_OUTPUT_DIRS/Run_0/Run_$2
+for f in $dir/*.dmp; do
+    case $f in *Fed_3*) echo "FED 3 broken"; exit 2;; esac
+    touch ${f%.dmp}.root
+done
+echo "offset $(basename $dir)" > $POS_OUTPUT_DIRS/mapRocOffset.txt
+'''
+
+
+class ShardedAnalysisTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'output', 'Run_0', 'Run_12') + '/'
+        os.makedirs(self.path)
+        self.exe = os.path.join(self.dir, 'PixelAnalysis.exe')
+        with open(self.exe, 'w') as f:
+            f.write(stubText)
+        os.chmod(self.exe, stat.S_IRWXU)
+        self.config = os.path.join(self.dir, 'analysis.xml')
+        with open(self.config, 'w') as f:
+            f.write('<OutputDir>%s</OutputDir>\n'%os.path.join(self.dir, 'output'))
+        open(os.path.join(self.path, 'PixelConfigurationKey.txt'), 'w').close()
+        self.logname = os.path.join(self.dir, 'pixelAlive')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def addDmp(self, name):
+        open(os.path.join(self.path, name), 'w').close()
+
+    def testShards(self):
+        for fed in (1, 2):
+            self.addDmp('PixelAlive_Fed_%d_Run_12.dmp'%fed)
+        outputs, failed = runShardedAnalysis(12, self.path, self.exe, self.config, 'PixelAlive', 2, self.logname)
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted(os.path.basename(f) for f in outputs), ['PixelAlive_Fed_1_Run_12.root', 'PixelAlive_Fed_2_Run_12.root'])
+        for f in outputs: self.assertTrue(os.path.isfile(f))
+        self.assertEqual(open(os.path.join(self.path, 'mapRocOffset.txt')).read(), 'offset Run_12\n'*2)
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'shards', 'Fed_1')))
+
+    def testFailedShard(self):
+        for fed in (1, 3):
+            self.addDmp('PixelAlive_Fed_%d_Run_12.dmp'%fed)
+        outputs, failed = runShardedAnalysis(12, self.path, self.exe, self.config, 'PixelAlive', 2, self.logname)
+        self.assertEqual([s.fed for s in failed], [3])
+        self.assertEqual([os.path.basename(f) for f in outputs], ['PixelAlive_Fed_1_Run_12.root'])
+        self.assertIn('FED 3 broken', open(self.logname + '_Fed_3.log').read())
+        self.assertTrue(os.path.isdir(os.path.join(self.path, 'shards', 'Fed_3')))
+
+    def testNoFedNumber(self):
+        # a file without FED number would be left out: the caller runs the analysis in a single process
+        self.addDmp('PixelAlive_Fed_1_Run_12.dmp')
+        self.addDmp('PixelAlive_Run_12.dmp')
+        feds, leftOut = fedShards(self.path, 'PixelAlive')
+        self.assertEqual(sorted(feds), [1])
+        self.assertEqual([os.path.basename(f) for f in leftOut], ['PixelAlive_Run_12.dmp'])
+        self.assertEqual(runShardedAnalysis(12, self.path, self.exe, self.config, 'PixelAlive', 2, self.logname), None)
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'shards')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Columnar summary of the threshold histograms (Threshold1D) of all the ROCs of a run.
+#  The bin contents of every ROC are stacked in one (nROC x nBins+2) array together with the
+#  histogram statistics, so mean, RMS and the number of pixels out of the threshold range
+#  are computed for all the ROCs at once. The table is saved as a .npz file in the run
+#  folder (thresholdSummary.npz) and the list of failing ROCs can be derived from it
+#  again with different cuts without reading the ROOT files.
+#
+#  - iterThresholdHistos(files, skip): generator yielding (ROC name, TH1) of the Threshold1D histos,
+#    the histos of the ROCs in the optional set skip are not read. Each histo is deleted
+#    when the next one is read
+#
+#  - ThresholdSummary.fromHistos(histos): build the table from (ROC name, TH1) pairs
+#
+#  - ThresholdSummary.load(filename) / save(filename): read and write the .npz table
+#
+#  - ThresholdSummary.outOfRange(minThr, maxThr): number of pixels with threshold
+#    below minThr or above maxThr for each ROC, as in checkROCthr
+#
+#  - ThresholdSummary.failingRocs(minMean, minThr, maxThr, maxOutOfRange, skip): list of
+#    (ROC name, mean, RMS) of the failing ROCs not in skip, default cuts are the ones of checkROCthr
+#
+# ***************************************************************************************************************
+
+
+import numpy
+from array import array
+from browseCalibFiles import *
+from histoArrays import *
+
+
+summaryName = 'thresholdSummary.npz'
+
+
+def iterThresholdHistos(files, skip=None):
+    for file, path, d in walkROCDirs(files):
+        for roc in d.GetListOfKeys(): # ROCs, e.g.:  BmI_SEC4_LYR1_LDR5F_MOD1_ROC0
+            name = roc.GetName()
+            if(name.endswith("Threshold1D")):
+                rocname = name.replace("_Threshold1D", "")
+                if(skip and rocname in skip): continue
+                h = roc.ReadObj()
+                count('histos read')
+                yield rocname, h
+                releaseObject(h)
+
+
+class ThresholdSummary:
+    def __init__(self, names, binning, contents, stats):
+        self.names = names          # ROC names
+        self.binning = binning      # (nbins, xmin, xmax) of the Threshold1D histos
+        self.contents = contents    # bin contents, including under/overflow
+        self.stats = stats          # sumw, sumw2, sumwx, sumwx2 as given by TH1::GetStats
+        sumw = numpy.where(stats[:, 0] != 0, stats[:, 0], 1.)
+        self.mean = numpy.where(stats[:, 0] != 0, stats[:, 2]/sumw, 0.)
+        self.rms = numpy.sqrt(numpy.abs(stats[:, 3]/sumw - self.mean*self.mean))
+        self.rms[stats[:, 0] == 0] = 0.
+
+    @classmethod
+    def fromHistos(cls, histos):
+        names, contents, stats = [], [], []
+        binning = None
+        s = array('d', [0.]*4)
+        for name, h in histos:
+            if binning is None: binning = axisBinning(h.GetXaxis())
+            elif axisBinning(h.GetXaxis()) != binning:
+                raise ValueError("Threshold histo of %s has a different binning"%name)
+            names.append(name)
+            contents.append(numpy.array(histoBuffer(h), dtype=numpy.float64))
+            h.GetStats(s)
+            stats.append(list(s))
+        if binning is None: binning = (0, 0., 0.)
+        return cls(numpy.array(names), binning, numpy.array(contents).reshape(len(names), binning[0]+2),
+                   numpy.array(stats).reshape(len(names), 4))
+
+    @classmethod
+    def load(cls, filename):
+        t = numpy.load(filename)
+        nbins, xmin, xmax = t['binning']
+        return cls(t['names'], (int(nbins), xmin, xmax), t['contents'], t['stats'])
+
+    def save(self, filename):
+        numpy.savez_compressed(filename, names=self.names, binning=numpy.array(self.binning),
+                               contents=self.contents, stats=self.stats)
+
+    def outOfRange(self, minThr=30, maxThr=120):
+        # h.Integral(0, h.FindBin(minThr)) + h.Integral(h.FindBin(maxThr), h.GetNbinsX()+1)
+        cumulative = numpy.cumsum(self.contents, axis=1)
+        below = cumulative[:, findBin(self.binning, minThr)]
+        maxBin = findBin(self.binning, maxThr)
+        above = cumulative[:, -1] - (cumulative[:, maxBin-1] if maxBin > 0 else 0.)
+        return below + above
+
+    def failingRocs(self, minMean=35, minThr=30, maxThr=120, maxOutOfRange=2, skip=None):
+        nPixelsOutRange = self.outOfRange(minThr, maxThr)
+        count('ROCs evaluated', len(self.names))
+        failing = []
+        for i in numpy.nonzero((self.mean < minMean) | (nPixelsOutRange > maxOutOfRange))[0]:
+            rocname = self.names[i]
+            if(skip and rocname in skip): continue
+            if(self.mean[i] < minMean):
+                print "ROC failing because of mean Thr <%g: "%minMean, rocname
+            else:
+                print "ROC failing because pixel Thr out of range: ", rocname
+                print "Number of bad pixels: " , nPixelsOutRange[i]
+            failing.append((rocname, self.mean[i], self.rms[i]))
+        return failing
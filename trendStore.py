@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Store of the per-ROC results of all the runs, to follow them over months without reading
+#  the ROOT files again. The store is append-only and columnar: every run adds one segment
+#  per kind of result (a .npz file with the ROC ids and one array per quantity) and a run
+#  recorded again gets a new segment, which hides the older ones. The ROC names are given
+#  ids in the order they are first seen (rocNames.txt, only ever appended to). The store is
+#  in the output folder of the runs (POS_OUTPUT_DIRS/trendStore) and is written by one
+#  process at a time, the iterations.
+#
+#  Kinds of results and their quantities (trendColumns):
+#     threshold   mean, rms             threshold histos of checkROCthr
+#     deadPixels  dead                  number of dead pixels of CountDeadPixels
+#     vcThrFit    a, b, chi2NDF, lowest VcThr(Vcal) fits of fitVcalVcThr
+#
+#  Usage: python trendStore.py history threshold mean BPix_BmI_SEC4
+#         python trendStore.py changed vcThrFit b 10 [-r run1,run2]
+#         python trendStore.py roc threshold BPix_BmI_SEC4_LYR1_LDR5F_MOD1_ROC0
+#
+#  - startTrends() / stopTrends() / trendsStarted(): start keeping the results of recordTrend,
+#    stop keeping them (stopTrends returns the results kept), whether they are kept. Outside
+#    of startTrends and stopTrends (or flushTrends) nothing is kept, e.g. when the analysis
+#    functions are called by benchmarkCalib
+#
+#  - recordTrend(kind, rocname, *values) / recordTrends(kind, names, *columns): keep results until
+#    the end of the iteration, flushTrends(run, store) writes them in the store and stops keeping
+#    them, takeTrendRecords(kind) returns them and forgets them
+#
+#  - withTrendRecords(func, *args) / mergeTrendRecords(results): run func in the workers of
+#    browseROCChainParallel and get its results and its trend records back in the parent
+#
+#  - TrendStore(directory): open (or create) the store, default is POS_OUTPUT_DIRS/trendStore
+#    -- append(kind, run, rows): add the segment of a run, rows are (ROC name, values...)
+#    -- table(kind): dictionary of the arrays run, roc (ids) and quantities of all the runs
+#    -- runs(kind): runs recorded
+#    -- groupHistory(kind, column, prefix): list of (run, mean, number of ROCs) of the ROCs
+#       whose name starts with prefix, e.g. the mean threshold of a sector
+#    -- changedRocs(kind, column, fraction, run1, run2): list of (ROC name, value in run1, value in
+#       run2) of the ROCs whose value changed by more than fraction (default first and last runs)
+#    -- rocHistory(kind, rocname): list of (run, values...) of a ROC
+#
+# ***************************************************************************************************************
+
+
+import os
+import time
+import optparse
+import numpy
+from calibEnv import *
+from calibTrace import *
+
+
+trendDirName = 'trendStore'
+trendColumns = {'threshold':  ('mean', 'rms'),
+                'deadPixels': ('dead',),
+                'vcThrFit':   ('a', 'b', 'chi2NDF', 'lowest')}
+# results kept since startTrends, None when they are not kept
+_pending = None
+
+
+def startTrends():
+    global _pending
+    _pending = {}
+
+
+def stopTrends():
+    global _pending
+    records = _pending or {}
+    _pending = None
+    return records
+
+
+def trendsStarted():
+    return _pending is not None
+
+
+def recordTrend(kind, rocname, *values):
+    if _pending is None: return
+    _pending.setdefault(kind, []).append((rocname,) + values)
+
+
+def recordTrends(kind, names, *columns):
+    if _pending is None: return
+    _pending.setdefault(kind, []).extend(zip(names, *columns))
+
+
+def takeTrendRecords(kind=None):
+    if _pending is None: return [] if kind is not None else {}
+    if kind is not None: return _pending.pop(kind, [])
+    records = dict(_pending)
+    _pending.clear()
+    return records
+
+
+def flushTrends(run, store=None):
+    records = stopTrends()
+    if not records: return
+    if store is None: store = TrendStore()
+    for kind, rows in sorted(records.items()):
+        store.append(kind, run, rows)
+        print "Recorded %d ROCs of run %d in the %s trends"%(len(rows), run, kind)
+
+
+def withTrendRecords(func, *args):
+    # in a worker: the records left by the parent before the fork are not the worker's, the
+    # worker keeps records only if the parent did
+    global _pending
+    parent = _pending
+    if parent is not None: _pending = {}
+    try:
+        res = func(*args)
+        return [(res or [], takeTrendRecords())]
+    finally:
+        _pending = parent
+
+
+def mergeTrendRecords(results):
+    merged = []
+    for res, records in results:
+        merged.extend(res)
+        if _pending is None: continue
+        for kind, rows in records.items():
+            _pending.setdefault(kind, []).extend(rows)
+    return merged
+
+
+class TrendStore:
+    def __init__(self, directory=None):
+        if directory is None: directory = os.path.join(calibConfig.runDir, trendDirName)
+        self.directory = directory
+        if not os.path.isdir(directory): os.makedirs(directory)
+        self.namesFile = os.path.join(directory, 'rocNames.txt')
+        self.names = []
+        if os.path.isfile(self.namesFile):
+            with open(self.namesFile) as f:
+                self.names = f.read().split()
+        self.ids = dict((name, i) for i, name in enumerate(self.names))
+        self._tables = {}
+
+    def rocIds(self, names):
+        new = [name for name in names if name not in self.ids]
+        if new:
+            for name in new:
+                self.ids[name] = len(self.names)
+                self.names.append(name)
+            with open(self.namesFile, 'a') as f:
+                f.write(''.join(name + '\n' for name in new))
+        return numpy.array([self.ids[name] for name in names], dtype=numpy.int32)
+
+    def append(self, kind, run, rows):
+        columns = trendColumns[kind]
+        kindDir = os.path.join(self.directory, kind)
+        if not os.path.isdir(kindDir): os.makedirs(kindDir)
+        values = numpy.array([row[1:] for row in rows], dtype=numpy.float32).reshape(len(rows), len(columns))
+        arrays = dict((column, values[:, i]) for i, column in enumerate(columns))
+        arrays['roc'] = self.rocIds([row[0] for row in rows])
+        # the time of the segment orders the segments of the same run, the last one is used
+        filename = os.path.join(kindDir, '%d.%d.npz'%(run, int(time.time()*1000)))
+        numpy.savez(filename + '.tmp.npz', **arrays)
+        os.rename(filename + '.tmp.npz', filename)
+        count('trend rows written', len(rows))
+
+    def segments(self, kind):
+        kindDir = os.path.join(self.directory, kind)
+        if not os.path.isdir(kindDir): return []
+        latest = {}
+        for f in os.listdir(kindDir):
+            parts = f.split('.')
+            if len(parts) != 3 or parts[2] != 'npz': continue
+            run, stamp = int(parts[0]), int(parts[1])
+            if run not in latest or stamp > latest[run][0]: latest[run] = (stamp, os.path.join(kindDir, f))
+        return [(run, latest[run][1]) for run in sorted(latest)]
+
+    def table(self, kind, columns=None):
+        # only the columns asked for are read, the arrays are kept until a segment is added
+        if columns is None: columns = trendColumns[kind]
+        segments = self.segments(kind)
+        table = {}
+        for column in ('roc',) + tuple(columns):
+            cached = self._tables.get((kind, column))
+            if cached is None or cached[0] != segments:
+                arrays = [numpy.load(filename)[column] for run, filename in segments]
+                dtype = numpy.int32 if column == 'roc' else numpy.float32
+                cached = self._tables[(kind, column)] = (segments, numpy.concatenate(arrays) if arrays else numpy.zeros(0, dtype=dtype),
+                                                         [len(a) for a in arrays])
+            table[column] = cached[1]
+        # run of each row, from the number of rows of the segments
+        lengths = self._tables[(kind, 'roc')][2]
+        table['run'] = numpy.repeat(numpy.array([run for run, filename in segments], dtype=numpy.int32), lengths)
+        return table
+
+    def runs(self, kind):
+        return [run for run, filename in self.segments(kind)]
+
+    def _matching(self, prefix):
+        return numpy.array([name.startswith(prefix) for name in self.names], dtype=bool)
+
+    def groupHistory(self, kind, column, prefix):
+        t = self.table(kind, [column])
+        selected = self._matching(prefix)[t['roc']]
+        runs, inverse = numpy.unique(t['run'][selected], return_inverse=True)
+        n = numpy.bincount(inverse, minlength=len(runs))
+        sums = numpy.bincount(inverse, weights=t[column][selected], minlength=len(runs))
+        return [(int(run), sums[i]/n[i], int(n[i])) for i, run in enumerate(runs)]
+
+    def _valuesOfRun(self, kind, column, run):
+        values = numpy.empty(len(self.names))
+        values.fill(numpy.nan)
+        filename = dict(self.segments(kind)).get(run)
+        if filename is not None:
+            t = numpy.load(filename)
+            values[t['roc']] = t[column]
+        return values
+
+    def changedRocs(self, kind, column, fraction, run1=None, run2=None):
+        runs = self.runs(kind)
+        if not runs: return []
+        if run1 is None: run1 = runs[0]
+        if run2 is None: run2 = runs[-1]
+        before, after = self._valuesOfRun(kind, column, run1), self._valuesOfRun(kind, column, run2)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            change = numpy.abs(after - before)/numpy.abs(before)
+        # ROCs missing in one of the runs (NaN) are not counted as changed
+        changed = numpy.nonzero(~numpy.isnan(change) & (numpy.nan_to_num(change) > fraction))[0]
+        return [(self.names[i], before[i], after[i]) for i in changed]
+
+    def rocHistory(self, kind, rocname):
+        if rocname not in self.ids: return []
+        t = self.table(kind)
+        rows = numpy.nonzero(t['roc'] == self.ids[rocname])[0]
+        return [(int(t['run'][i]),) + tuple(t[column][i] for column in trendColumns[kind]) for i in rows]
+
+
+if __name__ == '__main__':
+    usage = 'usage: %prog history kind column prefix | %prog changed kind column percent | %prog roc kind rocname'
+    parser = optparse.OptionParser(usage)
+    parser.add_option('-d', '--dir', dest='dir', type='string', default=None, help='Folder of the store. Default is $POS_OUTPUT_DIRS/trendStore')
+    parser.add_option('-r', '--runs', dest='runs', type='string', default='', help='With changed: the two runs to compare, e.g. 1200,1350. Default is the first and the last run')
+    (opt, args) = parser.parse_args()
+    if len(args) < 3 or args[0] not in ('history', 'changed', 'roc') or args[1] not in trendColumns:
+        parser.error('Please give a query (history, changed or roc) and a kind (%s)'%', '.join(sorted(trendColumns)))
+
+    start = time.time()
+    store = TrendStore(opt.dir)
+    if args[0] == 'history':
+        if len(args) != 4: parser.error('history needs a kind, a column and a ROC name prefix')
+        print "%8s %10s %6s"%('run', args[2], 'ROCs')
+        for run, mean, n in store.groupHistory(args[1], args[2], args[3]):
+            print "%8d %10.2f %6d"%(run, mean, n)
+    elif args[0] == 'changed':
+        if len(args) != 4: parser.error('changed needs a kind, a column and a percentage')
+        runs = [int(r) for r in opt.runs.split(',')] if opt.runs else [None, None]
+        changed = store.changedRocs(args[1], args[2], float(args[3])/100., *runs)
+        for rocname, before, after in changed:
+            print "%-45s %10.3f -> %10.3f"%(rocname, before, after)
+        print "%d ROCs changed by more than %s%%"%(len(changed), args[3])
+    else:
+        print "%8s "%'run' + " ".join("%10s"%column for column in trendColumns[args[1]])
+        for row in store.rocHistory(args[1], args[2]):
+            print "%8d "%row[0] + " ".join("%10.3f"%v for v in row[1:])
+    print "(%.2f s)"%(time.time()-start)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+# ************************************************************************************************************
+#
+#  Description:
+#  Batched version of the VcThr(Vcal) fits of fitVcalVcThr. Instead of projecting each Vcal
+#  row and fitting a TGraph with MINUIT for every ROC, the efficiency matrices of all the ROCs
+#  are stacked in NumPy arrays, the 0.4 and 0.9 crossings are found for all the Vcal rows at
+#  once and the straight-line fits are solved in closed form (unweighted least squares, as
+#  the pol1 fit of a TGraph without errors).
+#
+#  - iterVcThrVcalHistos(files): generator yielding (ROC name, TH2) of the VcThr/Vcal canvases
+#    found in the files. Each canvas is deleted when the next one is read
+#
+#  - loadVcThrVcalRows(histos): copy the Vcal rows (VcalMin to VcalMax) used in the fit for all
+#    the ROCs, grouped by binning. Returns a list of VcThrVcalGroup
+#
+#  - fitVcThrVcalGroup(group): fit all the ROCs of a group, returns the arrays a, b, chi2/NDF
+#    and lowest threshold
+#
+#  - fitVcalVcThrBatch(histos, savePlots): returns the list of (ROC name, a, b, chi2/NDF,
+#    lowest threshold) in the order of the ROCs, as fitRocsVcalVcThr does. With savePlots True,
+#    the Vcal and VcThr points of each ROC follow, for the plots (see fitPlots.py)
+#
+# ***************************************************************************************************************
+
+
+import numpy
+from browseCalibFiles import *
+from histoArrays import *
+
+
+### Fit range for next WBC, as in fitRocsVcalVcThr
+VcalMin = 68
+VcalMax = 90
+
+
+def iterVcThrVcalHistos(files):
+    for file, path, d in walkROCDirs(files):
+        for roc in d.GetListOfKeys(): # ROCs, e.g.:  BmI_SEC4_LYR1_LDR5F_MOD1_ROC0
+            cName = roc.GetName()
+            c = roc.ReadObj()
+            count('histos read')
+            yield cName, c.GetPrimitive(cName)
+            releaseObject(c)
+
+
+class VcThrVcalGroup:
+    # ROCs sharing the same binning: rows[i, j, :] are the VcThr bins 1..nX of ROC i at Vcals[j]
+    def __init__(self, xBinning, yBinning):
+        self.xBinning = xBinning
+        self.yBinning = yBinning
+        step = (yBinning[2]-yBinning[1])/yBinning[0]
+        self.Vcals = numpy.array(range(VcalMin, VcalMax, int(step)), dtype=numpy.float64)
+        self.yBins = numpy.array([findBin(yBinning, v) for v in self.Vcals])
+        self.names = []
+        self.positions = []
+        self.rows = []
+
+    def add(self, position, name, histo):
+        self.positions.append(position)
+        self.names.append(name)
+        # fancy indexing copies the rows, the histo can be deleted afterwards
+        self.rows.append(histoBuffer(histo)[self.yBins, 1:-1])
+
+
+def loadVcThrVcalRows(histos):
+    groups = {}
+    for position, (name, h) in enumerate(histos):
+        binning = (axisBinning(h.GetXaxis()), axisBinning(h.GetYaxis()))
+        if binning not in groups: groups[binning] = VcThrVcalGroup(*binning)
+        groups[binning].add(position, name, h)
+    for group in groups.values():
+        group.rows = numpy.array(group.rows)
+    return groups.values()
+
+
+def firstBinAbove(rows, threshold):
+    # TH1::FindFirstBinAbove along the last axis, -1 if no bin is above threshold
+    above = rows > threshold
+    bins = numpy.argmax(above, axis=-1) + 1
+    bins[~above.any(axis=-1)] = -1
+    return bins
+
+
+def lastBinAbove(rows, threshold):
+    # TH1::FindLastBinAbove along the last axis, -1 if no bin is above threshold
+    above = rows > threshold
+    bins = rows.shape[-1] - numpy.argmax(above[..., ::-1], axis=-1)
+    bins[~above.any(axis=-1)] = -1
+    return bins
+
+
+def fitPol1(x, y):
+    # least squares fit y = a + b*x of each row of y, with unit errors
+    n = len(x)
+    sx, sxx = x.sum(), (x*x).sum()
+    sy, sxy = y.sum(axis=-1), (y*x).sum(axis=-1)
+    det = n*sxx - sx*sx
+    a = (sxx*sy - sx*sxy)/det
+    b = (n*sxy - sx*sy)/det
+    residuals = y - a[:, numpy.newaxis] - b[:, numpy.newaxis]*x
+    chi2 = (residuals*residuals).sum(axis=-1)
+    return a, b, chi2/(n-2)
+
+
+def fitVcThrVcalGroup(group):
+    # VcThr values go through float as in the TGraph of fitRocsVcalVcThr
+    VcThrs = binCenters(group.xBinning, firstBinAbove(group.rows, 0.4)).astype(numpy.float32)
+    lowest = binCenters(group.xBinning, lastBinAbove(group.rows, 0.9)).min(axis=-1)
+    a, b, chi2NDF = fitPol1(group.Vcals, VcThrs.astype(numpy.float64))
+    return VcThrs, a, b, chi2NDF, lowest
+
+
+def fitVcalVcThrBatch(histos, savePlots):
+    groups = loadVcThrVcalRows(histos)
+    fits = []
+    for group in groups:
+        VcThrs, a, b, chi2NDF, lowest = fitVcThrVcalGroup(group)
+        count('ROCs evaluated', len(group.names))
+        for i, name in enumerate(group.names):
+            fit = (name, a[i], b[i], chi2NDF[i], lowest[i])
+            if(savePlots == 'True'): fit = fit + (group.Vcals.tolist(), VcThrs[i].tolist())
+            fits.append((group.positions[i], fit))
+    fits.sort()
+    return [fit for position, fit in fits]